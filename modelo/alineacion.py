@@ -0,0 +1,141 @@
+"""
+Normalización y alineamiento de landmarks usados por evaluate_posture.
+
+Incluye las funciones por par de frames (referencia histórica) y un kernel
+vectorizado que calcula de una vez la matriz de distancias entre todos los
+frames de dos secuencias, usada por el DTW.
+
+Nota: en umeyama_similarity, `np.trace(D @ S)` recibe un vector (D es 1-D), así
+que lanza ValueError y align_and_compute_distances siempre usa el respaldo de
+normalización por pelvis. Los umbrales de evaluate_posture están calibrados con
+ese comportamiento, por lo que el kernel vectorizado reproduce el respaldo.
+"""
+
+import numpy as np
+
+# Índices comunes en MediaPipe Pose
+LEFT_SHOULDER_IDX = 11
+RIGHT_SHOULDER_IDX = 12
+LEFT_HIP_IDX = 23
+RIGHT_HIP_IDX = 24
+NUM_LANDMARKS = 33
+
+
+def to_xy_array(pts_list):
+    arr = np.array(pts_list)
+    if arr.ndim == 2 and arr.shape[1] >= 2:
+        return arr[:, :2]
+    # si está plano [x,y,z,...], convertir
+    if arr.ndim == 1:
+        arr = arr.reshape((-1, 3))
+        return arr[:, :2]
+    return arr
+
+
+def normalize_by_pelvis(pts_list):
+    try:
+        arr = np.array(pts_list)
+        if arr.shape[0] > max(LEFT_HIP_IDX, RIGHT_HIP_IDX, LEFT_SHOULDER_IDX, RIGHT_SHOULDER_IDX):
+            hip_center = (arr[LEFT_HIP_IDX] + arr[RIGHT_HIP_IDX]) / 2.0
+            shoulder_center = (arr[LEFT_SHOULDER_IDX] + arr[RIGHT_SHOULDER_IDX]) / 2.0
+        else:
+            hip_center = np.mean(arr, axis=0)
+            shoulder_center = hip_center
+        translated = arr - hip_center
+        torso_len = np.linalg.norm(shoulder_center - hip_center)
+        if torso_len <= 1e-6:
+            torso_len = 1.0
+        normalized = translated / torso_len
+        return normalized
+    except Exception:
+        return np.array(pts_list)
+
+
+def umeyama_similarity(src, dst, eps=1e-8):
+    """Estimate similarity transform (s,R,t) that maps src -> dst using Umeyama method (2D).
+    Devuelve (s, R, t) donde R es 2x2, t es 2-vector."""
+    src = np.array(src, dtype=float)
+    dst = np.array(dst, dtype=float)
+    if src.shape != dst.shape or src.ndim != 2 or src.shape[1] != 2:
+        raise ValueError('src/dst must be Nx2 arrays')
+
+    n = src.shape[0]
+    mu_src = src.mean(axis=0)
+    mu_dst = dst.mean(axis=0)
+    src_c = src - mu_src
+    dst_c = dst - mu_dst
+
+    var_src = (src_c**2).sum() / n
+    cov = (dst_c.T @ src_c) / n
+
+    U, D, Vt = np.linalg.svd(cov)
+    S = np.eye(2)
+    if np.linalg.det(U) * np.linalg.det(Vt) < 0:
+        S[-1, -1] = -1
+    R = U @ S @ Vt
+    scale = 1.0
+    if var_src > eps:
+        scale = np.trace(D @ S) / var_src if D.ndim == 1 else np.trace(np.diag(D) @ S) / var_src
+    t = mu_dst - scale * (R @ mu_src)
+    return scale, R, t
+
+
+def align_and_compute_distances(user_pts, ref_pts):
+    # user_pts and ref_pts are lists/arrays of (x,y,...) - usar solo XY
+    u_xy = to_xy_array(user_pts)
+    r_xy = to_xy_array(ref_pts)
+    if u_xy.shape[0] != r_xy.shape[0]:
+        # si longitud diferente, truncar al mínimo
+        m = min(u_xy.shape[0], r_xy.shape[0])
+        u_xy = u_xy[:m]
+        r_xy = r_xy[:m]
+    try:
+        s, R, t = umeyama_similarity(u_xy, r_xy)
+        u_aligned = (s * (R @ u_xy.T)).T + t
+    except Exception:
+        # fallback: centrar y escalar por torso
+        u_norm = normalize_by_pelvis(user_pts)
+        r_norm = normalize_by_pelvis(ref_pts)
+        u_aligned = to_xy_array(u_norm)
+        r_xy = to_xy_array(r_norm)
+
+    # distancias euclidianas entre u_aligned y r_xy
+    diffs = u_aligned - r_xy
+    dists = np.linalg.norm(diffs, axis=1)
+    return dists
+
+
+def frames_to_array(frames):
+    """Convierte una secuencia de frames (listas planas [x,y,z,...] o arrays) a un array (N, 33, 3)."""
+    arr = np.asarray(frames, dtype=float)
+    return arr.reshape((arr.shape[0], -1, 3))
+
+
+def normalize_frames_by_pelvis(frames):
+    """Versión vectorizada de normalize_by_pelvis para un array (N, 33, 3)."""
+    hip_center = (frames[:, LEFT_HIP_IDX] + frames[:, RIGHT_HIP_IDX]) / 2.0
+    shoulder_center = (frames[:, LEFT_SHOULDER_IDX] + frames[:, RIGHT_SHOULDER_IDX]) / 2.0
+    torso_len = np.linalg.norm(shoulder_center - hip_center, axis=1)
+    torso_len[~(torso_len > 1e-6)] = 1.0
+    return (frames - hip_center[:, None, :]) / torso_len[:, None, None]
+
+
+def normalized_xy(frames):
+    """Frames normalizados por pelvis, solo XY: array (N, 33, 2) listo para comparar."""
+    return normalize_frames_by_pelvis(frames_to_array(frames))[:, :, :2]
+
+
+def frame_distance_matrix(seq_a, seq_b):
+    """Matriz (len(seq_a), len(seq_b)) con la distancia media entre puntos de cada par de frames.
+
+    Equivale a llamar align_and_compute_distances(a, b) para cada par y promediar,
+    pero normaliza cada frame una sola vez y calcula todos los pares con broadcasting.
+    Los pares con valores no finitos devuelven inf (igual que el manejo de errores del DTW).
+    """
+    a = normalized_xy(seq_a)
+    b = normalized_xy(seq_b)
+    m = min(a.shape[1], b.shape[1])
+    diffs = a[:, None, :m, :] - b[None, :, :m, :]
+    fd = np.sqrt((diffs ** 2).sum(axis=3)).mean(axis=2)
+    fd[~np.isfinite(fd)] = np.inf
+    return fd
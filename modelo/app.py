@@ -1,4 +1,6 @@
 # app.py
+import time
+BOOT_T0 = time.perf_counter()
 print("[BOOT] Iniciando importaciones...")
 import sys
 import os
@@ -6,255 +8,226 @@ import os
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
 os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
 
-from flask import Flask, render_template, jsonify, send_file, request
+from flask import Flask, render_template, jsonify, send_file, request, Response, g
 print("[BOOT] ✓ Flask importado")
 from flask_socketio import SocketIO
 print("[BOOT] ✓ Flask-SocketIO importado")
-import cv2
-print("[BOOT] ✓ OpenCV importado")
-import mediapipe as mp
-print("[BOOT] ✓ MediaPipe importado")
 import numpy as np
 import joblib
 import base64
-import json
-import requests
+import hmac
 from threading import Lock
 from pathlib import Path
-print("[BOOT] ✓ Todas las importaciones completadas")
+from referencias import get_reference_sequence, preextract_references, ReferenceTimeline, VIDEO_EXTENSIONS
+from sesiones import SessionStore, DEFAULT_SESSION_ID
+from landmarks import frame_array, sequence_array, from_pose_landmarks, is_sequence, to_json_list, unpack_landmarks, NUM_LANDMARKS
+from alineacion import align_and_compute_distances, normalize_by_pelvis, frame_distance_matrix
+from dtw import dtw_distance, DTW_BAND, DTW_WINDOW_FACTOR, DTW_MODE
+from inferencia_bosque import compile_forest, FOREST_ENGINE
+from pipeline_video import Pipeline
+from fuentes_video import open_frame_source, FRAME_SOURCE
+from feed_adaptativo import FeedClients, FEED_MODE, pack_landmarks
+from pool_pose import PosePool, SessionTrackers, POSE_TRACKING
+from procesamiento_lotes import FrameBatchProcessor
+from evaluador_groq import GroqAssessor
+from veredicto_local import load_verdict_model, VERDICT_ENGINE
+from entrada_imagen import read_image_request, options_from_fields, ImageRequestError
+import metricas
+from metricas import stage
+from perfilador import SamplingProfiler
+from grabador_solicitudes import FlightRecorder, RECORDED_ENDPOINTS, session_snapshot
+print("[BOOT] ✓ Importaciones livianas completadas")
 
 app = Flask(__name__)
 # Forzar modo threading para evitar dependencias async (aiohttp/asyncio) en Python 3.9
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
 
-# Cargar modelo y encoder con manejo de errores
-try:
-    print("[BOOT] Cargando modelo_posturas.pkl...")
-    modelo = joblib.load('modelo_posturas.pkl')
-    print("[BOOT] Cargando encoder.pkl...")
-    encoder = joblib.load('encoder.pkl')
-    print("[BOOT] ✓ Modelo y encoder cargados correctamente")
-except FileNotFoundError as e:
-    print(f"[BOOT][ERROR] No se encontró el archivo: {e.filename}")
-    print("Asegúrate de que modelo_posturas.pkl y encoder.pkl están en la carpeta 'modelo'")
-    exit(1)
-except Exception as e:
-    print(f"[BOOT][ERROR] Error al cargar modelo: {e}")
-    import traceback
-    traceback.print_exc()
-    exit(1)
-
-
-mp_pose = mp.solutions.pose
-pose = mp_pose.Pose(
-    min_detection_confidence=0.4,  # Reducido para detectar más movimientos
-    min_tracking_confidence=0.4     # Reducido para mejor seguimiento
-)
+# Runtime pesado (OpenCV, MediaPipe/TFLite, modelo): se carga en ensure_runtime().
+# Con LAZY_STARTUP=1 (o --lazy-startup) el servidor acepta conexiones de inmediato y
+# carga + calienta el runtime en segundo plano; /api/ready indica cuándo está listo.
+LAZY_STARTUP = os.environ.get('LAZY_STARTUP', '0') == '1'
+# Token de los endpoints /api/admin/* (perfilado y solicitudes lentas); sin token quedan deshabilitados
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+cv2 = None
+mp = None
+mp_pose = None
+pose_pool = None  # Instancias de MediaPipe Pose prestadas por petición (ver pool_pose.py)
+modelo = None
+encoder = None
+clasificador = None
+runtime_lock = Lock()
+startup_state = {'ready': False, 'lazy': LAZY_STARTUP, 'error': None, 'timings_ms': {}, 'ready_after_s': None}
+startup_state['timings_ms']['imports_livianos'] = (time.perf_counter() - BOOT_T0) * 1000
+
+
+def _timed(name, fn):
+    t0 = time.perf_counter()
+    result = fn()
+    startup_state['timings_ms'][name] = (time.perf_counter() - t0) * 1000
+    return result
+
+
+def ensure_runtime():
+    """Importa OpenCV y MediaPipe, carga modelo/encoder y crea el pool de pose (una sola vez).
+    Lanza RuntimeError si el modelo no se puede cargar."""
+    global cv2, mp, mp_pose, pose_pool, modelo, encoder, clasificador
+    if pose_pool is not None:
+        return
+    with runtime_lock:
+        if pose_pool is not None:
+            return
+        if startup_state['error']:
+            raise RuntimeError(startup_state['error'])
+        cv2 = _timed('import_cv2', lambda: __import__('cv2'))
+        print("[BOOT] ✓ OpenCV importado")
+        mp = _timed('import_mediapipe', lambda: __import__('mediapipe'))
+        print("[BOOT] ✓ MediaPipe importado")
+
+        # Cargar modelo y encoder con manejo de errores
+        try:
+            print("[BOOT] Cargando modelo_posturas.pkl...")
+            modelo = _timed('carga_modelo', lambda: joblib.load('modelo_posturas.pkl'))
+            print("[BOOT] Cargando encoder.pkl...")
+            encoder = joblib.load('encoder.pkl')
+            print("[BOOT] ✓ Modelo y encoder cargados correctamente")
+            # Inferencia por frame con el bosque compilado a arrays (mismo resultado que modelo.predict)
+            clasificador = _timed('compilar_modelo',
+                                  lambda: compile_forest(modelo) if FOREST_ENGINE == 'compilado' else modelo)
+            print(f"[BOOT] ✓ Clasificador: {type(clasificador).__name__}")
+        except FileNotFoundError as e:
+            startup_state['error'] = f"No se encontró el archivo: {e.filename}"
+            print(f"[BOOT][ERROR] {startup_state['error']}")
+            print("Asegúrate de que modelo_posturas.pkl y encoder.pkl están en la carpeta 'modelo'")
+            raise RuntimeError(startup_state['error'])
+        except Exception as e:
+            startup_state['error'] = f"Error al cargar modelo: {e}"
+            print(f"[BOOT][ERROR] {startup_state['error']}")
+            import traceback
+            traceback.print_exc()
+            raise RuntimeError(startup_state['error'])
+
+        mp_pose = mp.solutions.pose
+        pool = PosePool(new_pose)
+        # El primer grafo se crea ya; el resto del pool a demanda (o en warm_up)
+        _timed('grafo_pose', lambda: pool.release(pool.acquire()))
+        print(f"[BOOT] ✓ Pool de pose: {pool.size} instancia(s)")
+        pose_pool = pool
+
+
+def new_pose():
+    """Instancia de MediaPipe Pose con la configuración del servidor."""
+    return mp_pose.Pose(
+        min_detection_confidence=0.4,  # Reducido para detectar más movimientos
+        min_tracking_confidence=0.4     # Reducido para mejor seguimiento
+    )
+
+
+def warm_up():
+    """Carga el runtime y ejecuta el grafo de pose, el clasificador y el códec JPEG con frames
+    sintéticos, para que la primera petición de un paciente no pague la inicialización."""
+    ensure_runtime()
+    rng = np.random.default_rng(0)
+    frames = [np.zeros((480, 640, 3), dtype=np.uint8),
+              rng.integers(0, 256, (480, 640, 3), dtype=np.uint8)]
+
+    def warm_pose(instance):
+        # frames sin persona: inicializan el grafo sin dejar estado de seguimiento
+        for frame in frames:
+            instance.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+    def run_pose():
+        pose_pool.fill(warm_pose)
+
+    def run_codec():
+        for frame in frames:
+            ok, jpg = cv2.imencode('.jpg', frame)
+            cv2.imdecode(jpg, cv2.IMREAD_COLOR)
+
+    def run_classifier():
+        row = np.zeros((1, 99), dtype=np.float32)
+        for _ in range(3):
+            encoder.classes_[clasificador.predict(row)[0]]
+
+    _timed('warmup_pose', run_pose)
+    _timed('warmup_jpeg', run_codec)
+    _timed('warmup_clasificador', run_classifier)
+    # Los procesos de /api/process_video_frames cargan MediaPipe en segundo plano
+    batch_processor.start()
+    startup_state['ready_after_s'] = time.perf_counter() - BOOT_T0
+    startup_state['ready'] = True
+    print(f"[BOOT] ✓ Runtime listo en {startup_state['ready_after_s']:.2f} s desde el arranque")
+
+
+def prepare_runtime_background():
+    """Tarea en segundo plano del modo LAZY_STARTUP."""
+    try:
+        warm_up()
+    except Exception as e:
+        print(f"[BOOT][ERROR] No se pudo preparar el runtime: {e}")
 
 
 thread_lock = Lock()
 thread = None
-current_reference_landmarks = None  # Landmarks de la imagen de referencia (single)
-current_reference_sequence = []    # Lista de landmarks por frame del video de referencia
-reference_fps = 1                  # FPS de la secuencia de referencia (frames por segundo)
-current_reference_index = 0        # Índice de frame de referencia sincronizado desde cliente
-user_landmarks_buffer = []         # Buffer corto de landmarks del usuario para suavizar ruido
-current_tolerance = 1.0            # Factor de tolerancia: >1 más permisivo, <1 más estricto
-recent_user_landmarks_buffer = []  # Buffer corto usado por el endpoint HTTP evaluate_frame
-
-# Integración opcional con Groq para decisión final basada en métricas
-GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
-
-def groq_assess_movement(metrics: dict, default_feedback: str, default_reason: str):
-    """Consulta Groq si hay API key para obtener 'Bien/Mal' con explicación breve.
-    Retorna (feedback, reason). Si falla, retorna los valores por defecto.
-    """
-    if not GROQ_API_KEY:
-        return default_feedback, default_reason
-    try:
-        url = "https://api.groq.com/openai/v1/chat/completions"
-        headers = {"Authorization": f"Bearer {GROQ_API_KEY}", "Content-Type": "application/json"}
-        system_prompt = (
-            "Eres un verificador de movimiento para ejercicios de fisioterapia. "
-            "Decide 'Bien' o 'Mal' usando métricas numéricas. "
-            "Responde SOLO en JSON: {\"is_good\": bool, \"reason\": string}."
-        )
-        body = {
-            "model": "llama-3.1-8b-instant",
-            "temperature": 0.2,
-            "response_format": {"type": "json_object"},
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": json.dumps({"metrics": metrics}, ensure_ascii=False)}
-            ]
-        }
-        resp = requests.post(url, headers=headers, json=body, timeout=8)
-        if resp.status_code != 200:
-            return default_feedback, default_reason
-        data = resp.json()
-        content = data.get("choices", [{}])[0].get("message", {}).get("content", "{}")
-        parsed = json.loads(content)
-        is_good = bool(parsed.get("is_good", False))
-        reason = str(parsed.get("reason", default_reason))
-        return ("Bien" if is_good else "Mal"), reason
-    except Exception:
-        return default_feedback, default_reason
+# Estado por paciente (referencia, índice sincronizado, tolerancia y buffers)
+# Con POSE_TRACKING=sesion, instancia de pose por sesión para evaluate_frame (ver pool_pose.py);
+# se cierra al expirar la sesión o tras POSE_TRACKER_IDLE_SECONDS sin frames
+pose_trackers = SessionTrackers(lambda: new_pose())
+sessions = SessionStore(on_evict=lambda state: pose_trackers.drop(state.session_id),
+                        on_sweep=pose_trackers.sweep_idle)
+stream_session_id = None  # Sesión Socket.IO que controla la referencia del stream de cámara
+video_pipeline = None     # Pipeline del stream de cámara (estadísticas en /api/pipeline_stats)
+frame_source = None       # Fuente de frames del stream (FRAME_SOURCE)
+stream_feeds = FeedClients()  # Calidad/escala del JPEG del feed de cada cliente según sus confirmaciones
+# Lotes de /api/process_video_frames: procesos de trabajo con su propio Pose, o el pool local
+batch_processor = FrameBatchProcessor(lambda: pose_pool.checkout())
+# Landmarks de la referencia por tiempo para evaluate_frame sin secuencia cargada (índice por video)
+reference_timeline = ReferenceTimeline(lambda: pose_pool.checkout())
+# Diagnóstico: solicitudes lentas guardadas para reproducirlas y perfilado bajo demanda
+flight_recorder = FlightRecorder()
+active_profile = None  # SamplingProfiler de la última sesión de perfilado (/api/admin/profile)
+# Capacidad de las colas entre etapas del stream (1 = solo el frame más reciente) y
+# cada cuántos segundos se imprime el throughput por etapa
+PIPELINE_QUEUE_SIZE = int(os.environ.get('PIPELINE_QUEUE_SIZE', 1))
+PIPELINE_STATS_INTERVAL = float(os.environ.get('PIPELINE_STATS_INTERVAL', 10))
+
+
+def http_session():
+    """Sesión de la petición HTTP actual (cabecera X-Session-Id o parámetro session_id)."""
+    session_id = request.headers.get('X-Session-Id') or request.args.get('session_id')
+    return sessions.get(session_id or DEFAULT_SESSION_ID)
+
+# Integración opcional con Groq para decisión final basada en métricas (en segundo plano,
+# con caché y circuit breaker; ver evaluador_groq.py)
+groq_assessor = GroqAssessor()
+# Veredicto local destilado de Groq (VERDICT_ENGINE=local; None si no hay veredicto_local.json)
+verdict_model = load_verdict_model()
 
 # Nota: Ahora se asume que el modelo devuelve directamente la etiqueta
 # correspondiente a la condición médica (p. ej. 'lumbalgia mecanica inespecifica',
 # 'hernia de disco lumbar', 'espondilolisis', 'escoliosis lumbar', etc.).
 
 
-def evaluate_posture(landmarks, posture_label, reference_landmarks=None, tolerance_scale=1.0):
+def evaluate_posture(landmarks, posture_label, reference_landmarks=None, tolerance_scale=1.0,
+                     user_buffer=None, reference_index=0, matcher=None):
     """Evaluación mejorada que devuelve 'Bien' o 'Mal' y una breve sugerencia.
     
     Utiliza umbrales CALIBRADOS basados en análisis de videos reales.
     Si se proporciona reference_landmarks, se compara con precisión basada en distancias de landmarks.
     Si no, usa heurísticas especializadas por enfermedad.
+    landmarks es un frame (33, 3) (o lista plana [x,y,z,...]) y reference_landmarks un
+    frame o una secuencia (N, 33, 3) (ver landmarks.py).
+    user_buffer (landmarks recientes de la sesión) y reference_index (índice sincronizado)
+    permiten la comparación temporal contra una secuencia de referencia. Si se pasa
+    matcher (StreamingSubsequenceDTW), la comparación temporal se hace de forma
+    incremental con el frame actual y no depende del índice sincronizado.
     """
-    if not landmarks or not posture_label:
+    if landmarks is None or len(landmarks) == 0 or not posture_label:
         return 'Sin evaluación', 'No hay datos suficientes', {'avg_distance': None, 'max_distance': None}
 
-    # Exponer el buffer global localmente para permitir comparaciones temporales
-    global recent_user_landmarks_buffer, current_reference_index
-
-    # Convertir la lista plana a pares (x,y,z) por punto
-    pts = [(landmarks[i], landmarks[i+1], landmarks[i+2]) for i in range(0, len(landmarks), 3)]
+    recent_user_landmarks_buffer = user_buffer or []
 
-    # Helpers: normalizar y alineamiento por similitud (Umeyama) para robustez
-    def to_xy_array(pts_list):
-        arr = np.array(pts_list)
-        if arr.ndim == 2 and arr.shape[1] >= 2:
-            return arr[:, :2]
-        # si está plano [x,y,z,...], convertir
-        if arr.ndim == 1:
-            arr = arr.reshape((-1, 3))
-            return arr[:, :2]
-        return arr
-
-    def normalize_by_pelvis(pts_list):
-        try:
-            arr = np.array(pts_list)
-            LEFT_HIP_IDX = 23
-            RIGHT_HIP_IDX = 24
-            LEFT_SHOULDER_IDX = 11
-            RIGHT_SHOULDER_IDX = 12
-            if arr.shape[0] > max(LEFT_HIP_IDX, RIGHT_HIP_IDX, LEFT_SHOULDER_IDX, RIGHT_SHOULDER_IDX):
-                hip_center = (arr[LEFT_HIP_IDX] + arr[RIGHT_HIP_IDX]) / 2.0
-                shoulder_center = (arr[LEFT_SHOULDER_IDX] + arr[RIGHT_SHOULDER_IDX]) / 2.0
-            else:
-                hip_center = np.mean(arr, axis=0)
-                shoulder_center = hip_center
-            translated = arr - hip_center
-            torso_len = np.linalg.norm(shoulder_center - hip_center)
-            if torso_len <= 1e-6:
-                torso_len = 1.0
-            normalized = translated / torso_len
-            return normalized
-        except Exception:
-            return np.array(pts_list)
-
-    def umeyama_similarity(src, dst, eps=1e-8):
-        """Estimate similarity transform (s,R,t) that maps src -> dst using Umeyama method (2D).
-        Devuelve (s, R, t) donde R es 2x2, t es 2-vector."""
-        src = np.array(src, dtype=float)
-        dst = np.array(dst, dtype=float)
-        if src.shape != dst.shape or src.ndim != 2 or src.shape[1] != 2:
-            raise ValueError('src/dst must be Nx2 arrays')
-
-        n = src.shape[0]
-        mu_src = src.mean(axis=0)
-        mu_dst = dst.mean(axis=0)
-        src_c = src - mu_src
-        dst_c = dst - mu_dst
-
-        var_src = (src_c**2).sum() / n
-        cov = (dst_c.T @ src_c) / n
-
-        U, D, Vt = np.linalg.svd(cov)
-        S = np.eye(2)
-        if np.linalg.det(U) * np.linalg.det(Vt) < 0:
-            S[-1, -1] = -1
-        R = U @ S @ Vt
-        scale = 1.0
-        if var_src > eps:
-            scale = np.trace(D @ S) / var_src if D.ndim == 1 else np.trace(np.diag(D) @ S) / var_src
-        t = mu_dst - scale * (R @ mu_src)
-        return scale, R, t
-
-    def align_and_compute_distances(user_pts, ref_pts):
-        # user_pts and ref_pts are lists/arrays of (x,y,...) - usar solo XY
-        u_xy = to_xy_array(user_pts)
-        r_xy = to_xy_array(ref_pts)
-        if u_xy.shape[0] != r_xy.shape[0]:
-            # si longitud diferente, truncar al mínimo
-            m = min(u_xy.shape[0], r_xy.shape[0])
-            u_xy = u_xy[:m]
-            r_xy = r_xy[:m]
-        try:
-            s, R, t = umeyama_similarity(u_xy, r_xy)
-            u_aligned = (s * (R @ u_xy.T)).T + t
-        except Exception:
-            # fallback: centrar y escalar por torso
-            u_norm = normalize_by_pelvis(user_pts)
-            r_norm = normalize_by_pelvis(ref_pts)
-            u_aligned = to_xy_array(u_norm)
-            r_xy = to_xy_array(r_norm)
-
-        # distancias euclidianas entre u_aligned y r_xy
-        diffs = u_aligned - r_xy
-        dists = np.linalg.norm(diffs, axis=1)
-        return dists
-
-    # DTW helper: compara dos secuencias de frames usando la distancia por frame
-    def dtw_distance(seq_a, seq_b, frame_distance_fn):
-        """Computa la distancia DTW entre dos secuencias donde frame_distance_fn(a,b) devuelve un escalar.
-        Devuelve (avg_distance, max_distance, path_len, total_cost).
-        """
-        a = list(seq_a)
-        b = list(seq_b)
-        na = len(a)
-        nb = len(b)
-        if na == 0 or nb == 0:
-            return None, None, 0, float('inf')
-
-        # construir matriz DTW
-        dtw = np.full((na+1, nb+1), np.inf)
-        dtw[0,0] = 0.0
-
-        # precomputar distancias entre frames
-        fd = np.zeros((na, nb), dtype=float)
-        for i in range(na):
-            for j in range(nb):
-                try:
-                    fd[i,j] = float(frame_distance_fn(a[i], b[j]))
-                except Exception:
-                    fd[i,j] = float('inf')
-
-        for i in range(1, na+1):
-            for j in range(1, nb+1):
-                cost = fd[i-1, j-1]
-                dtw[i,j] = cost + min(dtw[i-1,j], dtw[i,j-1], dtw[i-1,j-1])
-
-        # reconstruir la ruta (camino) para obtener longitudes/costes por paso
-        i = na
-        j = nb
-        path = []
-        while i > 0 and j > 0:
-            path.append((i-1,j-1))
-            choices = [(dtw[i-1,j-1], i-1, j-1), (dtw[i-1,j], i-1, j), (dtw[i,j-1], i, j-1)]
-            best = min(choices, key=lambda x: x[0])
-            i,j = best[1], best[2]
-        path.reverse()
-
-        if not path:
-            return None, None, 0, float('inf')
-
-        costs = [fd[p] for p in path]
-        avg = float(np.mean(costs))
-        mx = float(np.max(costs))
-        total_cost = float(dtw[na, nb])
-        return avg, mx, len(path), total_cost
+    # Puntos (x,y,z) del frame como array (33, 3); los cálculos se hacen en float64
+    pts = frame_array(landmarks, dtype=np.float64)
 
     # Índices comunes en MediaPipe Pose
     LEFT_SHOULDER = 11
@@ -290,41 +263,42 @@ def evaluate_posture(landmarks, posture_label, reference_landmarks=None, toleran
         avg_distance = None
         max_distance = None
         # Diferenciar entre referencia como UN frame (lista plana) o como SECUENCIA de frames
-        if reference_landmarks:
-            # Secuencia de frames (lista-de-listas)
-            if isinstance(reference_landmarks, list) and len(reference_landmarks) > 0 and isinstance(reference_landmarks[0], list):
-                ref_seq = reference_landmarks
-                # Obtener ventana de referencia centrada en current_reference_index si es posible
-                try:
-                    global current_reference_index
-                    idx = int(current_reference_index) if isinstance(current_reference_index, int) else 0
-                except Exception:
-                    idx = 0
+        if reference_landmarks is not None and len(reference_landmarks) > 0:
+            # Secuencia de frames (N, 33, 3)
+            if is_sequence(reference_landmarks):
+                if matcher is not None:
+                    with stage('dtw'):
+                        avg_distance, max_distance, path_len, total_cost = matcher.update(landmarks)
+                else:
+                    ref_seq = reference_landmarks
+                    # Obtener ventana de referencia centrada en reference_index si es posible
+                    try:
+                        idx = int(reference_index) if isinstance(reference_index, int) else 0
+                    except Exception:
+                        idx = 0
 
-                # Obtener la secuencia de usuario (preferir buffer suavizado si existe)
-                try:
-                    user_seq = list(recent_user_landmarks_buffer) if recent_user_landmarks_buffer else [landmarks]
-                except Exception:
-                    user_seq = [landmarks]
+                    # Obtener la secuencia de usuario (preferir buffer suavizado si existe)
+                    try:
+                        user_seq = list(recent_user_landmarks_buffer) if recent_user_landmarks_buffer else [landmarks]
+                    except Exception:
+                        user_seq = [landmarks]
 
-                # Ventana en referencia: ancho relativo a usuario (ej. 3x longitud de usuario, mínimo 4)
-                m = max(1, len(user_seq))
-                win = min(len(ref_seq), max(4, 3 * m))
-                start = max(0, idx - win // 2)
-                end = min(len(ref_seq), start + win)
-                ref_window = ref_seq[start:end]
+                    # Ventana en referencia: ancho relativo a usuario (ej. 3x longitud de usuario, mínimo 4)
+                    m = max(1, len(user_seq))
+                    win = min(len(ref_seq), max(4, DTW_WINDOW_FACTOR * m))
+                    start = max(0, idx - win // 2)
+                    end = min(len(ref_seq), start + win)
+                    ref_window = ref_seq[start:end]
 
-                # función que calcula distancia entre dos frames (media de distancias entre puntos tras alinear)
-                def frame_dist(a_frame, b_frame):
+                    # distancias entre todos los pares de frames (media de distancias entre puntos tras alinear)
                     try:
-                        d = align_and_compute_distances(a_frame, b_frame)
-                        if len(d) == 0:
-                            return float('inf')
-                        return float(np.mean(d))
+                        with stage('alignment'):
+                            fd = frame_distance_matrix(user_seq, ref_window)
                     except Exception:
-                        return float('inf')
+                        fd = np.full((len(user_seq), len(ref_window)), np.inf)
 
-                avg_distance, max_distance, path_len, total_cost = dtw_distance(user_seq, ref_window, frame_dist)
+                    with stage('dtw'):
+                        avg_distance, max_distance, path_len, total_cost = dtw_distance(fd, band=DTW_BAND)
 
                 # Umbrales término medio: balance entre sensibilidad y precisión
                 t = float(tolerance_scale)
@@ -346,19 +320,16 @@ def evaluate_posture(landmarks, posture_label, reference_landmarks=None, toleran
                 else:
                     feedback = 'Sin evaluación'
                     reason = 'No se pudo comparar con la referencia (DTW)'
-            # Caso referencia como un único frame (lista plana)
-            elif isinstance(reference_landmarks, list) and len(reference_landmarks) >= 10:
-                ref_pts = [(reference_landmarks[i], reference_landmarks[i+1], reference_landmarks[i+2]) 
-                           for i in range(0, len(reference_landmarks), 3)]
+            # Caso referencia como un único frame (33, 3)
+            elif frame_array(reference_landmarks).shape[0] >= 4:
+                ref_pts = frame_array(reference_landmarks, dtype=np.float64)
 
                 # Intentar suavizar landmarks del usuario si están en buffer (reduce ruido)
                 try:
-                    # usar buffer global si existe (para llamadas HTTP rápidas)
+                    # usar buffer de la sesión si existe (para llamadas HTTP rápidas)
                     if recent_user_landmarks_buffer:
                         # promediar elemento a elemento
-                        arr = np.array(recent_user_landmarks_buffer)
-                        avg_land = list(np.mean(arr, axis=0))
-                        user_pts = [(avg_land[i], avg_land[i+1], avg_land[i+2]) for i in range(0, len(avg_land), 3)]
+                        user_pts = np.mean(sequence_array(recent_user_landmarks_buffer), axis=0, dtype=np.float64)
                     else:
                         user_pts = pts
                 except Exception:
@@ -366,7 +337,8 @@ def evaluate_posture(landmarks, posture_label, reference_landmarks=None, toleran
 
                 # Calcular distancias tras alinear por similitud (Umeyama)
                 try:
-                    dists = align_and_compute_distances(user_pts, ref_pts)
+                    with stage('alignment'):
+                        dists = align_and_compute_distances(user_pts, ref_pts)
                     avg_distance = float(np.mean(dists))
                     max_distance = float(np.max(dists))
                 except Exception:
@@ -459,95 +431,187 @@ def evaluate_posture(landmarks, posture_label, reference_landmarks=None, toleran
     return feedback, reason, {'avg_distance': float(avg_distance) if avg_distance is not None else None,
                               'max_distance': float(max_distance) if max_distance is not None else None}
 
-def classify_posture(frame):
+def predict_posture(landmarks):
+    """Postura predicha para landmarks (33, 3), o None si el clasificador falla."""
+    # El modelo recibe la fila plana [x,y,z,...]
+    try:
+        with stage('predict'):
+            return encoder.classes_[clasificador.predict(np.asarray(landmarks).reshape(1, -1))[0]]
+    except Exception:
+        return None
+
+def classify_posture(frame, draw=True, pose=None, session_id=None):
+    """Pose + clasificación de un frame BGR. Devuelve (frame, postura, landmarks (33, 3)).
+    Con draw=True dibuja el esqueleto sobre el frame. Sin `pose` usa la instancia de seguimiento
+    de `session_id` (POSE_TRACKING=sesion) o una del pool. La sesión por defecto la comparten
+    los clientes sin X-Session-Id, así que usa el pool."""
+    ensure_runtime()
     image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    results = pose.process(image)
+    if (pose is None and session_id not in (None, DEFAULT_SESSION_ID)
+            and POSE_TRACKING == 'sesion'):
+        with pose_trackers.checkout(session_id, pose_pool.checkout) as tracker, stage('pose'):
+            results = tracker.process(image)
+    elif pose is None:
+        with pose_pool.checkout() as pooled_pose, stage('pose'):
+            results = pooled_pose.process(image)
+    else:
+        with stage('pose'):
+            results = pose.process(image)
 
     if results.pose_landmarks:
-        # Extraer landmarks en forma plana [x,y,z,...] - siempre usar todos
+        # Extraer landmarks (33, 3) - siempre usar todos
         # (filtrado de visibilidad era demasiado agresivo y rechazaba frames válidos)
-        landmarks = [coord for landmark in results.pose_landmarks.landmark
-                     for coord in [landmark.x, landmark.y, landmark.z]]
+        landmarks = from_pose_landmarks(results.pose_landmarks)
 
-        # Predecir postura
-        try:
-            posture = encoder.inverse_transform(modelo.predict([landmarks]))[0]
-        except Exception:
-            posture = None
+        posture = predict_posture(landmarks)
 
         # Dibujar landmarks en el frame
-        mp.solutions.drawing_utils.draw_landmarks(
-            frame, results.pose_landmarks, mp_pose.POSE_CONNECTIONS)
+        if draw:
+            mp.solutions.drawing_utils.draw_landmarks(
+                frame, results.pose_landmarks, mp_pose.POSE_CONNECTIONS)
 
         return frame, posture, landmarks
 
     return frame, None, None
 
-def video_stream():
-    global current_reference_landmarks
-    global current_reference_sequence, current_reference_index, user_landmarks_buffer
-    cap = cv2.VideoCapture(0)
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-            
-        frame, posture, landmarks = classify_posture(frame)
-
-        # Tratar la etiqueta del modelo como la condición médica
-        condition = posture if posture else 'No detectada'
-
-        # Suavizar landmarks del usuario (promedio último par de frames) para reducir ruido
-        if landmarks:
-            user_landmarks_buffer.append(landmarks)
-            # mantener buffer corto
-            if len(user_landmarks_buffer) > 3:
-                user_landmarks_buffer.pop(0)
-            # promediar elemento a elemento
-            avg_landmarks = None
-            try:
-                arr = np.array(user_landmarks_buffer)
-                avg_landmarks = list(np.mean(arr, axis=0))
-            except Exception:
-                avg_landmarks = landmarks
-        else:
-            avg_landmarks = None
-
-        # Seleccionar landmarks de referencia sincronizados si existe una secuencia
-        ref_landmarks_to_use = None
-        if current_reference_sequence:
-            idx = min(max(0, current_reference_index), len(current_reference_sequence)-1)
-            ref_landmarks_to_use = current_reference_sequence[idx]
-        elif current_reference_landmarks:
-            ref_landmarks_to_use = current_reference_landmarks
-
-        # Evaluar feedback (Bien/Mal + razón) usando landmarks de referencia sincronizados si están disponibles
-        # Si tenemos una secuencia de referencia y un buffer del usuario (streaming), privilegimos comparación temporal (DTW)
-        if current_reference_sequence and len(user_landmarks_buffer) > 1:
-            try:
-                # sincronizar el buffer corto del stream en el buffer global usado por evaluate_posture
-                global recent_user_landmarks_buffer
-                recent_user_landmarks_buffer = list(user_landmarks_buffer)
-            except Exception:
-                pass
-            feedback_label, feedback_reason, metrics = evaluate_posture(avg_landmarks, posture, current_reference_sequence, tolerance_scale=current_tolerance)
-        else:
-            feedback_label, feedback_reason, metrics = evaluate_posture(avg_landmarks, posture, ref_landmarks_to_use, tolerance_scale=current_tolerance)
+def stream_infer(frame, pose=None):
+    """Etapa de inferencia: pose + clasificación. El esqueleto solo se dibuja en el servidor
+    en el modo de feed 'base64'; en los demás lo dibuja el cliente con los landmarks."""
+    frame, posture, landmarks = classify_posture(frame, draw=(FEED_MODE == 'base64'), pose=pose)
+    return frame, posture, landmarks
 
+
+def stream_evaluate(item):
+    """Etapa de evaluación: suavizado con el buffer de la sesión y evaluate_posture."""
+    frame, posture, landmarks = item
+
+    # La cámara local se evalúa contra la referencia de la sesión Socket.IO que la controla
+    # (la sesión por defecto mientras no haya ninguna)
+    state = sessions.get(stream_session_id)
+
+    # Tratar la etiqueta del modelo como la condición médica
+    condition = posture if posture else 'No detectada'
+
+    # Suavizar landmarks del usuario (promedio último par de frames) para reducir ruido
+    user_landmarks_buffer = state.stream_buffer
+    if landmarks is not None:
+        # mantener buffer corto
+        user_landmarks_buffer = state.push_landmarks(state.stream_buffer, landmarks)
+        # promediar elemento a elemento
+        avg_landmarks = None
+        try:
+            avg_landmarks = np.mean(sequence_array(user_landmarks_buffer), axis=0, dtype=np.float64)
+        except Exception:
+            avg_landmarks = landmarks
+    else:
+        avg_landmarks = None
+
+    # Seleccionar landmarks de referencia sincronizados si existe una secuencia
+    ref_landmarks_to_use = None
+    reference_sequence = state.reference_sequence
+    if len(reference_sequence):
+        idx = min(max(0, state.reference_index), len(reference_sequence)-1)
+        ref_landmarks_to_use = reference_sequence[idx]
+    elif state.reference_landmarks is not None:
+        ref_landmarks_to_use = state.reference_landmarks
+
+    # Evaluar feedback (Bien/Mal + razón) usando landmarks de referencia sincronizados si están disponibles
+    # Si tenemos una secuencia de referencia y un buffer del usuario (streaming), privilegimos comparación temporal (DTW)
+    # En modo 'streaming' el DTW incremental de la sesión sigue la referencia frame a frame
+    matcher = state.streaming_matcher() if DTW_MODE == 'streaming' and len(reference_sequence) else None
+    if len(reference_sequence) and (len(user_landmarks_buffer) > 1 or matcher is not None):
+        ref_landmarks_to_use = reference_sequence
+    feedback_label, feedback_reason, metrics = evaluate_posture(
+        avg_landmarks, posture, ref_landmarks_to_use, tolerance_scale=state.tolerance,
+        user_buffer=user_landmarks_buffer, reference_index=state.reference_index, matcher=matcher)
+    if matcher is not None and avg_landmarks is not None:
+        state.reference_index = matcher.position
+        metrics['reference_index'] = matcher.position
+
+    return frame, landmarks, {
+        'posture': posture or "No detectado",
+        'condition': condition,
+        'feedback': feedback_label,
+        'reason': feedback_reason,
+        'metrics': metrics
+    }
+
+
+def stream_emit(item):
+    """Etapa de salida: codificación según FEED_MODE y envío por Socket.IO.
+    'base64': data URI con el esqueleto ya dibujado (formato original).
+    'binario': JPEG como adjunto binario (calidad/escala adaptativa por cliente) + landmarks float32.
+    'landmarks': solo landmarks y feedback, sin imagen."""
+    frame, landmarks, payload = item
+    if FEED_MODE == 'base64':
         _, buffer = cv2.imencode('.jpg', frame)
         frame_base64 = base64.b64encode(buffer).decode('utf-8')
-
+        payload['image'] = f"data:image/jpeg;base64,{frame_base64}"
         with thread_lock:
-            socketio.emit('video_feed', {
-                'image': f"data:image/jpeg;base64,{frame_base64}",
-                'posture': posture or "No detectado",
-                'condition': condition,
-                'feedback': feedback_label,
-                'reason': feedback_reason,
-                'metrics': metrics
-            })
-    
-    cap.release()
+            socketio.emit('video_feed', payload)
+        return payload
+
+    payload['landmarks'] = pack_landmarks(landmarks) if landmarks is not None else None
+    payload['frame_size'] = [frame.shape[1], frame.shape[0]]
+    # Cada cliente recibe el JPEG con su calidad/escala (los que coinciden comparten la codificación)
+    encoded = {}
+    for sid, feed in stream_feeds.items():
+        jpg = feed.encode(frame, encoded) if FEED_MODE == 'binario' else None
+        client_payload = dict(payload, image=jpg, quality=feed.quality, scale=feed.scale)
+        client_payload['seq'] = feed.sent(len(jpg or b'') + len(payload['landmarks'] or b''))
+        with thread_lock:
+            socketio.emit('video_feed', client_payload, to=sid)
+    return payload
+
+
+def video_stream():
+    """Stream de video (cámara local, videos o frames sintéticos según FRAME_SOURCE) como
+    pipeline de etapas en hilos (ver pipeline_video.py): captura -> inferencia -> evaluación -> codificación/envío. Entre etapas solo se
+    conserva el frame más reciente; los atrasados se descartan."""
+    global video_pipeline, frame_source
+    ensure_runtime()
+    # Ver fuentes_video.py
+    frame_source = open_frame_source()
+    # Instancia propia para la cámara: el seguimiento entre frames consecutivos no se
+    # mezcla con peticiones HTTP y no ocupa un lugar del pool mientras dura el stream
+    stream_pose = new_pose()
+
+    def infer(frame):
+        # Para el grabador: inicio, estado de la sesión y frame sin esqueleto dibujado
+        t0 = time.perf_counter()
+        raw = frame.copy() if flight_recorder.enabled and FEED_MODE == 'base64' else frame
+        snapshot = session_snapshot(sessions.get(stream_session_id), 'stream_buffer') if flight_recorder.enabled else None
+        return stream_infer(frame, stream_pose), raw, t0, snapshot
+
+    def evaluate(packed):
+        item, raw, t0, snapshot = packed
+        result = stream_evaluate(item)
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        if snapshot is not None and flight_recorder.is_slow(elapsed_ms):
+            # Se reproduce como /api/evaluate_frame con el JPEG del frame de la cámara
+            ok, jpg = cv2.imencode('.jpg', raw)
+            if ok:
+                payload = result[2]
+                flight_recorder.record(jpg.tobytes(), {
+                    'source': 'stream', 'endpoint': 'evaluate_frame', 'path': '/api/evaluate_frame',
+                    'method': 'POST', 'content_type': 'image/jpeg', 'query_string': '',
+                    'elapsed_ms': elapsed_ms, 'dtw_mode': DTW_MODE, 'verdict_engine': VERDICT_ENGINE,
+                    'response': {'posture': payload['posture'], 'feedback': payload['feedback']}}, snapshot)
+        return result
+
+    video_pipeline = Pipeline('captura', frame_source.read, [
+        ('inferencia', infer),
+        ('evaluacion', evaluate),
+        ('envio', stream_emit),
+    ], queue_size=PIPELINE_QUEUE_SIZE).start()
+
+    # Reportar throughput por etapa periódicamente mientras la cámara siga activa
+    while video_pipeline.is_alive():
+        video_pipeline.join(timeout=PIPELINE_STATS_INTERVAL)
+        print(f"[PIPELINE] {video_pipeline.format_stats()}")
+
+    frame_source.close()
+    stream_pose.close()
 
 @app.route('/')
 def index():
@@ -570,10 +634,8 @@ def get_images(dataset):
     if not dataset_path.exists():
         return jsonify([])
     
-    # Extensiones de video soportadas
-    video_extensions = {'.mp4', '.avi', '.mov', '.mkv', '.webm'}
     videos = [f.name for f in dataset_path.iterdir() 
-              if f.is_file() and f.suffix.lower() in video_extensions]
+              if f.is_file() and f.suffix.lower() in VIDEO_EXTENSIONS]
     return jsonify(sorted(videos))
 
 @app.route('/api/video/<dataset>/<video>')
@@ -582,8 +644,7 @@ def get_video(dataset, video):
     video_path = Path('dataset') / dataset / video
     
     # Validar que el archivo existe y tiene extensión válida
-    video_extensions = {'.mp4', '.avi', '.mov', '.mkv', '.webm'}
-    if not video_path.exists() or video_path.suffix.lower() not in video_extensions:
+    if not video_path.exists() or video_path.suffix.lower() not in VIDEO_EXTENSIONS:
         return jsonify({'error': 'Video no encontrado'}), 404
     
     return send_file(video_path, mimetype='video/mp4')
@@ -591,10 +652,13 @@ def get_video(dataset, video):
 @socketio.on('set_reference_video')
 def handle_set_reference_video(data):
     """Recibe la ruta del video de referencia, extrae una secuencia de landmarks muestreada
-    y la guarda en `current_reference_sequence`. Se expone `reference_fps` para sincronización.
+    y la guarda en la sesión del cliente. Se expone `reference_fps` para sincronización.
     Parámetros esperados en `data`: 'video_path' y opcional 'target_fps' (por defecto 2).
     """
-    global current_reference_landmarks, current_reference_sequence, reference_fps, current_reference_index
+    global stream_session_id
+    state = sessions.get(request.sid)
+    # El cliente que elige la referencia pasa a controlar el stream de cámara
+    stream_session_id = request.sid
 
     video_path = data.get('video_path')
     if not video_path:
@@ -602,92 +666,46 @@ def handle_set_reference_video(data):
 
     full_path = Path(video_path)
     if not full_path.exists():
-        socketio.emit('reference_video_set', {'success': False, 'message': 'Video no encontrado'})
+        socketio.emit('reference_video_set', {'success': False, 'message': 'Video no encontrado'}, to=request.sid)
         return
 
     try:
-        # Abrir el video
-        cap = cv2.VideoCapture(str(full_path))
-        if not cap.isOpened():
-            socketio.emit('reference_video_set', {'success': False, 'message': 'No se pudo abrir el video'})
+        target_fps = float(data.get('target_fps', 3))  # Aumentado de 2 a 3 fps
+        # Extraer landmarks (o leerlos de la caché si el video no cambió)
+        result, _ = get_reference_sequence(full_path, target_fps)
+        if result is None:
+            socketio.emit('reference_video_set', {'success': False, 'message': 'No se pudo abrir el video'}, to=request.sid)
             return
 
-        # Configurar muestreo - extraer más frames para mejor detección
-        video_fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
-        target_fps = float(data.get('target_fps', 3))  # Aumentado de 2 a 3 fps
         reference_fps = max(1, int(target_fps))
-        step = max(1, int(round(video_fps / target_fps)))
-
-        seq = []
-        frame_idx = 0
-        max_samples = 600  # Duplicado de 300 a 600
-        samples = 0
-        skipped = 0  # Contador de frames sin detección
-
-        print(f"Procesando video de referencia: {video_path}")
-        print(f"Video FPS: {video_fps}, Target FPS: {target_fps}, Step: {step}")
-        
-        # Usar confianza más baja para detectar más poses
-        local_pose = mp.solutions.pose.Pose(static_image_mode=True, model_complexity=1,
-                                            min_detection_confidence=0.4)  # Reducido de 0.6 a 0.4
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            if frame_idx % step == 0:
-                # Procesar con MediaPipe
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                results = local_pose.process(frame_rgb)
-                if results.pose_landmarks:
-                    landmarks = [coord for landmark in results.pose_landmarks.landmark
-                                 for coord in [landmark.x, landmark.y, landmark.z]]
-                    seq.append(landmarks)
-                    samples += 1
-                    if samples >= max_samples:
-                        print(f"Límite de {max_samples} muestras alcanzado")
-                        break
-                else:
-                    skipped += 1
-            
-            frame_idx += 1
-        
-        print(f"Extracción completa - Frames procesados: {frame_idx}, Detecciones: {samples}, Sin detección: {skipped}")
-
-        cap.release()
-        try:
-            local_pose.close()
-        except Exception:
-            pass
+        seq = result['landmarks']
 
-        if not seq:
-            socketio.emit('reference_video_set', {'success': False, 'message': 'No se detectaron landmarks en el video'})
+        if not len(seq):
+            socketio.emit('reference_video_set', {'success': False, 'message': 'No se detectaron landmarks en el video'}, to=request.sid)
             return
 
         # Guardar secuencia y primera referencia
-        current_reference_sequence = seq
-        current_reference_landmarks = seq[0]
-        current_reference_index = 0
+        state.set_reference(seq, reference_fps)
 
         socketio.emit('reference_video_set', {
             'success': True,
             'frames': len(seq),
             'ref_fps': reference_fps,
             'message': f'Se extrajeron {len(seq)} frames de referencia (muestreo {reference_fps} fps)'
-        })
+        }, to=request.sid)
 
     except Exception as e:
-        socketio.emit('reference_video_set', {'success': False, 'message': str(e)})
+        socketio.emit('reference_video_set', {'success': False, 'message': str(e)}, to=request.sid)
 
 
 @socketio.on('sync_reference_time')
 def handle_sync_reference_time(data):
     """Recibe {'current_time': seconds} del cliente para sincronizar el índice de referencia."""
-    global current_reference_index, reference_fps
+    state = sessions.get(request.sid)
     try:
         t = float(data.get('current_time', 0))
-        idx = int(round(t * reference_fps))
-        current_reference_index = max(0, idx)
+        idx = int(round(t * state.reference_fps))
+        state.reference_index = max(0, idx)
     except Exception:
         pass
 
@@ -695,253 +713,301 @@ def handle_sync_reference_time(data):
 @socketio.on('set_tolerance')
 def handle_set_tolerance(data):
     """Recibe {'tolerance': float} para ajustar la tolerancia de comparación en tiempo real."""
-    global current_tolerance
+    state = sessions.get(request.sid)
     try:
         t = float(data.get('tolerance', 1.0))
         # limitar rango razonable
         if t <= 0:
             return
-        current_tolerance = max(0.3, min(3.0, t))
-        socketio.emit('tolerance_updated', {'tolerance': current_tolerance})
+        state.tolerance = max(0.3, min(3.0, t))
+        socketio.emit('tolerance_updated', {'tolerance': state.tolerance}, to=request.sid)
     except Exception:
         pass
 
 @socketio.on('connect')
 def handle_connect():
-    global thread
+    global thread, stream_session_id
+    stream_feeds.add(request.sid)
     with thread_lock:
+        if stream_session_id is None:
+            stream_session_id = request.sid
         if thread is None:
             thread = socketio.start_background_task(video_stream)
 
 
+@socketio.on('feed_ack')
+def handle_feed_ack(data):
+    """Confirmación del cliente de un frame del feed dibujado: {'seq': int}."""
+    try:
+        stream_feeds.ack(request.sid, int(data.get('seq', 0)))
+    except Exception:
+        pass
+
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    """Libera el estado de la sesión del cliente que se desconecta. Si era el que controlaba
+    el stream de cámara, el control pasa al próximo cliente que se conecte."""
+    global stream_session_id
+    with thread_lock:
+        if stream_session_id == request.sid:
+            stream_session_id = None
+    stream_feeds.remove(request.sid)
+    sessions.drop(request.sid)
+
+
+@app.before_request
+def before_request():
+    """Latencia y peticiones en curso por endpoint (ver metricas.py). En las evaluaciones,
+    con el grabador activo, se guarda el cuerpo y el estado de la sesión al empezar por si
+    la solicitud resulta lenta (ver grabador_solicitudes.py)."""
+    g.request_t0 = time.perf_counter()
+    g.endpoint_stage = metricas.endpoint_stage(request.endpoint).__enter__()
+    if flight_recorder.enabled and request.method == 'POST' and request.endpoint in RECORDED_ENDPOINTS:
+        request.get_data(cache=True)
+        g.session_snapshot = session_snapshot(http_session())
+
+
+@app.teardown_request
+def teardown_request(exc):
+    # Los eventos Socket.IO también cierran un contexto de petición, sin haber pasado por before_request
+    endpoint_stage = g.pop('endpoint_stage', None)
+    if endpoint_stage is not None:
+        endpoint_stage.__exit__(type(exc) if exc else None, exc, None)
+
+
 @app.after_request
 def after_request(response):
     """Agregar headers CORS a todas las respuestas"""
+    metricas.count_response(request.endpoint, response.status_code)
+    if active_profile is not None and active_profile.running:
+        active_profile.note_request()
+    snapshot = g.pop('session_snapshot', None)
+    elapsed_ms = (time.perf_counter() - g.request_t0) * 1000 if 'request_t0' in g else 0
+    if snapshot is not None and flight_recorder.is_slow(elapsed_ms):
+        result = response.get_json(silent=True) if response.is_json else None
+        flight_recorder.record(request.get_data(cache=True), {
+            'source': 'http', 'endpoint': request.endpoint, 'path': request.path, 'method': request.method,
+            'content_type': request.content_type, 'query_string': request.query_string.decode('latin-1'),
+            'session_id': request.headers.get('X-Session-Id') or request.args.get('session_id'),
+            'elapsed_ms': elapsed_ms, 'dtw_mode': DTW_MODE, 'verdict_engine': VERDICT_ENGINE,
+            'response': {'status': response.status_code,
+                         'posture': result.get('posture') if isinstance(result, dict) else None,
+                         'feedback': result.get('feedback') if isinstance(result, dict) else None}}, snapshot)
     response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,X-Session-Id,X-Admin-Token')
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
     return response
 
-@app.route('/api/evaluate_frame', methods=['POST', 'OPTIONS'])
-def evaluate_frame():
-    """Endpoint para evaluar una imagen enviada por la app móvil.
-    Espera JSON: {'image': 'data:image/jpeg;base64,...'}
-    Devuelve: posture, feedback, reason, metrics
-    """
-    if request.method == 'OPTIONS':
-        return jsonify({'success': True}), 200
-    
-    try:
-        payload = request.get_json()
-        if not payload:
-            return jsonify({'success': False, 'message': 'No JSON payload'}), 400
-
-        img_b64 = payload.get('image')
-        if not img_b64:
-            return jsonify({'success': False, 'message': 'No image provided'}), 400
 
-        # Soporta data URI o solo base64
-        if ',' in img_b64:
-            img_b64 = img_b64.split(',', 1)[1]
-
-        img_bytes = base64.b64decode(img_b64)
-        nparr = np.frombuffer(img_bytes, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-        if frame is None:
-            return jsonify({'success': False, 'message': 'Invalid image data'}), 400
+def evaluation_response(posture, landmarks, payload):
+    """Evalúa los landmarks del usuario contra la referencia de la sesión y arma la respuesta JSON
+    de /api/evaluate_frame y /api/evaluate_landmarks (misma forma en ambos)."""
+    state = http_session()
 
-        # Usar las funciones existentes para clasificar y evaluar
-        frame_proc, posture, landmarks = classify_posture(frame)
+    # Actualizar buffer corto de landmarks de la sesión para suavizar ruido en llamadas HTTP
+    recent_user_landmarks_buffer = list(state.user_buffer)
+    try:
+        if landmarks is not None:
+            recent_user_landmarks_buffer = state.push_landmarks(state.user_buffer, landmarks)
+    except Exception:
+        pass
 
-        # Actualizar buffer corto de landmarks para suavizar ruido en llamadas HTTP
+    # ⭐ Procesar frame del video de referencia si se proporciona información
+    ref_landmarks_to_use = None
+    reference_video_info = payload.get('reference_video')
+    reference_sequence = state.reference_sequence
+    # En modo 'streaming' el DTW incremental de la sesión sigue la referencia frame a frame
+    matcher = state.streaming_matcher() if DTW_MODE == 'streaming' and len(reference_sequence) else None
+
+    # Primero intentar usar la secuencia sincronizada (más eficiente)
+    if len(reference_sequence):
+        idx = min(max(0, state.reference_index), len(reference_sequence)-1)
+        # Si tenemos un buffer de usuario reciente, preferimos comparar temporales (secuencia completa)
         try:
-            global recent_user_landmarks_buffer
-            if landmarks:
-                recent_user_landmarks_buffer.append(landmarks)
-                if len(recent_user_landmarks_buffer) > 3:
-                    recent_user_landmarks_buffer.pop(0)
+            if matcher is not None or (recent_user_landmarks_buffer and len(recent_user_landmarks_buffer) > 1):
+                ref_landmarks_to_use = reference_sequence
+            else:
+                ref_landmarks_to_use = reference_sequence[idx]
         except Exception:
-            pass
-
-        # ⭐ Procesar frame del video de referencia si se proporciona información
-        ref_landmarks_to_use = None
-        reference_video_info = payload.get('reference_video')
-        
-        # Primero intentar usar la secuencia sincronizada (más eficiente)
-        if current_reference_sequence:
-            idx = min(max(0, current_reference_index), len(current_reference_sequence)-1)
-            # Si tenemos un buffer de usuario reciente, preferimos comparar temporales (secuencia completa)
+            ref_landmarks_to_use = reference_sequence[idx]
+    elif state.reference_landmarks is not None:
+        ref_landmarks_to_use = state.reference_landmarks
+    # Si no hay secuencia, intentar procesar el video en tiempo real
+    elif reference_video_info and reference_video_info.get('condition') and reference_video_info.get('video_name'):
+        # Intentar obtener el frame del video de referencia
+        condition = reference_video_info.get('condition')
+        video_name = reference_video_info.get('video_name')
+        current_time = float(reference_video_info.get('current_time', 0))
+
+        # Buscar el video en el servidor
+        video_path = Path('dataset') / condition / video_name
+
+        if video_path.exists():
             try:
-                if recent_user_landmarks_buffer and len(recent_user_landmarks_buffer) > 1:
-                    ref_landmarks_to_use = current_reference_sequence
-                else:
-                    ref_landmarks_to_use = current_reference_sequence[idx]
-            except Exception:
-                ref_landmarks_to_use = current_reference_sequence[idx]
-        elif current_reference_landmarks:
-            ref_landmarks_to_use = current_reference_landmarks
-        # Si no hay secuencia, intentar procesar el video en tiempo real
-        elif reference_video_info and reference_video_info.get('condition') and reference_video_info.get('video_name'):
-            # Intentar obtener el frame del video de referencia
-            condition = reference_video_info.get('condition')
-            video_name = reference_video_info.get('video_name')
-            current_time = float(reference_video_info.get('current_time', 0))
-            
-            # Buscar el video en el servidor
-            video_path = Path('dataset') / condition / video_name
-            
-            if video_path.exists():
-                try:
-                    # Abrir el video y obtener el frame en el tiempo especificado
-                    cap = cv2.VideoCapture(str(video_path))
-                    if cap.isOpened():
-                        # Calcular frame número basado en el tiempo
-                        video_fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
-                        frame_number = int(current_time * video_fps)
-                        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
-                        
-                        ret, ref_frame = cap.read()
-                        if ret:
-                            # Procesar frame de referencia con MediaPipe
-                            ref_frame_rgb = cv2.cvtColor(ref_frame, cv2.COLOR_BGR2RGB)
-                            ref_results = pose.process(ref_frame_rgb)
-                            if ref_results.pose_landmarks:
-                                ref_landmarks_to_use = [coord for landmark in ref_results.pose_landmarks.landmark
-                                                       for coord in [landmark.x, landmark.y, landmark.z]]
-                        
-                        cap.release()
-                except Exception as e:
-                    print(f"Error procesando frame de referencia: {e}")
-
-        # ⭐ Evaluar postura - manejar caso cuando no hay landmarks del usuario
-        if not landmarks:
-            feedback_label = 'Sin evaluación'
-            feedback_reason = 'No se detectó postura. Asegúrate de estar visible en la cámara.'
-            metrics = {'avg_distance': None, 'max_distance': None}
-        elif not posture:
-            feedback_label = 'Sin evaluación'
-            feedback_reason = 'Postura no reconocida. Intenta ajustar tu posición.'
-            metrics = {'avg_distance': None, 'max_distance': None}
+                # Landmarks del índice por tiempo del video (búsqueda binaria); mientras el
+                # índice se construye, el frame se decodifica y se procesa (con LRU)
+                ref_landmarks_to_use = reference_timeline.landmarks_at(video_path, current_time)
+            except Exception as e:
+                print(f"Error procesando frame de referencia: {e}")
+
+    # ⭐ Evaluar postura - manejar caso cuando no hay landmarks del usuario
+    if landmarks is None:
+        feedback_label = 'Sin evaluación'
+        feedback_reason = 'No se detectó postura. Asegúrate de estar visible en la cámara.'
+        metrics = {'avg_distance': None, 'max_distance': None}
+    elif not posture:
+        feedback_label = 'Sin evaluación'
+        feedback_reason = 'Postura no reconocida. Intenta ajustar tu posición.'
+        metrics = {'avg_distance': None, 'max_distance': None}
+    else:
+        # Log para debugging
+        if ref_landmarks_to_use is not None:
+            print(f"Evaluando con referencia: posture={posture}, ref_available=True")
         else:
-            # Log para debugging
-            if ref_landmarks_to_use:
-                print(f"Evaluando con referencia: posture={posture}, ref_available=True")
+            print(f"Evaluando sin referencia: posture={posture}, usando heurísticas")
+
+        with stage('evaluate_posture'):
+            feedback_label, feedback_reason, metrics = evaluate_posture(
+                landmarks, posture, ref_landmarks_to_use, tolerance_scale=state.tolerance,
+                user_buffer=recent_user_landmarks_buffer, reference_index=state.reference_index,
+                matcher=matcher)
+        if matcher is not None:
+            state.reference_index = matcher.position
+            metrics['reference_index'] = matcher.position
+
+    # ⭐ Calcular tamaño de la pose para detectar distancia y visibilidad de cuerpo inferior
+    pose_size = None
+    distance_status = None  # 'too_close', 'too_far', 'optimal'
+    visible_lower_body = False
+    if landmarks is not None:
+        # floats de Python para que las métricas se serialicen en JSON
+        pts = np.asarray(landmarks, dtype=np.float64).tolist()
+        if len(pts) >= 29:  # Asegurar que tenemos suficientes landmarks
+            LEFT_SHOULDER = 11
+            RIGHT_SHOULDER = 12
+            LEFT_HIP = 23
+            RIGHT_HIP = 24
+            LEFT_KNEE = 25
+            RIGHT_KNEE = 26
+            LEFT_ANKLE = 27
+            RIGHT_ANKLE = 28
+
+            # Calcular distancia promedio entre hombros y caderas (torso)
+            shoulder_center = ((pts[LEFT_SHOULDER][0] + pts[RIGHT_SHOULDER][0]) / 2,
+                               (pts[LEFT_SHOULDER][1] + pts[RIGHT_SHOULDER][1]) / 2)
+            hip_center = ((pts[LEFT_HIP][0] + pts[RIGHT_HIP][0]) / 2,
+                          (pts[LEFT_HIP][1] + pts[RIGHT_HIP][1]) / 2)
+
+            # Distancia del torso (normalizada 0-1)
+            torso_distance = np.sqrt((shoulder_center[0] - hip_center[0])**2 +
+                                     (shoulder_center[1] - hip_center[1])**2)
+            pose_size = float(torso_distance)
+
+            # Heurística de visibilidad de cuerpo inferior: validar x,y en [0,1] y span vertical suficiente
+            lower_idxs = [LEFT_HIP, RIGHT_HIP, LEFT_KNEE, RIGHT_KNEE, LEFT_ANKLE, RIGHT_ANKLE]
+            def in_bounds(p):
+                return p is not None and 0.0 <= p[0] <= 1.0 and 0.0 <= p[1] <= 1.0
+            lower_points = [pts[i] if i < len(pts) else None for i in lower_idxs]
+            lower_in_bounds = all(in_bounds(p) for p in lower_points if p is not None)
+
+            # Span vertical entre caderas y tobillos promedio
+            ankles_y = [pts[LEFT_ANKLE][1], pts[RIGHT_ANKLE][1]] if in_bounds(pts[LEFT_ANKLE]) and in_bounds(pts[RIGHT_ANKLE]) else []
+            vertical_span = None
+            if lower_in_bounds and ankles_y:
+                avg_ankle_y = float(sum(ankles_y) / len(ankles_y))
+                vertical_span = avg_ankle_y - hip_center[1]
+                # Umbral muy relajado: 0.05 para aceptar la mayoría de encuadres
+                visible_lower_body = vertical_span > 0.05
             else:
-                print(f"Evaluando sin referencia: posture={posture}, usando heurísticas")
-            
-            feedback_label, feedback_reason, metrics = evaluate_posture(landmarks, posture, ref_landmarks_to_use, tolerance_scale=current_tolerance)
-
-        # ⭐ Calcular tamaño de la pose para detectar distancia y visibilidad de cuerpo inferior
-        pose_size = None
-        distance_status = None  # 'too_close', 'too_far', 'optimal'
-        visible_lower_body = False
-        if landmarks:
-            pts = [(landmarks[i], landmarks[i+1], landmarks[i+2]) for i in range(0, len(landmarks), 3)]
-            if len(pts) >= 29:  # Asegurar que tenemos suficientes landmarks
-                LEFT_SHOULDER = 11
-                RIGHT_SHOULDER = 12
-                LEFT_HIP = 23
-                RIGHT_HIP = 24
-                LEFT_KNEE = 25
-                RIGHT_KNEE = 26
-                LEFT_ANKLE = 27
-                RIGHT_ANKLE = 28
-
-                # Calcular distancia promedio entre hombros y caderas (torso)
-                shoulder_center = ((pts[LEFT_SHOULDER][0] + pts[RIGHT_SHOULDER][0]) / 2,
-                                   (pts[LEFT_SHOULDER][1] + pts[RIGHT_SHOULDER][1]) / 2)
-                hip_center = ((pts[LEFT_HIP][0] + pts[RIGHT_HIP][0]) / 2,
-                              (pts[LEFT_HIP][1] + pts[RIGHT_HIP][1]) / 2)
-
-                # Distancia del torso (normalizada 0-1)
-                torso_distance = np.sqrt((shoulder_center[0] - hip_center[0])**2 +
-                                         (shoulder_center[1] - hip_center[1])**2)
-                pose_size = float(torso_distance)
-
-                # Heurística de visibilidad de cuerpo inferior: validar x,y en [0,1] y span vertical suficiente
-                lower_idxs = [LEFT_HIP, RIGHT_HIP, LEFT_KNEE, RIGHT_KNEE, LEFT_ANKLE, RIGHT_ANKLE]
-                def in_bounds(p):
-                    return p is not None and 0.0 <= p[0] <= 1.0 and 0.0 <= p[1] <= 1.0
-                lower_points = [pts[i] if i < len(pts) else None for i in lower_idxs]
-                lower_in_bounds = all(in_bounds(p) for p in lower_points if p is not None)
-
-                # Span vertical entre caderas y tobillos promedio
-                ankles_y = [pts[LEFT_ANKLE][1], pts[RIGHT_ANKLE][1]] if in_bounds(pts[LEFT_ANKLE]) and in_bounds(pts[RIGHT_ANKLE]) else []
-                vertical_span = None
-                if lower_in_bounds and ankles_y:
-                    avg_ankle_y = float(sum(ankles_y) / len(ankles_y))
-                    vertical_span = avg_ankle_y - hip_center[1]
-                    # Umbral muy relajado: 0.05 para aceptar la mayoría de encuadres
-                    visible_lower_body = vertical_span > 0.05
+                visible_lower_body = False
+
+            # Determinar estado de distancia (término medio):
+            # Óptimo solo si hay algo de cuerpo inferior visible o span vertical >= 0.04
+            if torso_distance > 0.35:
+                distance_status = 'too_close'
+            elif torso_distance < 0.12:
+                distance_status = 'too_far'
+            else:
+                # Dentro del rango, verificar visibilidad de piernas
+                if visible_lower_body or (vertical_span is not None and vertical_span >= 0.04):
+                    distance_status = 'optimal'
                 else:
-                    visible_lower_body = False
-
-                # Determinar estado de distancia (término medio):
-                # Óptimo solo si hay algo de cuerpo inferior visible o span vertical >= 0.04
-                if torso_distance > 0.35:
-                    distance_status = 'too_close'
-                elif torso_distance < 0.12:
+                    # Sin piernas visibles: no afirmar 'optimal'
                     distance_status = 'too_far'
-                else:
-                    # Dentro del rango, verificar visibilidad de piernas
-                    if visible_lower_body or (vertical_span is not None and vertical_span >= 0.04):
-                        distance_status = 'optimal'
-                    else:
-                        # Sin piernas visibles: no afirmar 'optimal'
-                        distance_status = 'too_far'
-
-        # Mapear a etiqueta amigable para cliente
-        distance_quality = None
-        if distance_status == 'too_close':
-            distance_quality = 'near'
-        elif distance_status == 'too_far':
-            distance_quality = 'far'
-        elif distance_status == 'optimal':
-            # Marcar óptima si la distancia es buena, independiente de visibilidad completa
-            distance_quality = 'optimal'
-        else:
-            distance_quality = 'far'
 
-        # Añadir is_good y una estimación simple de confianza basada en avg_distance
-        is_good = False
-        confidence = None
-        try:
-            if isinstance(metrics.get('avg_distance'), float) and metrics.get('avg_distance') is not None:
-                avg = float(metrics.get('avg_distance'))
-                # confianza: 1 - saturación del avg (valores empíricos)
-                confidence = max(0.0, min(1.0, 1.0 - (avg / (avg + 0.1))))
-            if isinstance(feedback_label, str):
-                low = feedback_label.lower()
-                if 'bien' in low or '✓' in feedback_label:
-                    is_good = True
-        except Exception:
-            pass
+    # Mapear a etiqueta amigable para cliente
+    distance_quality = None
+    if distance_status == 'too_close':
+        distance_quality = 'near'
+    elif distance_status == 'too_far':
+        distance_quality = 'far'
+    elif distance_status == 'optimal':
+        # Marcar óptima si la distancia es buena, independiente de visibilidad completa
+        distance_quality = 'optimal'
+    else:
+        distance_quality = 'far'
+
+    # Añadir is_good y una estimación simple de confianza basada en avg_distance
+    is_good = False
+    confidence = None
+    try:
+        if isinstance(metrics.get('avg_distance'), float) and metrics.get('avg_distance') is not None:
+            avg = float(metrics.get('avg_distance'))
+            # confianza: 1 - saturación del avg (valores empíricos)
+            confidence = max(0.0, min(1.0, 1.0 - (avg / (avg + 0.1))))
+        if isinstance(feedback_label, str):
+            low = feedback_label.lower()
+            if 'bien' in low or '✓' in feedback_label:
+                is_good = True
+    except Exception:
+        pass
 
-        # Inyectar visibilidad de cuerpo inferior en métricas
-        try:
-            if isinstance(metrics, dict):
-                metrics['visible_lower_body'] = visible_lower_body
-                metrics['lower_body_span'] = vertical_span if vertical_span is not None else None
-                metrics['torso_distance'] = pose_size
-        except Exception:
-            pass
+    # Inyectar visibilidad de cuerpo inferior en métricas
+    try:
+        if isinstance(metrics, dict):
+            metrics['visible_lower_body'] = visible_lower_body
+            metrics['lower_body_span'] = vertical_span if vertical_span is not None else None
+            metrics['torso_distance'] = pose_size
+    except Exception:
+        pass
 
-        # Integración opcional: ajustar feedback con Groq si hay API key
-        try:
-            metrics_payload = {
-                'avg_distance': metrics.get('avg_distance'),
-                'max_distance': metrics.get('max_distance'),
-                'distance_quality': distance_quality,
-                'visible_lower_body': visible_lower_body,
-                'pose_size': pose_size,
-            }
-            new_feedback, new_reason = groq_assess_movement(metrics_payload, feedback_label, feedback_reason)
-            feedback_label, feedback_reason = new_feedback, new_reason
+    # Veredicto final según VERDICT_ENGINE (ver veredicto_local.py):
+    # - 'groq': ajustar feedback con Groq si hay API key. No se espera a Groq: si el veredicto
+    #   no está en caché se responde con el local y el de Groq llega a la sesión en segundo
+    #   plano (se devuelve como 'llm_verdict' en la siguiente respuesta)
+    # - 'local': árbol destilado de Groq (microsegundos); Groq solo audita algunos frames
+    # - 'heuristico': el de evaluate_posture
+    feedback_source = 'local'
+    llm_verdict, state.llm_verdict = state.llm_verdict, None
+    try:
+        metrics_payload = {
+            'avg_distance': metrics.get('avg_distance'),
+            'max_distance': metrics.get('max_distance'),
+            'distance_quality': distance_quality,
+            'visible_lower_body': visible_lower_body,
+            'pose_size': pose_size,
+        }
+
+        def deliver_verdict(feedback, reason, assessed_metrics):
+            state.llm_verdict = {'feedback': feedback, 'reason': reason, 'metrics': assessed_metrics,
+                                 'received_at': time.time()}
+
+        if VERDICT_ENGINE == 'local' and verdict_model is not None:
+            feedback_label, feedback_reason, _ = verdict_model.predict(metrics_payload, feedback_reason)
+            feedback_source = 'local_model'
             is_good = (feedback_label == 'Bien')
-        except Exception:
-            pass
+            groq_assessor.audit(metrics_payload, feedback_label)
+        elif VERDICT_ENGINE == 'groq':
+            new_feedback, new_reason, feedback_source = groq_assessor.assess(
+                metrics_payload, feedback_label, feedback_reason, on_result=deliver_verdict)
+            if feedback_source != 'local':
+                feedback_label, feedback_reason = new_feedback, new_reason
+                is_good = (feedback_label == 'Bien')
+    except Exception:
+        pass
 
+    with stage('json'):
         return jsonify({'success': True,
                         'posture': posture,
                         'feedback': feedback_label,
@@ -951,7 +1017,74 @@ def evaluate_frame():
                         'distance_status': distance_status,
                         'distance_quality': distance_quality,
                         'is_good': is_good,
-                        'confidence': confidence})
+                        'confidence': confidence,
+                        'feedback_source': feedback_source,
+                        'llm_verdict': llm_verdict})
+
+
+@app.route('/api/evaluate_frame', methods=['POST', 'OPTIONS'])
+def evaluate_frame():
+    """Endpoint para evaluar una imagen enviada por la app móvil.
+    Acepta el JPEG como cuerpo binario (Content-Type: image/jpeg), multipart
+    (campo 'image') o JSON: {'image': 'data:image/jpeg;base64,...'} (ver entrada_imagen.py)
+    Devuelve: posture, feedback, reason, metrics
+    """
+    if request.method == 'OPTIONS':
+        return jsonify({'success': True}), 200
+    
+    try:
+        ensure_runtime()
+        try:
+            nparr, payload, _ = read_image_request(request)
+        except ImageRequestError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+
+        with stage('imdecode'):
+            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+        if frame is None:
+            return jsonify({'success': False, 'message': 'Invalid image data'}), 400
+
+        # Usar las funciones existentes para clasificar y evaluar
+        frame_proc, posture, landmarks = classify_posture(frame, draw=False, session_id=http_session().session_id)
+        return evaluation_response(posture, landmarks, payload)
+
+    except TimeoutError as e:
+        return jsonify({'success': False, 'message': str(e)}), 503
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+
+@app.route('/api/evaluate_landmarks', methods=['POST', 'OPTIONS'])
+def evaluate_landmarks():
+    """Endpoint para clientes que corren la estimación de pose en el dispositivo.
+    Espera JSON: {'landmarks': [[x, y, z], ...] (33 puntos o 99 valores planos), 'reference_video': {...}}
+    o un cuerpo binario (application/octet-stream) con los 99 valores float32 (396 bytes) o
+    float16 (198 bytes) little-endian; en ese caso reference_video va en la query string.
+    Sin decodificar imagen ni MediaPipe: solo clasificador + evaluate_posture + métricas.
+    Devuelve lo mismo que /api/evaluate_frame.
+    """
+    if request.method == 'OPTIONS':
+        return jsonify({'success': True}), 200
+
+    try:
+        ensure_runtime()
+        try:
+            if request.is_json:
+                payload = request.get_json(silent=True)
+                if not isinstance(payload, dict) or payload.get('landmarks') is None:
+                    return jsonify({'success': False, 'message': 'No landmarks provided'}), 400
+                landmarks = frame_array(payload['landmarks'])
+            else:
+                payload = options_from_fields(request.args)
+                landmarks = unpack_landmarks(request.get_data(cache=False), request.args.get('dtype'))
+        except (ValueError, TypeError, ImageRequestError) as e:
+            return jsonify({'success': False, 'message': f'Invalid landmarks: {e}'}), 400
+
+        if landmarks.shape != (NUM_LANDMARKS, 3) or not np.all(np.isfinite(landmarks)):
+            return jsonify({'success': False, 'message': f'Landmarks must be {NUM_LANDMARKS}x3 finite values'}), 400
+
+        return evaluation_response(predict_posture(landmarks), landmarks, payload)
 
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -967,6 +1100,7 @@ def process_video_frames():
         return jsonify({'success': True}), 200
     
     try:
+        ensure_runtime()
         payload = request.get_json()
         if not payload:
             return jsonify({'success': False, 'message': 'No JSON payload'}), 400
@@ -977,42 +1111,31 @@ def process_video_frames():
         if not frames_b64:
             return jsonify({'success': False, 'message': 'No frames provided'}), 400
         
-        seq = []
-        # Procesar cada frame
-        for frame_b64 in frames_b64:
-            try:
-                # Decodificar imagen
-                if ',' in frame_b64:
-                    frame_b64 = frame_b64.split(',', 1)[1]
-                
-                img_bytes = base64.b64decode(frame_b64)
-                nparr = np.frombuffer(img_bytes, np.uint8)
-                frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-                
-                if frame is None:
-                    continue
-                
-                # Procesar con MediaPipe
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                results = pose.process(frame_rgb)
-                if results.pose_landmarks:
-                    landmarks = [coord for landmark in results.pose_landmarks.landmark
-                                 for coord in [landmark.x, landmark.y, landmark.z]]
-                    seq.append(landmarks)
-            except Exception as e:
-                print(f"Error procesando frame: {e}")
-                continue
-        
+        # Frames repartidos entre procesos de trabajo (ver procesamiento_lotes.py), en orden
+        results, batch_stats = batch_processor.process(frames_b64)
+        seq = [landmarks for _, landmarks, _ in results if landmarks is not None]
+        errors = [{'index': index, 'message': error} for index, _, error in results if error]
+        for error in errors:
+            print(f"Error procesando frame {error['index']}: {error['message']}")
+        print(f"[LOTES] {batch_stats['frames']} frames en {batch_stats['elapsed_ms']:.0f} ms "
+              f"({batch_stats['fps']:.1f} fps, {batch_stats['workers']} proceso(s))")
+
         if not seq:
-            return jsonify({'success': False, 'message': 'No se detectaron landmarks en los frames'}), 400
+            return jsonify({'success': False, 'message': 'No se detectaron landmarks en los frames',
+                            'errors': errors}), 400
         
         return jsonify({
             'success': True,
-            'landmarks_sequence': seq,
+            'landmarks_sequence': to_json_list(sequence_array(seq)),
             'ref_fps': int(target_fps),
-            'frames_count': len(seq)
+            'frames_count': len(seq),
+            'frames_received': len(frames_b64),
+            'errors': errors,
+            'batch_stats': batch_stats
         })
-    
+
+    except TimeoutError as e:
+        return jsonify({'success': False, 'message': str(e)}), 503
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
@@ -1021,13 +1144,11 @@ def process_video_frames():
 def set_reference_landmarks():
     """Endpoint HTTP para establecer la secuencia de landmarks como referencia (para app móvil).
     Espera JSON: {'landmarks_sequence': [[...], ...], 'ref_fps': 2}
-    Guarda la secuencia en current_reference_sequence.
+    Guarda la secuencia en la sesión del cliente (cabecera X-Session-Id).
     """
     if request.method == 'OPTIONS':
         return jsonify({'success': True}), 200
     
-    global current_reference_landmarks, current_reference_sequence, reference_fps, current_reference_index
-    
     try:
         payload = request.get_json()
         if not payload:
@@ -1038,12 +1159,14 @@ def set_reference_landmarks():
         
         if not landmarks_seq:
             return jsonify({'success': False, 'message': 'No landmarks sequence provided'}), 400
+
+        try:
+            landmarks_seq = sequence_array(landmarks_seq)
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Invalid landmarks sequence (expected frames of 33 x [x, y, z])'}), 400
         
         # Guardar secuencia y primera referencia
-        current_reference_sequence = landmarks_seq
-        current_reference_landmarks = landmarks_seq[0] if landmarks_seq else None
-        current_reference_index = 0
-        reference_fps = ref_fps
+        http_session().set_reference(landmarks_seq, ref_fps)
         
         return jsonify({
             'success': True,
@@ -1060,13 +1183,11 @@ def set_reference_landmarks():
 def set_reference_video_http():
     """Endpoint HTTP para establecer el video de referencia (para app móvil).
     Espera JSON: {'condition': 'condicion', 'video_name': 'nombre_video.mp4', 'target_fps': 2}
-    Extrae landmarks del video y los guarda en current_reference_sequence.
+    Extrae landmarks del video y los guarda en la sesión del cliente (cabecera X-Session-Id).
     """
     if request.method == 'OPTIONS':
         return jsonify({'success': True}), 200
     
-    global current_reference_landmarks, current_reference_sequence, reference_fps, current_reference_index
-    
     try:
         payload = request.get_json()
         if not payload:
@@ -1099,67 +1220,21 @@ def set_reference_video_http():
             return jsonify({'success': False, 'message': f'Video no encontrado en rutas esperadas. Buscado: {video_name} en condition {condition}'}), 404
         
         print(f"INFO: Abriendo video de referencia: {video_path}")
-        # Abrir el video
-        cap = cv2.VideoCapture(str(video_path))
-        if not cap.isOpened():
+        target_fps = float(payload.get('target_fps', 3))  # Aumentado de 2 a 3 fps
+        # Extraer landmarks (o leerlos de la caché si el video no cambió)
+        result, _ = get_reference_sequence(video_path, target_fps)
+        if result is None:
             print(f"ERROR: No se pudo abrir el video: {video_path}")
             return jsonify({'success': False, 'message': f'No se pudo abrir el video: {video_path.name}'}), 400
-        
-        # Configurar muestreo - extraer más frames para mejor detección
-        video_fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
-        target_fps = float(payload.get('target_fps', 3))  # Aumentado de 2 a 3 fps
+
         reference_fps = max(1, int(target_fps))
-        step = max(1, int(round(video_fps / target_fps)))
-        
-        seq = []
-        frame_idx = 0
-        max_samples = 600  # Duplicado de 300 a 600
-        samples = 0
-        skipped = 0  # Contador de frames sin detección
-        
-        print(f"Procesando video de referencia: {video_path}")
-        print(f"Video FPS: {video_fps}, Target FPS: {target_fps}, Step: {step}")
-        
-        # Usar confianza más baja para detectar más poses
-        local_pose = mp.solutions.pose.Pose(static_image_mode=True, model_complexity=1,
-                                            min_detection_confidence=0.4)  # Reducido de 0.6 a 0.4
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            if frame_idx % step == 0:
-                # Procesar con MediaPipe
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                results = local_pose.process(frame_rgb)
-                if results.pose_landmarks:
-                    landmarks = [coord for landmark in results.pose_landmarks.landmark
-                                 for coord in [landmark.x, landmark.y, landmark.z]]
-                    seq.append(landmarks)
-                    samples += 1
-                    if samples >= max_samples:
-                        print(f"Límite de {max_samples} muestras alcanzado")
-                        break
-                else:
-                    skipped += 1
-            
-            frame_idx += 1
-        
-        print(f"Extracción completa - Frames procesados: {frame_idx}, Detecciones: {samples}, Sin detección: {skipped}")
-    
-        cap.release()
-        try:
-            local_pose.close()
-        except Exception:
-            pass
-        
-        if not seq:
+        seq = result['landmarks']
+
+        if not len(seq):
             return jsonify({'success': False, 'message': 'No se detectaron landmarks en el video'}), 400
         
         # Guardar secuencia y primera referencia
-        current_reference_sequence = seq
-        current_reference_landmarks = seq[0]
-        current_reference_index = 0
+        http_session().set_reference(seq, reference_fps)
         
         print(f"Video de referencia establecido: {len(seq)} frames extraídos")
         
@@ -1181,19 +1256,19 @@ def sync_reference_time_http():
         return jsonify({'success': True}), 200
     """Endpoint HTTP para sincronizar tiempo del video (para app móvil).
     Espera JSON: {'current_time': seconds}
-    Actualiza current_reference_index basado en el tiempo.
+    Actualiza el índice de referencia de la sesión basado en el tiempo.
     """
-    global current_reference_index, reference_fps
     try:
         payload = request.get_json()
         if not payload:
             return jsonify({'success': False}), 400
         
+        state = http_session()
         t = float(payload.get('current_time', 0))
-        idx = int(round(t * reference_fps))
-        current_reference_index = max(0, idx)
+        idx = int(round(t * state.reference_fps))
+        state.reference_index = max(0, idx)
         
-        return jsonify({'success': True, 'index': current_reference_index})
+        return jsonify({'success': True, 'index': state.reference_index})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
@@ -1203,25 +1278,132 @@ def ping():
     print("[PING] /api/ping llamado")
     return jsonify({'success': True, 'message': 'pong'})
 
+@app.route('/api/ready', methods=['GET'])
+def ready():
+    """Readiness: 200 cuando el runtime (MediaPipe + modelo) está cargado y calentado, 503 si no.
+    Incluye los tiempos de arranque en frío y de calentamiento (ms) y el uso del pool de pose."""
+    status = 200 if startup_state['ready'] else 503
+    return jsonify({'success': startup_state['ready'],
+                    'ready': startup_state['ready'],
+                    'lazy_startup': startup_state['lazy'],
+                    'error': startup_state['error'],
+                    'ready_after_s': startup_state['ready_after_s'],
+                    'uptime_s': time.perf_counter() - BOOT_T0,
+                    'process_cpu_s': time.process_time(),
+                    'frame_source': frame_source.stats() if frame_source is not None else FRAME_SOURCE,
+                    'timings_ms': startup_state['timings_ms'],
+                    'pose_pool': pose_pool.stats() if pose_pool is not None else None,
+                    'pose_tracking': dict(pose_trackers.stats(), mode=POSE_TRACKING),
+                    'video_batches': batch_processor.stats(),
+                    'reference_timeline': reference_timeline.stats(),
+                    'groq': groq_assessor.stats(),
+                    'slow_requests': flight_recorder.stats(),
+                    'verdict_engine': VERDICT_ENGINE if VERDICT_ENGINE != 'local' or verdict_model else 'heuristico'}), status
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Latencia por etapa (histogramas, errores y en curso) y por endpoint en formato Prometheus;
+    con ?format=json, resumen con p50/p95/p99 (ver metricas.py)."""
+    pool = pose_pool.stats() if pose_pool is not None else {}
+    groq = groq_assessor.stats()
+    gauges = {'pose_pool_in_use': pool.get('in_use'), 'pose_pool_idle': pool.get('idle'),
+              'pose_trackers': pose_trackers.stats()['active'], 'sessions': len(sessions),
+              'groq_pending': groq['pending']}
+    if request.args.get('format') == 'json':
+        return jsonify({'success': True, **metricas.snapshot(), 'gauges': gauges})
+    return Response(metricas.render_prometheus(gauges), mimetype='text/plain; version=0.0.4')
+
+def admin_denied():
+    """Respuesta de error si la petición no trae ADMIN_TOKEN (cabecera X-Admin-Token o
+    Authorization: Bearer), o None si está autorizada."""
+    if not ADMIN_TOKEN:
+        return jsonify({'success': False, 'message': 'Endpoints de administración deshabilitados (sin ADMIN_TOKEN)'}), 404
+    auth = request.headers.get('Authorization', '')
+    token = request.headers.get('X-Admin-Token') or (auth[7:] if auth.startswith('Bearer ') else '')
+    if not hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8')):
+        return jsonify({'success': False, 'message': 'No autorizado'}), 401
+    return None
+
+@app.route('/api/admin/profile', methods=['GET', 'POST'])
+def admin_profile():
+    """Perfilado por muestreo bajo demanda (ver perfilador.py).
+    POST {'seconds': N} o {'requests': N}, opcional 'interval_ms', 'idle' (incluir hilos en espera)
+    y 'wait' (esperar y devolver el resultado; solo con 'seconds'). GET devuelve el estado mientras
+    corre y, al terminar, las pilas en formato folded (flamegraph.pl / speedscope) como texto.
+    """
+    global active_profile
+    denied = admin_denied()
+    if denied:
+        return denied
+    if request.method == 'GET':
+        if active_profile is None:
+            return jsonify({'success': False, 'message': 'No hay perfilado'}), 404
+        if active_profile.running or request.args.get('format') == 'json':
+            return jsonify({'success': True, 'profile': active_profile.status()})
+        return Response(active_profile.folded(), mimetype='text/plain')
+
+    if active_profile is not None and active_profile.running:
+        return jsonify({'success': False, 'message': 'Ya hay un perfilado en curso',
+                        'profile': active_profile.status()}), 409
+    options = request.get_json(silent=True) or {}
+    try:
+        profile = SamplingProfiler(seconds=options.get('seconds'), requests=options.get('requests'),
+                                   interval_ms=options.get('interval_ms', 5), include_idle=bool(options.get('idle')))
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'message': f'Opciones inválidas: {e}'}), 400
+    active_profile = profile.start()
+    print(f"[PERFIL] Perfilado iniciado: {profile.status()}")
+    if options.get('wait') and profile.max_requests is None:
+        profile.wait()
+        return Response(profile.folded(), mimetype='text/plain')
+    return jsonify({'success': True, 'profile': profile.status()}), 202
+
+@app.route('/api/admin/slow_requests', methods=['GET'])
+def admin_slow_requests():
+    """Solicitudes lentas guardadas por el grabador (metadatos) y su configuración."""
+    denied = admin_denied()
+    if denied:
+        return denied
+    return jsonify({'success': True, 'recorder': flight_recorder.stats(), 'captures': flight_recorder.list()})
+
+@app.route('/api/admin/slow_requests/<name>', methods=['GET'])
+def admin_slow_request_file(name):
+    """Descarga una grabación (.npz) para reproducirla con reproducir_solicitudes.py."""
+    denied = admin_denied()
+    if denied:
+        return denied
+    path = flight_recorder.directory / Path(name).name
+    if path.suffix != '.npz' or not path.is_file():
+        return jsonify({'success': False, 'message': 'Grabación no encontrada'}), 404
+    return send_file(path.resolve(), mimetype='application/octet-stream', as_attachment=True, download_name=path.name)
+
+@app.route('/api/pipeline_stats', methods=['GET'])
+def pipeline_stats():
+    """Throughput, latencia y frames descartados por etapa del stream de cámara."""
+    if video_pipeline is None:
+        return jsonify({'success': False, 'message': 'Stream de cámara no iniciado'}), 404
+    return jsonify({'success': True, 'feed': stream_feeds.stats(), 'source': frame_source.stats(),
+                    **video_pipeline.snapshot()})
+
 @app.route('/api/reference_landmarks', methods=['GET'])
 def get_reference_landmarks():
     """Devuelve landmarks de referencia en el índice sincronizado actual.
     Si hay una secuencia cargada, devuelve el frame actual; si no, intenta un landmark único.
     """
     try:
-        global current_reference_sequence, current_reference_index, current_reference_landmarks, reference_fps
-        if current_reference_sequence:
-            idx = min(max(0, current_reference_index), len(current_reference_sequence)-1)
-            ref = current_reference_sequence[idx]
+        state = http_session()
+        if len(state.reference_sequence):
+            idx = min(max(0, state.reference_index), len(state.reference_sequence)-1)
+            ref = state.reference_sequence[idx]
             return jsonify({'success': True,
-                            'landmarks': ref,
+                            'landmarks': to_json_list(ref),
                             'index': idx,
-                            'ref_fps': reference_fps})
-        elif current_reference_landmarks:
+                            'ref_fps': state.reference_fps})
+        elif state.reference_landmarks is not None:
             return jsonify({'success': True,
-                            'landmarks': current_reference_landmarks,
+                            'landmarks': to_json_list(state.reference_landmarks),
                             'index': 0,
-                            'ref_fps': reference_fps})
+                            'ref_fps': state.reference_fps})
         else:
             return jsonify({'success': False, 'message': 'No reference loaded'}), 404
     except Exception as e:
@@ -1229,18 +1411,46 @@ def get_reference_landmarks():
 
 
 if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Backend Modelo - Flask + SocketIO')
+    parser.add_argument('--preextraer', action='store_true',
+                        help='Pre-extraer en segundo plano las referencias de dataset/ al arrancar')
+    parser.add_argument('--preextraer-workers', type=int, default=None,
+                        help='Procesos para la pre-extracción (default: todos los núcleos)')
+    parser.add_argument('--lazy-startup', action='store_true',
+                        help='Arrancar sin esperar a MediaPipe/modelo: se cargan y calientan en segundo plano (ver /api/ready)')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 5000)),
+                        help='Puerto HTTP (default: 5000 o PORT)')
+    args = parser.parse_args()
+
+    if args.lazy_startup:
+        LAZY_STARTUP = True
+        startup_state['lazy'] = True
+    if LAZY_STARTUP:
+        socketio.start_background_task(prepare_runtime_background)
+    else:
+        # Cargar y calentar antes de aceptar conexiones (igual que antes: sin modelo no se arranca)
+        try:
+            warm_up()
+        except RuntimeError:
+            exit(1)
+
+    if args.preextraer:
+        # Hilo en segundo plano: el servidor responde mientras el pool extrae las referencias
+        socketio.start_background_task(preextract_references, 'dataset', 3, args.preextraer_workers)
+
     # Banner de arranque en consola
     print("\n========================================")
     print("Backend Modelo - Flask + SocketIO")
-    print("Puerto: 5000 | Host: 0.0.0.0")
-    print("Endpoints principales: /api/ping, /api/video/<dataset>/<video>")
+    print(f"Puerto: {args.port} | Host: 0.0.0.0")
+    print("Endpoints principales: /api/ping, /api/ready, /api/video/<dataset>/<video>")
     print("========================================\n")
     # Usar socketio.run para mantener soporte SocketIO + Flask routes HTTP
     try:
         print("[BOOT] Iniciando servidor...")
-        socketio.run(app, host='0.0.0.0', port=5000, debug=False, allow_unsafe_werkzeug=True)
+        socketio.run(app, host='0.0.0.0', port=args.port, debug=False, allow_unsafe_werkzeug=True)
     except Exception as e:
         import traceback
         print("[BOOT][ERROR] Falló el arranque del servidor:", str(e))
         traceback.print_exc()
-        print("Sugerencias: verifica dependencias (Flask/SocketIO), puerto 5000 libre, firewall.")
\ No newline at end of file
+        print(f"Sugerencias: verifica dependencias (Flask/SocketIO), puerto {args.port} libre, firewall.")
\ No newline at end of file
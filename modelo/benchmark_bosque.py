@@ -0,0 +1,74 @@
+"""
+Benchmark de la inferencia del clasificador de posturas.
+
+Compara `modelo.predict` de sklearn contra CompiledForest (inferencia_bosque.py)
+por frame (una fila, como classify_posture) y por lotes, verificando que las
+probabilidades y las etiquetas sean idénticas.
+
+Uso:
+    python benchmark_bosque.py [--modelo modelo_posturas.pkl] [--csv dataset_posturas.csv]
+"""
+
+import argparse
+import time
+
+import joblib
+import numpy as np
+
+from benchmark_evaluacion import load_landmark_rows, time_call
+from inferencia_bosque import CompiledForest
+
+
+def benchmark_frame(model, forest, rows, n_frames=200):
+    """Latencia por frame (una fila por llamada)."""
+    frames = rows[np.random.default_rng(0).integers(0, len(rows), n_frames)]
+
+    def run(predict):
+        for row in frames:
+            predict(row.reshape(1, -1))
+
+    t_sk = time_call(run, model.predict, repeat=3) / n_frames
+    t_cf = time_call(run, forest.predict, repeat=3) / n_frames
+    print(f"{'por frame':>12} | {t_sk:12.3f} | {t_cf:14.3f} | {t_sk / t_cf:7.1f}x")
+
+
+def benchmark_batches(model, forest, rows, sizes=(10, 100, 1000)):
+    """Latencia por lote de filas."""
+    rng = np.random.default_rng(1)
+    for n in sizes:
+        X = rows[rng.integers(0, len(rows), n)]
+        t_sk = time_call(model.predict, X, repeat=5)
+        t_cf = time_call(forest.predict, X, repeat=5)
+        print(f"{f'lote {n}':>12} | {t_sk:12.3f} | {t_cf:14.3f} | {t_sk / t_cf:7.1f}x")
+
+
+def check_equal(model, forest, rows):
+    """Compara probabilidades y etiquetas sobre el dataset y sobre filas con ruido."""
+    noisy = rows + np.random.default_rng(2).normal(0, 0.05, rows.shape)
+    for X in (rows, noisy):
+        same_proba = np.array_equal(model.predict_proba(X), forest.predict_proba(X))
+        same_label = np.array_equal(model.predict(X), forest.predict(X))
+        if not (same_proba and same_label):
+            return False
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark de inferencia del RandomForest de posturas')
+    parser.add_argument('--modelo', default='modelo_posturas.pkl', help='Modelo entrenado (joblib)')
+    parser.add_argument('--csv', default='dataset_posturas.csv', help='CSV con filas de landmarks')
+    args = parser.parse_args()
+
+    model = joblib.load(args.modelo)
+    t0 = time.perf_counter()
+    forest = CompiledForest(model)
+    compile_ms = (time.perf_counter() - t0) * 1000
+    rows = load_landmark_rows(args.csv)
+    print(f"Modelo: {forest.n_estimators} árboles, {len(forest.feature)} nodos, profundidad {forest.max_depth} "
+          f"(compilado en {compile_ms:.1f} ms)")
+    print(f"Filas de landmarks cargadas: {len(rows)}\n")
+
+    print(f"{'':>12} | {'sklearn (ms)':>12} | {'compilado (ms)':>14} | {'speedup':>8}")
+    benchmark_frame(model, forest, rows)
+    benchmark_batches(model, forest, rows)
+    print(f"\nResultados idénticos a sklearn: {check_equal(model, forest, rows)}")
@@ -0,0 +1,104 @@
+"""
+Benchmark de la lectura de imagen de /api/evaluate_frame (entrada_imagen.py).
+
+Para frames reales de los videos de dataset/ compara los tres formatos de
+request (JSON con data URI base64, cuerpo binario image/jpeg y multipart):
+bytes por frame, tiempo de parseo del request hasta tener el buffer del JPEG y
+tiempo de cv2.imdecode. No levanta el servidor: arma el request WSGI con
+Werkzeug y lo lee con la misma función que usa el endpoint.
+
+Uso:
+    python benchmark_entrada_imagen.py [--frames 30] [--width 640] [--quality 80]
+"""
+
+import argparse
+import base64
+import io
+import json
+from pathlib import Path
+from urllib.parse import urlencode
+
+import cv2
+import numpy as np
+from flask import Request
+from werkzeug.datastructures import FileStorage
+from werkzeug.test import create_environ, encode_multipart
+
+from benchmark_evaluacion import time_call
+from entrada_imagen import read_image_request
+from referencias import VIDEO_EXTENSIONS
+
+REFERENCE_VIDEO = {'condition': 'espondilolisis', 'video_name': 'Puente.mp4', 'current_time': 1.5}
+
+
+def sample_frames(dataset_dir='dataset', n_frames=30, width=640):
+    """Frames BGR repartidos entre los videos del dataset (o sintéticos si no hay videos)."""
+    videos = sorted(p for p in Path(dataset_dir).glob('*/*') if p.suffix.lower() in VIDEO_EXTENSIONS)
+    frames = []
+    for i in range(n_frames):
+        if not videos:
+            break
+        cap = cv2.VideoCapture(str(videos[i % len(videos)]))
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or 1
+        cap.set(cv2.CAP_PROP_POS_FRAMES, (i * 7919) % total)
+        ok, frame = cap.read()
+        cap.release()
+        if ok:
+            frames.append(cv2.resize(frame, (width, int(frame.shape[0] * width / frame.shape[1]))))
+    if not frames:
+        rng = np.random.default_rng(0)
+        frames = [rng.integers(0, 255, (width * 3 // 4, width, 3), dtype=np.uint8) for _ in range(n_frames)]
+    return frames
+
+
+def build_requests(jpeg):
+    """(content_type, cuerpo, query string) de cada formato para un JPEG."""
+    data_uri = 'data:image/jpeg;base64,' + base64.b64encode(jpeg).decode('ascii')
+    boundary, multipart = encode_multipart({
+        'image': FileStorage(io.BytesIO(jpeg), 'frame.jpg', content_type='image/jpeg'),
+        'reference_video': json.dumps(REFERENCE_VIDEO),
+    })
+    return {
+        'json': ('application/json', json.dumps({'image': data_uri, 'reference_video': REFERENCE_VIDEO}).encode(), ''),
+        'binario': ('image/jpeg', jpeg, urlencode({'reference_video': json.dumps(REFERENCE_VIDEO)})),
+        'multipart': (f'multipart/form-data; boundary={boundary}', multipart, ''),
+    }
+
+
+def parse_request(content_type, body, query):
+    environ = create_environ('/api/evaluate_frame', method='POST', content_type=content_type,
+                             query_string=query, input_stream=io.BytesIO(body), content_length=len(body))
+    return read_image_request(Request(environ))
+
+
+def benchmark(frames, quality):
+    results = {name: {'bytes': [], 'parse_ms': [], 'decode_ms': []} for name in ('json', 'binario', 'multipart')}
+    for frame in frames:
+        ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        for name, (content_type, body, query) in build_requests(encoded.tobytes()).items():
+            buf, options, source = parse_request(content_type, body, query)
+            assert source == name and options['reference_video'] == REFERENCE_VIDEO
+            assert cv2.imdecode(buf, cv2.IMREAD_COLOR) is not None
+            results[name]['bytes'].append(len(body))
+            results[name]['parse_ms'].append(time_call(parse_request, content_type, body, query))
+            results[name]['decode_ms'].append(time_call(cv2.imdecode, buf, cv2.IMREAD_COLOR))
+
+    print(f"{'formato':>10} | {'bytes/frame':>11} | {'parseo (ms)':>11} | {'imdecode (ms)':>13} | {'total (ms)':>10}")
+    base = None
+    for name, r in results.items():
+        nbytes, parse, decode = np.mean(r['bytes']), np.median(r['parse_ms']), np.median(r['decode_ms'])
+        base = base or (parse + decode)
+        print(f"{name:>10} | {nbytes:11.0f} | {parse:11.3f} | {decode:13.3f} | {parse + decode:10.3f}"
+              f"  ({base / (parse + decode):.2f}x vs json)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark de lectura de imagen de /api/evaluate_frame')
+    parser.add_argument('--frames', type=int, default=30, help='Frames a probar')
+    parser.add_argument('--width', type=int, default=640, help='Ancho de los frames (se mantiene la proporción)')
+    parser.add_argument('--quality', type=int, default=80, help='Calidad JPEG')
+    args = parser.parse_args()
+
+    frames = sample_frames(n_frames=args.frames, width=args.width)
+    print(f"Frames: {len(frames)} de {frames[0].shape[1]}x{frames[0].shape[0]}, JPEG calidad {args.quality}\n")
+    benchmark(frames, args.quality)
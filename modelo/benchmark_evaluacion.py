@@ -0,0 +1,283 @@
+"""
+Benchmark de los kernels numéricos de evaluate_posture.
+
+Compara el cálculo de la matriz de distancias del DTW par a par
+(align_and_compute_distances por cada par de frames) contra el kernel
+vectorizado frame_distance_matrix, y el DTW de doble bucle original contra
+dtw_distance de dtw.py (bucle sobre listas o anti-diagonales según el tamaño, con
+y sin banda Sakoe-Chiba), verificando que den los mismos resultados.
+
+Con --suite corre en cambio la batería de micro-benchmarks del código numérico
+de evaluate_posture (normalize_by_pelvis, umeyama_similarity,
+align_and_compute_distances, frame_distance_matrix, dtw_distance, el DTW
+incremental y evaluate_posture completo en sus ramas heurística, frame único y
+secuencia) sobre landmarks sintéticos deterministas: caminatas aleatorias
+alrededor de filas reales de dataset_posturas.csv. Barre la longitud del
+buffer del usuario, la ventana de referencia y la longitud de la referencia.
+Con --json guarda los resultados (mediana, p10 y p90 por caso, más la versión
+de Python/NumPy y el commit) y con --compare los contrasta con un archivo
+anterior para seguir mejoras y regresiones.
+
+Uso:
+    python benchmark_evaluacion.py
+    python benchmark_evaluacion.py --suite [--quick] [--json resultados.json] [--compare base.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+
+import numpy as np
+
+from alineacion import align_and_compute_distances, frame_distance_matrix, normalize_by_pelvis, umeyama_similarity
+from dtw import dtw_distance, StreamingSubsequenceDTW, DTW_BAND
+
+# Barridos de la suite (--quick usa el primer y el último valor de cada uno)
+BUFFER_LENGTHS = (1, 3, 5, 10, 30)
+REFERENCE_WINDOWS = (4, 12, 30, 90)
+REFERENCE_LENGTHS = (30, 100, 300, 600)
+# Condiciones con heurística propia en evaluate_posture
+CONDITIONS = ('espondilolisis', 'lumbalgia mecánica inespecífica', 'escoliosis lumbar', 'hernia de disco lumbar')
+# Banda Sakoe-Chiba del caso con banda (la del servidor si DTW_BAND está definida)
+SUITE_BAND = DTW_BAND or 8
+
+
+def load_landmark_rows(csv_path='dataset_posturas.csv'):
+    """Filas reales de landmarks (N, 99) del dataset de entrenamiento."""
+    return np.genfromtxt(csv_path, delimiter=',', skip_header=1, usecols=range(99))
+
+
+def pairwise_distance_matrix(seq_a, seq_b):
+    """Camino original: una alineación por cada par (usuario, referencia)."""
+    fd = np.zeros((len(seq_a), len(seq_b)), dtype=float)
+    for i, a_frame in enumerate(seq_a):
+        for j, b_frame in enumerate(seq_b):
+            try:
+                d = align_and_compute_distances(a_frame, b_frame)
+                fd[i, j] = float(np.mean(d)) if len(d) else float('inf')
+            except Exception:
+                fd[i, j] = float('inf')
+    return fd
+
+
+def loop_dtw_distance(fd):
+    """DTW original de evaluate_posture: doble bucle en Python y reconstrucción del camino."""
+    na, nb = fd.shape
+    dtw = np.full((na+1, nb+1), np.inf)
+    dtw[0,0] = 0.0
+    for i in range(1, na+1):
+        for j in range(1, nb+1):
+            dtw[i,j] = fd[i-1, j-1] + min(dtw[i-1,j], dtw[i,j-1], dtw[i-1,j-1])
+    i, j = na, nb
+    path = []
+    while i > 0 and j > 0:
+        path.append((i-1,j-1))
+        choices = [(dtw[i-1,j-1], i-1, j-1), (dtw[i-1,j], i-1, j), (dtw[i,j-1], i, j-1)]
+        best = min(choices, key=lambda x: x[0])
+        i,j = best[1], best[2]
+    path.reverse()
+    costs = [fd[p] for p in path]
+    return float(np.mean(costs)), float(np.max(costs)), len(path), float(dtw[na, nb])
+
+
+def time_stats(fn, *args, repeat=20):
+    """Mediana, p10 y p90 en milisegundos de `repeat` ejecuciones (tras una de calentamiento)."""
+    fn(*args)
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(*args)
+        times.append((time.perf_counter() - t0) * 1000)
+    p10, median, p90 = np.percentile(times, [10, 50, 90])
+    return {'median_ms': float(median), 'p10_ms': float(p10), 'p90_ms': float(p90), 'repeat': repeat}
+
+
+def time_call(fn, *args, repeat=20):
+    """Mediana en milisegundos de `repeat` ejecuciones."""
+    return time_stats(fn, *args, repeat=repeat)['median_ms']
+
+
+def synthetic_sequence(rows, n_frames, seed, step=0.004, pull=0.05):
+    """Secuencia (n_frames, 33, 3) float32 determinista: caminata aleatoria alrededor de una fila real.
+
+    Cada frame suma un paso gaussiano (desvío `step`) y vuelve una fracción `pull` hacia la
+    fila de partida, así el cuerpo se mueve pero sigue siendo plausible. La misma semilla
+    da siempre la misma secuencia.
+    """
+    rng = np.random.default_rng(seed)
+    base = rows[rng.integers(0, len(rows))].reshape(33, 3).astype(np.float64)
+    current = base.copy()
+    frames = np.empty((n_frames, 33, 3), dtype=np.float32)
+    for i in range(n_frames):
+        current += rng.normal(0.0, step, current.shape) + pull * (base - current)
+        frames[i] = current
+    return frames
+
+
+def benchmark_alignment(rows, sizes=((3, 12), (10, 30), (30, 90))):
+    rng = np.random.default_rng(0)
+    print(f"{'usuario x ref':>14} | {'par a par (ms)':>14} | {'vectorizado (ms)':>16} | {'speedup':>8} | {'dif. máx':>9}")
+    for na, nb in sizes:
+        user_seq = [r.reshape(33, 3) for r in rows[rng.integers(0, len(rows), na)]]
+        ref_seq = [r.reshape(33, 3) for r in rows[rng.integers(0, len(rows), nb)]]
+        t_pair = time_call(pairwise_distance_matrix, user_seq, ref_seq, repeat=5)
+        t_batch = time_call(frame_distance_matrix, user_seq, ref_seq)
+        diff = float(np.max(np.abs(pairwise_distance_matrix(user_seq, ref_seq) - frame_distance_matrix(user_seq, ref_seq))))
+        print(f"{f'{na} x {nb}':>14} | {t_pair:14.3f} | {t_batch:16.3f} | {t_pair / t_batch:7.1f}x | {diff:9.2e}")
+
+
+def benchmark_dtw(rows, sizes=((3, 12), (10, 60), (30, 300), (60, 600)), band=8):
+    rng = np.random.default_rng(1)
+    print(f"{'usuario x ref':>14} | {'bucle (ms)':>10} | {'dtw.py (ms)':>14} | {f'banda {band} (ms)':>14} | {'speedup':>8} | {'igual':>5}")
+    for na, nb in sizes:
+        fd = frame_distance_matrix(rows[rng.integers(0, len(rows), na)], rows[rng.integers(0, len(rows), nb)])
+        t_loop = time_call(loop_dtw_distance, fd, repeat=3)
+        t_fast = time_call(dtw_distance, fd)
+        t_band = time_call(dtw_distance, fd, band)
+        same = loop_dtw_distance(fd) == dtw_distance(fd)
+        print(f"{f'{na} x {nb}':>14} | {t_loop:10.3f} | {t_fast:14.3f} | {t_band:14.3f} | {t_loop / t_fast:7.1f}x | {str(same):>5}")
+
+
+class Suite:
+    """Acumula y muestra los resultados de la batería (un caso por nombre + parámetros)."""
+
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = []
+
+    def run(self, bench, params, fn, *args, repeat=None):
+        detail = ', '.join(f'{k}={v}' for k, v in params.items())
+        try:
+            stats = time_stats(fn, *args, repeat=repeat or self.repeat)
+        except Exception as e:
+            # Se registra igual: un kernel que empieza a fallar también es una regresión
+            self.results.append({'bench': bench, 'params': params, 'error': f'{type(e).__name__}: {e}'})
+            print(f"  {bench:<24} {detail:<40} ERROR {type(e).__name__}: {e}")
+            return
+        self.results.append({'bench': bench, 'params': params, **stats})
+        print(f"  {bench:<24} {detail:<40} {stats['median_ms']:9.4f} ms  (p10 {stats['p10_ms']:.4f}, "
+              f"p90 {stats['p90_ms']:.4f})")
+
+
+def run_suite(rows, quick=False, repeat=30, with_app=True):
+    """Micro-benchmarks del código numérico de evaluate_posture. Devuelve la lista de resultados."""
+    pick = (lambda values: (values[0], values[-1])) if quick else (lambda values: values)
+    suite = Suite(repeat)
+    user = synthetic_sequence(rows, max(BUFFER_LENGTHS), seed=10)
+    reference = synthetic_sequence(rows, max(REFERENCE_LENGTHS), seed=20)
+    frame, ref_frame = user[0].astype(np.float64), reference[0].astype(np.float64)
+
+    print("Kernels de un frame")
+    suite.run('normalize_by_pelvis', {}, normalize_by_pelvis, frame)
+    xy_user, xy_ref = normalize_by_pelvis(frame)[:, :2], normalize_by_pelvis(ref_frame)[:, :2]
+    suite.run('umeyama_similarity', {}, umeyama_similarity, xy_user, xy_ref)
+    suite.run('align_and_compute_dist', {}, align_and_compute_distances, frame, ref_frame)
+
+    print("Matriz de distancias y DTW (buffer del usuario x ventana de referencia)")
+    for buffer_len in pick(BUFFER_LENGTHS):
+        for window in pick(REFERENCE_WINDOWS):
+            params = {'buffer': buffer_len, 'window': window}
+            suite.run('frame_distance_matrix', params, frame_distance_matrix, user[:buffer_len], reference[:window])
+            fd = frame_distance_matrix(user[:buffer_len], reference[:window])
+            suite.run('dtw_distance', params, dtw_distance, fd)
+            suite.run('dtw_distance_banda', dict(params, band=SUITE_BAND), dtw_distance, fd, SUITE_BAND)
+
+    print("DTW incremental (un frame contra toda la referencia)")
+    for ref_len in pick(REFERENCE_LENGTHS):
+        matcher = StreamingSubsequenceDTW(reference[:ref_len])
+        frames = iter(np.tile(user, (1000, 1, 1)))
+        suite.run('streaming_dtw_update', {'reference': ref_len}, lambda: matcher.update(next(frames)))
+
+    if with_app:
+        # evaluate_posture vive en app.py (importarlo no carga MediaPipe ni el modelo)
+        from app import evaluate_posture
+        print("evaluate_posture completo")
+        for condition in CONDITIONS:
+            suite.run('evaluate_heuristica', {'condition': condition}, evaluate_posture, user[0], condition)
+        suite.run('evaluate_frame_unico', {}, evaluate_posture, user[0], CONDITIONS[0], reference[0])
+        for ref_len in pick(REFERENCE_LENGTHS):
+            for buffer_len in pick(BUFFER_LENGTHS):
+                buffer = list(user[:buffer_len])
+                suite.run('evaluate_secuencia', {'reference': ref_len, 'buffer': buffer_len},
+                          lambda: evaluate_posture(buffer[-1], CONDITIONS[0], reference[:ref_len],
+                                                   user_buffer=buffer, reference_index=ref_len // 2))
+    return suite.results
+
+
+def environment():
+    """Versiones y commit para poder comparar resultados entre corridas."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                timeout=5).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'), 'commit': commit, 'python': platform.python_version(),
+            'numpy': np.__version__, 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+            'dtw_band': DTW_BAND}
+
+
+def result_key(result):
+    return result['bench'] + json.dumps(result['params'], sort_keys=True, ensure_ascii=False)
+
+
+def compare_results(base, results, threshold=0.10):
+    """Imprime la variación de la mediana contra `base` (resultados de --json). Devuelve las regresiones."""
+    previous = {result_key(r): r for r in base['results']}
+    regressions = []
+    print(f"\nComparación contra {base['environment'].get('commit')} ({base['environment'].get('timestamp')}):")
+    for result in results:
+        old = previous.get(result_key(result))
+        if old is None or 'error' in old or 'error' in result:
+            if old is not None and 'error' in result and 'error' not in old:
+                print(f"  {result['bench']:<24} REGRESIÓN: ahora falla ({result['error']})")
+                regressions.append(result)
+            continue
+        ratio = result['median_ms'] / old['median_ms'] if old['median_ms'] else float('inf')
+        if ratio > 1 + threshold:
+            mark = 'REGRESIÓN'
+            regressions.append(result)
+        elif ratio < 1 - threshold:
+            mark = 'mejora'
+        else:
+            mark = ''
+        detail = ', '.join(f'{k}={v}' for k, v in result['params'].items())
+        print(f"  {result['bench']:<24} {detail:<40} {old['median_ms']:9.4f} -> {result['median_ms']:9.4f} ms "
+              f"({ratio:5.2f}x) {mark}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks del código numérico de evaluate_posture')
+    parser.add_argument('--suite', action='store_true', help='Batería de micro-benchmarks con barridos')
+    parser.add_argument('--quick', action='store_true', help='Solo los extremos de cada barrido')
+    parser.add_argument('--repeat', type=int, default=30, help='Ejecuciones por caso (default: 30)')
+    parser.add_argument('--json', type=str, default=None, help='Guardar los resultados de la suite en JSON')
+    parser.add_argument('--compare', type=str, default=None, help='JSON de una corrida anterior para comparar')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='Variación relativa de la mediana que cuenta como regresión (default: 0.10)')
+    parser.add_argument('--sin-app', action='store_true', help='No medir evaluate_posture (no importar app.py)')
+    args = parser.parse_args()
+
+    rows = load_landmark_rows()
+    print(f"Filas de landmarks cargadas: {len(rows)}\n")
+    if not args.suite:
+        print("Matriz de distancias del DTW (alineación por par de frames)")
+        benchmark_alignment(rows)
+        print("\nDTW sobre la matriz de distancias")
+        benchmark_dtw(rows)
+        exit(0)
+
+    results = run_suite(rows, quick=args.quick, repeat=args.repeat, with_app=not args.sin_app)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'environment': environment(), 'results': results}, f, ensure_ascii=False, indent=1)
+        print(f"\nResultados guardados en {args.json} ({len(results)} casos)")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare_results(json.load(f), results, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} casos más lentos que la base (>{args.threshold:.0%})")
+            exit(1)
@@ -0,0 +1,281 @@
+"""
+Motor DTW usado por evaluate_posture.
+
+dtw_distance recibe la matriz de distancias entre frames (ver
+alineacion.frame_distance_matrix). Con pocas celdas por anti-diagonal (matrices
+chicas como el buffer de 3 frames x ventana de 12 de evaluate_posture, o una banda
+angosta) la matriz acumulada se llena con el doble bucle original. Si no, se
+llena por anti-diagonales: todas las celdas de una anti-diagonal dependen solo de
+las dos anteriores, así que cada una se calcula con una sola operación vectorizada.
+Ambos caminos dan el mismo resultado (bit a bit).
+Opcionalmente restringe el camino a una banda Sakoe-Chiba.
+"""
+
+import os
+from collections import deque
+from threading import Lock
+
+import numpy as np
+
+from alineacion import normalized_xy
+
+# Ancho de banda Sakoe-Chiba (en frames de referencia) y factor de ventana de referencia
+# usados por evaluate_posture. Sin banda el resultado es idéntico al DTW completo.
+DTW_BAND = int(os.environ['DTW_BAND']) if os.environ.get('DTW_BAND') else None
+DTW_WINDOW_FACTOR = int(os.environ.get('DTW_WINDOW_FACTOR', 3))
+# El doble bucle cuesta por celda y el llenado vectorizado por anti-diagonal (costo fijo de numpy):
+# se usa el bucle mientras haya a lo sumo estas celdas a calcular por anti-diagonal
+# (ver benchmark_evaluacion.py; 3x12 sin banda son 2.4)
+DTW_LOOP_CELLS_PER_DIAGONAL = float(os.environ.get('DTW_LOOP_CELLS_PER_DIAGONAL', 12))
+
+# Modo de comparación temporal: 'ventana' (DTW sobre buffer + ventana alrededor del índice
+# sincronizado por el cliente) o 'streaming' (StreamingSubsequenceDTW incremental)
+DTW_MODE = os.environ.get('DTW_MODE', 'ventana')
+# Factor de olvido del DTW incremental: 0.7 equivale a ~3 frames de memoria (como el buffer)
+STREAMING_DTW_DECAY = float(os.environ.get('STREAMING_DTW_DECAY', 0.7))
+# Posiciones de referencia a cada lado de la última coincidencia que actualiza cada frame
+# (0 = referencia completa) y empeoramiento del coste medio que provoca recorrerla completa
+STREAMING_DTW_BAND = int(os.environ.get('STREAMING_DTW_BAND', 16))
+STREAMING_DTW_RESCAN_FACTOR = float(os.environ.get('STREAMING_DTW_RESCAN_FACTOR', 1.5))
+
+
+def sakoe_chiba_limits(na, nb, band):
+    """Rango [lo, hi] de columnas (1-indexadas) permitido para cada fila 1..na.
+
+    Cada fila cubre su tramo de la diagonal escalada (na x nb) ensanchado `band`
+    columnas a cada lado, de modo que la banda siempre conecta (1,1) con (na,nb).
+    """
+    rows = np.arange(na)
+    lo = (rows * nb) // na + 1 - band
+    hi = -((-(rows + 1) * nb) // na) + band
+    return np.clip(lo, 1, nb), np.clip(hi, 1, nb)
+
+
+def _loop_dtw_distance(fd, limits=None):
+    """dtw_distance con el doble bucle; limits = sakoe_chiba_limits(...) o None."""
+    na, nb = fd.shape
+    cells = fd.tolist()
+    if limits is not None:
+        lo, hi = limits[0].tolist(), limits[1].tolist()
+    inf = float('inf')
+    dtw = [[inf] * (nb + 1) for _ in range(na + 1)]
+    dtw[0][0] = 0.0
+    for i in range(1, na + 1):
+        row, prev, costs = dtw[i], dtw[i - 1], cells[i - 1]
+        j0, j1 = (1, nb) if limits is None else (lo[i - 1], hi[i - 1])
+        for j in range(j0, j1 + 1):
+            row[j] = costs[j - 1] + min(prev[j], row[j - 1], prev[j - 1])
+
+    i, j = na, nb
+    path_costs = []
+    while i > 0 and j > 0:
+        path_costs.append(cells[i - 1][j - 1])
+        diag, up, left = dtw[i - 1][j - 1], dtw[i - 1][j], dtw[i][j - 1]
+        if diag <= up and diag <= left:
+            i, j = i - 1, j - 1
+        elif up <= left:
+            i = i - 1
+        else:
+            j = j - 1
+    costs = np.array(path_costs[::-1])
+    return float(np.mean(costs)), float(np.max(costs)), len(costs), float(dtw[na][nb])
+
+
+def dtw_distance(fd, band=None):
+    """Computa la distancia DTW a partir de fd[i,j] = distancia entre frame i y frame j.
+
+    band: ancho de la banda Sakoe-Chiba (None = sin restricción).
+    Devuelve (avg_distance, max_distance, path_len, total_cost).
+    """
+    fd = np.asarray(fd, dtype=float)
+    if fd.ndim != 2:
+        return None, None, 0, float('inf')
+    na, nb = fd.shape
+    if na == 0 or nb == 0:
+        return None, None, 0, float('inf')
+    if band is not None and int(band) >= nb:
+        band = None  # la banda cubre toda la matriz
+    limits = sakoe_chiba_limits(na, nb, int(band)) if band is not None else None
+    cells = na * nb if limits is None else int((limits[1] - limits[0] + 1).sum())
+    if cells <= DTW_LOOP_CELLS_PER_DIAGONAL * (na + nb):
+        return _loop_dtw_distance(fd, limits)
+
+    # Matriz DTW "sesgada": acc[k, i] = dtw[i, k - i], así cada anti-diagonal k es una fila
+    # contigua y sus tres predecesores son slices de las filas k-1 y k-2
+    acc = np.full((na + nb + 1, na + 1), np.inf)
+    acc[0, 0] = 0.0
+    cost = np.full((na + nb + 1, na + 1), np.inf)
+    ii, jj = np.meshgrid(np.arange(1, na + 1), np.arange(1, nb + 1), indexing='ij')
+    cost[ii + jj, ii] = fd
+
+    if band is not None:
+        lo, hi = limits
+        rows = np.arange(1, na + 1)
+        diagonals = np.arange(na + nb + 1)
+        # en la anti-diagonal k las filas válidas cumplen i + lo_i <= k <= i + hi_i (ambos crecientes)
+        band_first = np.searchsorted(rows + hi, diagonals) + 1
+        band_last = np.searchsorted(rows + lo, diagonals, side='right')
+
+    for k in range(2, na + nb + 1):
+        i0 = max(1, k - nb)
+        i1 = min(na, k - 1)
+        if band is not None:
+            i0 = max(i0, int(band_first[k]))
+            i1 = min(i1, int(band_last[k]))
+            if i0 > i1:
+                continue
+        best_prev = np.minimum(np.minimum(acc[k-1, i0-1:i1], acc[k-1, i0:i1+1]), acc[k-2, i0-1:i1])
+        acc[k, i0:i1+1] = cost[k, i0:i1+1] + best_prev
+
+    # reconstruir la ruta (camino) para obtener longitudes/costes por paso
+    i = na
+    j = nb
+    costs = []
+    while i > 0 and j > 0:
+        costs.append(fd[i-1, j-1])
+        k = i + j
+        diag, up, left = acc[k-2, i-1], acc[k-1, i-1], acc[k-1, i]
+        # mismo desempate que min() sobre [diagonal, arriba, izquierda]
+        if diag <= up and diag <= left:
+            i, j = i-1, j-1
+        elif up <= left:
+            i = i-1
+        else:
+            j = j-1
+
+    if not costs:
+        return None, None, 0, float('inf')
+
+    costs = np.array(costs[::-1])
+    return float(np.mean(costs)), float(np.max(costs)), len(costs), float(acc[na + nb, na])
+
+
+class StreamingSubsequenceDTW:
+    """DTW de subsecuencia (inicio y fin abiertos) que avanza una columna por frame del usuario.
+
+    Mantiene, para cada frame j de la referencia, el coste acumulado del mejor camino
+    que termina en j con el frame actual del usuario. Cada frame nuevo avanza la
+    referencia 0, 1 o 2 posiciones (el paciente puede ir hasta el doble de lento o
+    rápido que el video). El coste anterior se multiplica por `decay` para que
+    los frames viejos se olviden, y la posición con menor coste es el frame
+    de referencia que mejor coincide (no hace falta sincronizar tiempo con el cliente).
+
+    Solo se actualizan las posiciones a `band` frames de la última posición, así cada
+    frame cuesta O(band) y no depende del largo de la referencia ni del historial. Si
+    el coste medio del mejor camino empeora más de `rescan_factor` veces respecto al
+    reciente (el paciente saltó a otra parte del ejercicio), se recalcula la referencia
+    completa con los últimos frames del usuario (los que aún pesan más del 1%).
+    band=0 recorre siempre la referencia completa.
+    """
+
+    MAX_STEP = 2
+
+    def __init__(self, reference_sequence, decay=STREAMING_DTW_DECAY, band=STREAMING_DTW_BAND,
+                 rescan_factor=STREAMING_DTW_RESCAN_FACTOR):
+        self.reference = normalized_xy(reference_sequence)
+        self.decay = float(decay)
+        self.band = max(0, int(band))
+        self.rescan_factor = float(rescan_factor)
+        self.position = 0
+        self.frames_seen = 0
+        self.rescans = 0
+        self._cost = None      # coste acumulado (con olvido) por posición de referencia (inf fuera de la banda)
+        self._max = None       # distancia máxima (con olvido) a lo largo de cada camino
+        self._length = None    # largo (con olvido) de cada camino: suma de los pesos de sus frames
+        self._span = (0, 0)    # posiciones [lo, hi) con coste calculado en el último frame
+        self._recent_avg = None
+        # frames del usuario que se vuelven a recorrer al recalcular la referencia completa
+        if 0 < self.decay < 1:
+            history = int(np.ceil(np.log(0.01) / np.log(self.decay)))
+        else:
+            history = 1 if self.decay <= 0 else 64
+        self._history = deque(maxlen=max(1, min(history, 64)))
+        self._lock = Lock()
+
+    def _distances(self, user, lo=0, hi=None):
+        """Distancia media entre puntos de frames del usuario (k, 33, 2) y reference[lo:hi] -> (k, hi - lo)."""
+        reference = self.reference[lo:hi]
+        m = min(user.shape[1], reference.shape[1])
+        d = np.sqrt(((reference[None, :, :m] - user[:, None, :m]) ** 2).sum(axis=3)).mean(axis=2)
+        d[~np.isfinite(d)] = np.inf
+        return d
+
+    def frame_distances(self, landmarks):
+        """Distancia media entre puntos del frame del usuario contra cada frame de referencia."""
+        return self._distances(normalized_xy([landmarks]))[0]
+
+    def _start(self, c):
+        self._cost = c.copy()
+        self._max = c.copy()
+        self._length = np.ones_like(c)
+        self._span = (0, len(c))
+
+    def _step(self, c, lo, hi):
+        """Avanza un frame (distancias c de las posiciones [lo, hi)); el resto queda sin camino."""
+        positions = np.arange(lo, hi)
+        candidates = np.full((self.MAX_STEP + 1, hi - lo), np.inf)
+        for step in range(self.MAX_STEP + 1):
+            first = max(lo - step, 0)
+            candidates[step, first + step - lo:] = self._cost[first:hi - step]
+        best = np.argmin(candidates, axis=0)
+        source = positions - best
+        valid = source >= 0
+        source = np.clip(source, 0, None)
+        prev_cost = np.where(valid, candidates[best, np.arange(hi - lo)], np.inf)
+        prev_max = np.where(valid, self._max[source], 0.0)
+        prev_length = np.where(valid, self._length[source], 0.0)
+        # fuera de [lo, hi) no hay camino (solo se limpia lo calculado en el frame anterior)
+        old_lo, old_hi = self._span
+        self._cost[old_lo:old_hi] = np.inf
+        self._cost[lo:hi] = c + self.decay * prev_cost
+        self._max[lo:hi] = np.maximum(c, self.decay * prev_max)
+        self._length[lo:hi] = 1.0 + self.decay * prev_length
+        self._span = (lo, hi)
+
+    def _rescan(self):
+        """Recalcula todas las posiciones de la referencia con los frames recientes del usuario."""
+        distances = self._distances(np.stack(self._history))
+        self._start(distances[0])
+        for c in distances[1:]:
+            self._step(c, 0, len(c))
+        self.rescans += 1
+
+    def _best(self):
+        lo, hi = self._span
+        cost = self._cost[lo:hi]
+        if not np.isfinite(cost).any():
+            return None
+        self.position = lo + int(np.argmin(cost))
+        total_cost = float(self._cost[self.position])
+        path_len = float(self._length[self.position])
+        return total_cost / path_len, float(self._max[self.position]), path_len, total_cost
+
+    def update(self, landmarks):
+        """Incorpora un frame del usuario. Devuelve (avg, max, path_len, total_cost) del
+        mejor camino, igual que dtw_distance, y actualiza self.position.
+
+        Con el olvido, path_len es el largo efectivo del camino (cada frame pesa decay**edad),
+        acotado por 1 / (1 - decay); avg = total_cost / path_len como en dtw_distance."""
+        user = normalized_xy([landmarks])
+        with self._lock:
+            self._history.append(user[0])
+            self.frames_seen += 1
+            n = len(self.reference)
+            if self._cost is None:
+                self._start(self._distances(user)[0])
+            else:
+                lo, hi = 0, n
+                if self.band:
+                    lo, hi = max(0, self.position - self.band), min(n, self.position + self.band + 1)
+                self._step(self._distances(user, lo, hi)[0], lo, hi)
+            result = self._best()
+            banded = self._span != (0, n)
+            if banded and (result is None or (self._recent_avg is not None
+                                              and result[0] > self.rescan_factor * self._recent_avg)):
+                self._rescan()
+                result = self._best()
+            if result is None:
+                return None, None, 0, float('inf')
+            avg = result[0]
+            self._recent_avg = avg if self._recent_avg is None else 0.8 * self._recent_avg + 0.2 * avg
+            return result
@@ -0,0 +1,95 @@
+"""
+Lectura de la imagen enviada a /api/evaluate_frame.
+
+Formatos aceptados:
+- Cuerpo binario (Content-Type image/jpeg, image/png, image/webp o
+  application/octet-stream): los bytes del archivo tal cual. Las opciones van
+  en la query string (?reference_video={json} o ?condition=..&video_name=..&current_time=..).
+- multipart/form-data: el archivo en el campo 'image' y las opciones como
+  campos del formulario (mismos nombres que en la query string).
+- JSON {'image': 'data:image/jpeg;base64,...', 'reference_video': {...}}
+  (contrato original, se mantiene como respaldo).
+
+En el cuerpo binario el buffer del request se envuelve con np.frombuffer (sin
+copia) y va directo a cv2.imdecode; en multipart hay una sola lectura del
+archivo subido. Ninguno de los dos pasa por base64 (~33% más de bytes que
+parsear y decodificar).
+"""
+
+import base64
+import json
+
+import numpy as np
+
+from metricas import stage
+
+BINARY_IMAGE_TYPES = ('image/jpeg', 'image/png', 'image/webp', 'application/octet-stream')
+
+
+class ImageRequestError(ValueError):
+    """Request sin imagen o con un formato que no se puede leer (se responde 400)."""
+
+
+def buffer_from_base64(img_b64):
+    """Bytes del archivo de imagen a partir de un data URI o base64 puro (uint8, sin copiar el resultado)."""
+    # Soporta data URI o solo base64
+    with stage('base64_decode'):
+        comma = img_b64.find(',', 0, 100)
+        img_bytes = base64.b64decode(img_b64[comma + 1:] if comma >= 0 else img_b64)
+    return np.frombuffer(img_bytes, np.uint8)
+
+
+def buffer_from_upload(file_storage):
+    """Bytes de un archivo subido por multipart (uint8; una sola lectura del archivo temporal de Werkzeug)."""
+    file_storage.stream.seek(0)
+    return np.frombuffer(file_storage.stream.read(), np.uint8)
+
+
+def options_from_fields(fields):
+    """Opciones de evaluación (reference_video) desde query string o campos de formulario."""
+    options = {}
+    reference_video = fields.get('reference_video')
+    if reference_video:
+        try:
+            options['reference_video'] = json.loads(reference_video)
+        except ValueError:
+            raise ImageRequestError('reference_video must be JSON')
+    elif fields.get('condition') and fields.get('video_name'):
+        options['reference_video'] = {
+            'condition': fields.get('condition'),
+            'video_name': fields.get('video_name'),
+            'current_time': fields.get('current_time', 0),
+        }
+    return options
+
+
+def read_image_request(req):
+    """Devuelve (buffer uint8 con el archivo de imagen, opciones, formato) de un request de Flask.
+
+    formato es 'binario', 'multipart' o 'json'. Lanza ImageRequestError si no hay imagen.
+    """
+    mimetype = req.mimetype
+    if mimetype in BINARY_IMAGE_TYPES:
+        data = req.get_data(cache=False)
+        if not data:
+            raise ImageRequestError('No image provided')
+        return np.frombuffer(data, np.uint8), options_from_fields(req.args), 'binario'
+
+    if mimetype == 'multipart/form-data':
+        upload = req.files.get('image')
+        if upload is None:
+            raise ImageRequestError('No image provided')
+        buf = buffer_from_upload(upload)
+        if not len(buf):
+            raise ImageRequestError('No image provided')
+        fields = req.args.to_dict()
+        fields.update(req.form.to_dict())
+        return buf, options_from_fields(fields), 'multipart'
+
+    payload = req.get_json(silent=True)
+    if not payload or not isinstance(payload, dict):
+        raise ImageRequestError('No JSON payload')
+    img_b64 = payload.get('image')
+    if not img_b64:
+        raise ImageRequestError('No image provided')
+    return buffer_from_base64(img_b64), payload, 'json'
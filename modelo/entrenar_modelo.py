@@ -1,18 +1,80 @@
 import os
-import cv2
 import argparse
 import pandas as pd
-import mediapipe as mp
-from mediapipe.tasks import python
-from mediapipe.tasks.python import vision
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder
 from sklearn.metrics import classification_report
 import joblib
+import json
+import pickle
 from tqdm import tqdm
 
 
+# Parse CLI args
+parser = argparse.ArgumentParser(description='Entrenar modelo desde dataset (imagenes y videos)')
+parser.add_argument('--videos-only', action='store_true', help='Procesar sólo archivos de video y omitir imágenes')
+parser.add_argument('--fps', type=int, default=3, help='Frames por segundo a extraer de cada video (default: 3)')
+parser.add_argument('--from-csv', action='store_true',
+                    help='No procesar dataset/: entrenar con el dataset_posturas.csv existente')
+parser.add_argument('--select-model', action='store_true',
+                    help='Comparar modelos candidatos (precisión vs latencia) y exportar el mejor del frente de Pareto')
+parser.add_argument('--jobs', type=int, default=-1, help='Procesos para la validación cruzada (default: todos)')
+parser.add_argument('--max-accuracy-drop', type=float, default=0.01,
+                    help='Pérdida de precisión CV aceptada frente al mejor candidato a cambio de latencia (default: 0.01)')
+args = parser.parse_args()
+
+
+def train_model(df):
+    """Entrena el clasificador con el DataFrame de landmarks (columnas lm_* + 'clase') y guarda
+    modelo_posturas.pkl y encoder.pkl. Con --select-model compara candidatos (ver seleccion_modelo.py)."""
+    print("\nEntrenando modelo con el dataset generado...")
+    if len(df) < 50:
+        print(f"Advertencia: Dataset muy pequeño ({len(df)} muestras). Se recomiendan al menos 50 por clase.")
+
+    encoder = LabelEncoder()
+    df['clase_num'] = encoder.fit_transform(df['clase'])
+
+    X = df.drop(['clase', 'clase_num'], axis=1)
+    y = df['clase_num']
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+
+    if args.select_model:
+        # Comparar candidatos por precisión, latencia de inferencia y tamaño (ver seleccion_modelo.py)
+        from seleccion_modelo import select_model
+        nombre_modelo, modelo, resultados = select_model(X_train.values, y_train.values, X_test.values, y_test.values,
+                                                         n_jobs=args.jobs, max_accuracy_drop=args.max_accuracy_drop)
+        with open('seleccion_modelo.json', 'w', encoding='utf-8') as f:
+            json.dump({'elegido': nombre_modelo, 'candidatos': resultados}, f, indent=2, ensure_ascii=False)
+        print(f"\nModelo elegido: {nombre_modelo} (resultados en 'seleccion_modelo.json')")
+        if b'seleccion_modelo' in pickle.dumps(modelo):
+            # logistic_norm / knn_norm guardan una referencia a seleccion_modelo.normalize_rows
+            print("NOTA: para cargar este modelo hacen falta seleccion_modelo.py y alineacion.py "
+                  "junto a modelo_posturas.pkl (ver GUIA_ENTRENAMIENTO.md)")
+        X_test = X_test.values
+    else:
+        modelo = RandomForestClassifier(n_estimators=400, max_depth=12, min_samples_leaf=2, random_state=42)
+        modelo.fit(X_train, y_train)
+
+    y_pred = modelo.predict(X_test)
+    print("\nReporte de clasificación:")
+    print(classification_report(y_test, y_pred, target_names=encoder.classes_))
+
+    joblib.dump(modelo, 'modelo_posturas.pkl')
+    joblib.dump(encoder, 'encoder.pkl')
+    print("\nModelo guardado como 'modelo_posturas.pkl'")
+
+
+# Con --from-csv no hace falta dataset/ ni MediaPipe: se entrena con el CSV existente
+if args.from_csv:
+    if not os.path.exists('dataset_posturas.csv'):
+        print("ERROR: no existe dataset_posturas.csv (ejecuta sin --from-csv para generarlo)")
+        exit()
+    df = pd.read_csv('dataset_posturas.csv')
+    print(f"\nDataset cargado desde dataset_posturas.csv: {len(df)} muestras")
+    train_model(df)
+    exit()
+
 # Detectar clases en dataset/ (usar carpetas existentes)
 if not os.path.exists('dataset'):
     print("Error: no existe la carpeta 'dataset/'")
@@ -25,11 +87,11 @@ if not posturas:
 
 print(f"Clases detectadas en dataset/: {posturas}")
 
-# Parse CLI args
-parser = argparse.ArgumentParser(description='Entrenar modelo desde dataset (imagenes y videos)')
-parser.add_argument('--videos-only', action='store_true', help='Procesar sólo archivos de video y omitir imágenes')
-parser.add_argument('--fps', type=int, default=3, help='Frames por segundo a extraer de cada video (default: 3)')
-args = parser.parse_args()
+# OpenCV y MediaPipe solo hacen falta para procesar dataset/ (no con --from-csv)
+import cv2
+import mediapipe as mp
+from mediapipe.tasks import python
+from mediapipe.tasks.python import vision
 
 # Preparar MediaPipe PoseLandmarker
 base_options = python.BaseOptions(model_asset_path='pose_landmarker.task')
@@ -143,24 +205,4 @@ else:
 
 
 # 2) Entrenar modelo con el CSV generado
-print("\nEntrenando modelo con el dataset generado...")
-if len(df) < 50:
-    print(f"Advertencia: Dataset muy pequeño ({len(df)} muestras). Se recomiendan al menos 50 por clase.")
-
-encoder = LabelEncoder()
-df['clase_num'] = encoder.fit_transform(df['clase'])
-
-X = df.drop(['clase', 'clase_num'], axis=1)
-y = df['clase_num']
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-modelo = RandomForestClassifier(n_estimators=400, max_depth=12, min_samples_leaf=2, random_state=42)
-modelo.fit(X_train, y_train)
-
-y_pred = modelo.predict(X_test)
-print("\nReporte de clasificación:")
-print(classification_report(y_test, y_pred, target_names=encoder.classes_))
-
-joblib.dump(modelo, 'modelo_posturas.pkl')
-joblib.dump(encoder, 'encoder.pkl')
-print("\nModelo guardado como 'modelo_posturas.pkl'")
\ No newline at end of file
+train_model(df)
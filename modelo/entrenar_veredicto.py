@@ -0,0 +1,122 @@
+"""
+Entrena el veredicto local (veredicto_local.py) a partir del registro de Groq.
+
+Lee el JSONL que escribe el servidor con GROQ_LOG_PATH (una línea por consulta:
+métricas, veredicto del servidor y veredicto de Groq), ajusta un árbol de
+decisión pequeño que imite a Groq y lo exporta como tabla de reglas JSON que el
+servidor recorre sin sklearn. Muestra la coincidencia con Groq por validación
+cruzada, la del veredicto que dio el servidor (heurístico o local) como
+referencia y la latencia por predicción del modelo exportado.
+
+Uso:
+    GROQ_LOG_PATH=groq_log.jsonl python app.py      # recolectar (con Groq activo)
+    python entrenar_veredicto.py --log groq_log.jsonl [--output veredicto_local.json] [--max-depth 4]
+    VERDICT_ENGINE=local python app.py               # servir con el veredicto local
+"""
+
+import argparse
+import json
+import time
+from collections import Counter
+
+import numpy as np
+from sklearn.model_selection import StratifiedKFold, cross_val_score
+from sklearn.tree import DecisionTreeClassifier, export_text
+
+from veredicto_local import FEATURES, LocalVerdictModel, verdict_features
+
+
+def load_log(path):
+    """Entradas válidas del registro de Groq."""
+    entries = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(entry.get('metrics'), dict) and entry.get('feedback') in ('Bien', 'Mal'):
+                entries.append(entry)
+    return entries
+
+
+def export_tree(tree, y_reasons, leaf_ids):
+    """Nodos del árbol sklearn en el formato de LocalVerdictModel.
+
+    Cada hoja guarda la razón de Groq más frecuente si cubre al menos la mitad de sus
+    consultas; si las razones varían (p. ej. citan la distancia) se deja None y el
+    servidor usa su propia explicación.
+    """
+    t = tree.tree_
+    classes = tree.classes_
+    nodes = []
+    for i in range(t.node_count):
+        if t.children_left[i] == -1:
+            counts = t.value[i][0]
+            label = classes[int(np.argmax(counts))]
+            reasons = Counter(r for r, leaf, y in y_reasons if leaf == i and y == label)
+            reason, count = reasons.most_common(1)[0] if reasons else (None, 0)
+            nodes.append({
+                'feedback': str(label),
+                'reason': reason if count * 2 >= sum(reasons.values()) else None,
+                'confidence': float(counts.max() / counts.sum()),
+                'samples': int(np.sum(leaf_ids == i)),
+            })
+        else:
+            nodes.append({'feature': int(t.feature[i]), 'threshold': float(t.threshold[i]),
+                          'left': int(t.children_left[i]), 'right': int(t.children_right[i])})
+    return nodes
+
+
+def time_predictions(model, entries, repeat=2000):
+    """Microsegundos por predicción del modelo exportado."""
+    metrics = [e['metrics'] for e in entries[:50]]
+    t0 = time.perf_counter()
+    for i in range(repeat):
+        model.predict(metrics[i % len(metrics)])
+    return (time.perf_counter() - t0) / repeat * 1e6
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Destilar el veredicto de Groq en un árbol de decisión local')
+    parser.add_argument('--log', default='groq_log.jsonl', help='Registro JSONL de consultas a Groq (GROQ_LOG_PATH)')
+    parser.add_argument('--output', default='veredicto_local.json', help='Tabla de reglas exportada')
+    parser.add_argument('--max-depth', type=int, default=4, help='Profundidad máxima del árbol (default: 4)')
+    parser.add_argument('--min-samples-leaf', type=int, default=5, help='Muestras mínimas por hoja (default: 5)')
+    args = parser.parse_args()
+
+    entries = load_log(args.log)
+    if len(entries) < 20:
+        print(f"Error: solo {len(entries)} consultas válidas en {args.log}; recolecta más con GROQ_LOG_PATH")
+        exit(1)
+    X = np.array([verdict_features(e['metrics']) for e in entries])
+    y = np.array([e['feedback'] for e in entries])
+    counts = Counter(y)
+    print(f"Consultas: {len(entries)} (Bien: {counts['Bien']}, Mal: {counts['Mal']})")
+
+    tree = DecisionTreeClassifier(max_depth=args.max_depth, min_samples_leaf=args.min_samples_leaf,
+                                  random_state=42)
+    if min(counts.values()) >= 2 and len(counts) == 2:
+        cv = StratifiedKFold(n_splits=min(5, min(counts.values())), shuffle=True, random_state=42)
+        scores = cross_val_score(tree, X, y, cv=cv)
+        print(f"Coincidencia con Groq (CV {cv.n_splits} folds): {scores.mean():.3f} ± {scores.std():.3f}")
+    heuristic = [e.get('local_feedback') == e['feedback'] for e in entries if e.get('local_feedback')]
+    if heuristic:
+        print(f"Coincidencia del veredicto del servidor (heurístico o local) con Groq: {np.mean(heuristic):.3f}")
+
+    tree.fit(X, y)
+    leaf_ids = tree.apply(X)
+    nodes = export_tree(tree, list(zip([e.get('reason') for e in entries], leaf_ids, y)), leaf_ids)
+    print("\nReglas:")
+    print(export_text(tree, feature_names=FEATURES))
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({'features': FEATURES, 'nodes': nodes,
+                   'meta': {'samples': len(entries), 'max_depth': args.max_depth, 'source': args.log,
+                            'trained_at': time.strftime('%Y-%m-%d %H:%M:%S')}},
+                  f, ensure_ascii=False, indent=1)
+
+    model = LocalVerdictModel.load(args.output)
+    same = np.mean([model.predict(e['metrics'])[0] == label for e, label in zip(entries, tree.predict(X))])
+    print(f"Exportado {args.output}: {len(nodes)} nodos, igual a sklearn en {same:.1%} de las consultas, "
+          f"{time_predictions(model, entries):.1f} µs por predicción")
@@ -0,0 +1,286 @@
+"""
+Veredicto de Groq (Bien/Mal + explicación) fuera del camino de la petición.
+
+evaluate_frame ya no espera a Groq: GroqAssessor lanza la consulta en un hilo
+de fondo y devuelve de inmediato el veredicto local, salvo que el de Groq ya
+esté disponible:
+- en la caché LRU, indexada por las métricas cuantizadas (frames parecidos
+  comparten veredicto), o
+- dentro del presupuesto de espera GROQ_WAIT_MS (0 = no esperar).
+Cuando la respuesta llega tarde se entrega por callback (app.py la guarda en la
+sesión y la incluye en la siguiente respuesta como 'llm_verdict').
+
+Las consultas usan una requests.Session con conexiones reutilizables y timeout
+corto. Un circuit breaker deja de consultar durante GROQ_BREAKER_COOLDOWN
+segundos tras GROQ_BREAKER_FAILURES fallos seguidos, y luego prueba con una
+sola consulta.
+
+Con GROQ_LOG_PATH cada respuesta de Groq (métricas, veredicto local y el de
+Groq) se agrega a un archivo JSONL, que entrenar_veredicto.py usa para
+destilar el veredicto local (veredicto_local.py). Con VERDICT_ENGINE=local
+Groq solo audita una fracción GROQ_AUDIT_RATE de los frames (audit()).
+
+Para probar sin red: python groq_stub.py y GROQ_API_URL=http://127.0.0.1:8009/openai/v1/chat/completions
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metricas import stage
+
+GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
+GROQ_API_URL = os.environ.get('GROQ_API_URL', 'https://api.groq.com/openai/v1/chat/completions')
+GROQ_MODEL = os.environ.get('GROQ_MODEL', 'llama-3.1-8b-instant')
+# Timeout de cada consulta (s) y cuánto puede esperar la petición HTTP por el veredicto (ms)
+GROQ_TIMEOUT = float(os.environ.get('GROQ_TIMEOUT', 2.5))
+GROQ_WAIT_MS = float(os.environ.get('GROQ_WAIT_MS', 0))
+GROQ_CACHE_SIZE = int(os.environ.get('GROQ_CACHE_SIZE', 512))
+GROQ_BREAKER_FAILURES = int(os.environ.get('GROQ_BREAKER_FAILURES', 3))
+GROQ_BREAKER_COOLDOWN = float(os.environ.get('GROQ_BREAKER_COOLDOWN', 30))
+GROQ_MAX_CONCURRENT = int(os.environ.get('GROQ_MAX_CONCURRENT', 4))
+# Registro JSONL de consultas (para entrenar_veredicto.py) y fracción de frames auditados con Groq
+GROQ_LOG_PATH = os.environ.get('GROQ_LOG_PATH')
+GROQ_AUDIT_RATE = float(os.environ.get('GROQ_AUDIT_RATE', 0.05))
+
+SYSTEM_PROMPT = (
+    "Eres un verificador de movimiento para ejercicios de fisioterapia. "
+    "Decide 'Bien' o 'Mal' usando métricas numéricas. "
+    "Responde SOLO en JSON: {\"is_good\": bool, \"reason\": string}."
+)
+
+# Paso de cuantización por métrica para la clave de caché
+QUANT_STEPS = {'avg_distance': 0.005, 'max_distance': 0.01, 'pose_size': 0.02}
+
+
+def quantize_metrics(metrics):
+    """Clave de caché: métricas numéricas redondeadas a su paso, el resto tal cual."""
+    key = []
+    for name in sorted(metrics):
+        value = metrics[name]
+        step = QUANT_STEPS.get(name)
+        if step and isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = round(round(value / step) * step, 6)
+        key.append((name, value))
+    return tuple(key)
+
+
+class CircuitBreaker:
+    """Cerrado -> abierto tras `max_failures` fallos seguidos -> semiabierto (una prueba) tras `cooldown_s`."""
+
+    def __init__(self, max_failures=GROQ_BREAKER_FAILURES, cooldown_s=GROQ_BREAKER_COOLDOWN):
+        self.max_failures = max_failures
+        self.cooldown_s = cooldown_s
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.trips = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'cerrado'
+        if time.monotonic() - self.opened_at >= self.cooldown_s:
+            return 'semiabierto'
+        return 'abierto'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'cerrado':
+                return True
+            if state == 'semiabierto' and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.max_failures:
+                if self.opened_at is None:
+                    self.trips += 1
+                self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+
+
+class GroqAssessor:
+    """Consultas a Groq en segundo plano con caché LRU, deduplicación y circuit breaker."""
+
+    def __init__(self, api_key=GROQ_API_KEY, url=GROQ_API_URL, model=GROQ_MODEL, timeout=GROQ_TIMEOUT,
+                 wait_ms=GROQ_WAIT_MS, cache_size=GROQ_CACHE_SIZE, max_concurrent=GROQ_MAX_CONCURRENT,
+                 breaker=None, log_path=GROQ_LOG_PATH, audit_rate=GROQ_AUDIT_RATE):
+        self.api_key = api_key
+        self.url = url
+        self.model = model
+        self.timeout = timeout
+        self.wait_ms = wait_ms
+        self.cache_size = cache_size
+        self.log_path = log_path
+        self.audit_rate = audit_rate
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrent)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix='groq')
+        self._cache = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+        self.counters = {'cache_hits': 0, 'inline': 0, 'deferred': 0, 'calls': 0, 'errors': 0,
+                         'breaker_open': 0, 'audits': 0, 'audit_agreements': 0, 'latency_ms_total': 0.0}
+
+    @property
+    def enabled(self):
+        return bool(self.api_key)
+
+    def _request(self, metrics):
+        """Consulta HTTP a Groq; devuelve (feedback, reason) o lanza excepción."""
+        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        body = {
+            "model": self.model,
+            "temperature": 0.2,
+            "response_format": {"type": "json_object"},
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": json.dumps({"metrics": metrics}, ensure_ascii=False)}
+            ]
+        }
+        with stage('groq'):
+            resp = self.session.post(self.url, headers=headers, json=body, timeout=self.timeout)
+            resp.raise_for_status()
+        data = resp.json()
+        content = data.get("choices", [{}])[0].get("message", {}).get("content", "{}")
+        parsed = json.loads(content)
+        return ("Bien" if bool(parsed.get("is_good", False)) else "Mal"), str(parsed.get("reason", ""))
+
+    def _log(self, metrics, local_feedback, verdict, latency_ms):
+        entry = {'ts': time.time(), 'metrics': metrics, 'local_feedback': local_feedback,
+                 'feedback': verdict[0], 'reason': verdict[1], 'latency_ms': round(latency_ms, 1)}
+        try:
+            with self._log_lock, open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        except OSError as e:
+            print(f"WARN: No se pudo escribir el registro de Groq {self.log_path}: {e}")
+
+    def _call(self, key, metrics, local_feedback=None):
+        t0 = time.perf_counter()
+        try:
+            verdict = self._request(metrics)
+        except Exception as e:
+            self.breaker.failure()
+            with self._lock:
+                self.counters['errors'] += 1
+                self._pending.pop(key, None)
+            print(f"WARN: Groq no respondió ({type(e).__name__}: {e})")
+            return None
+        self.breaker.success()
+        latency_ms = (time.perf_counter() - t0) * 1000
+        if self.log_path:
+            self._log(metrics, local_feedback, verdict, latency_ms)
+        with self._lock:
+            self.counters['calls'] += 1
+            self.counters['latency_ms_total'] += latency_ms
+            self._cache[key] = verdict
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            self._pending.pop(key, None)
+        return verdict
+
+    def _submit(self, key, metrics, local_feedback):
+        """Consulta en curso para `key`, o una nueva si el breaker lo permite (None si no). Con self._lock tomado."""
+        future = self._pending.get(key)
+        if future is None and self.breaker.allow():
+            future = self._executor.submit(self._call, key, dict(metrics), local_feedback)
+            self._pending[key] = future
+        return future
+
+    def assess(self, metrics, default_feedback, default_reason, on_result=None):
+        """Devuelve (feedback, reason, fuente) sin bloquear más de wait_ms.
+
+        fuente: 'groq_cache' o 'groq' si el veredicto de Groq estaba disponible, 'local' si
+        no (sin API key, breaker abierto o respuesta aún en camino). En este último caso,
+        cuando llega la respuesta se llama on_result(feedback, reason, metrics).
+        """
+        if not self.enabled:
+            return default_feedback, default_reason, 'local'
+        key = quantize_metrics(metrics)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.counters['cache_hits'] += 1
+                return cached[0], cached[1] or default_reason, 'groq_cache'
+            future = self._submit(key, metrics, default_feedback)
+            if future is None:
+                self.counters['breaker_open'] += 1
+                return default_feedback, default_reason, 'local'
+
+        if self.wait_ms > 0:
+            try:
+                verdict = future.result(timeout=self.wait_ms / 1000)
+            except Exception:
+                verdict = None
+            if verdict is not None:
+                with self._lock:
+                    self.counters['inline'] += 1
+                return verdict[0], verdict[1] or default_reason, 'groq'
+
+        with self._lock:
+            self.counters['deferred'] += 1
+        if on_result is not None:
+            def deliver(done):
+                verdict = done.result()
+                if verdict is not None:
+                    on_result(verdict[0], verdict[1] or default_reason, metrics)
+            future.add_done_callback(deliver)
+        return default_feedback, default_reason, 'local'
+
+    def audit(self, metrics, local_feedback):
+        """Con probabilidad audit_rate compara el veredicto local con el de Groq (en segundo plano,
+        sin afectar la respuesta). Las coincidencias quedan en stats() y, con GROQ_LOG_PATH, en el registro."""
+        if not self.enabled or random.random() >= self.audit_rate:
+            return
+        key = quantize_metrics(metrics)
+
+        def compare(verdict):
+            if verdict is not None:
+                with self._lock:
+                    self.counters['audits'] += 1
+                    if verdict[0] == local_feedback:
+                        self.counters['audit_agreements'] += 1
+
+        with self._lock:
+            cached = self._cache.get(key)
+            future = self._submit(key, metrics, local_feedback) if cached is None else None
+        if cached is not None:
+            compare(cached)
+        elif future is not None:
+            future.add_done_callback(lambda done: compare(done.result()))
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            latency_total = counters.pop('latency_ms_total')
+            counters['avg_latency_ms'] = latency_total / counters['calls'] if counters['calls'] else None
+            counters['audit_agreement'] = (counters['audit_agreements'] / counters['audits']
+                                           if counters['audits'] else None)
+            counters.update(enabled=self.enabled, cache_size=len(self._cache), pending=len(self._pending),
+                            breaker=self.breaker.state, breaker_trips=self.breaker.trips)
+            return counters
@@ -0,0 +1,187 @@
+"""
+Codificación adaptativa del feed de video por Socket.IO.
+
+El cliente (templates/index.html) confirma cada frame dibujado con 'feed_ack'.
+Con esas confirmaciones AdaptiveFeed mide cuántos frames hay en vuelo, el tiempo
+de ida y vuelta y el throughput hacia el cliente: si los frames se acumulan (la
+red o el cliente no dan abasto) baja primero la calidad JPEG y después la
+resolución; si va holgado, sube la resolución y luego la calidad.
+Con demasiados frames en vuelo deja de mandar imagen (solo landmarks) hasta que
+el cliente se ponga al día. Si no llegan confirmaciones (clientes que no envían
+'feed_ack') se mantiene la calidad actual y no se descartan imágenes.
+
+Cada cliente Socket.IO tiene su propio AdaptiveFeed (FeedClients): un cliente lento
+baja la calidad solo de su feed. Los clientes con la misma calidad y escala
+comparten el JPEG de cada frame.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Modo del feed 'video_feed': 'base64' (JPEG con el esqueleto dibujado en el servidor, data URI),
+# 'binario' (JPEG sin dibujar como adjunto binario + landmarks) o 'landmarks' (sin imagen)
+FEED_MODE = os.environ.get('FEED_MODE', 'binario')
+FEED_JPEG_QUALITY = int(os.environ.get('FEED_JPEG_QUALITY', 80))
+FEED_MIN_QUALITY = int(os.environ.get('FEED_MIN_QUALITY', 35))
+FEED_MAX_QUALITY = int(os.environ.get('FEED_MAX_QUALITY', 90))
+# Escalas de resolución permitidas, de mayor a menor
+FEED_SCALES = (1.0, 0.75, 0.5, 0.35)
+
+
+def pack_landmarks(landmarks):
+    """Landmarks (33, 3) como bytes float32 little-endian (396 bytes; Float32Array en el cliente)."""
+    return np.asarray(landmarks, dtype='<f4').tobytes()
+
+
+class AdaptiveFeed:
+    """Calidad y resolución del JPEG del feed según el ritmo con que el cliente confirma frames."""
+
+    def __init__(self, quality=FEED_JPEG_QUALITY, min_quality=FEED_MIN_QUALITY, max_quality=FEED_MAX_QUALITY,
+                 scales=FEED_SCALES, max_in_flight=3, max_rtt_ms=250, adjust_interval=0.5, quality_step=10):
+        self.quality = quality
+        self.min_quality = min_quality
+        self.max_quality = max_quality
+        self.scales = scales
+        self.scale_index = 0
+        self.max_in_flight = max_in_flight
+        self.max_rtt_ms = max_rtt_ms
+        self.adjust_interval = adjust_interval
+        self.quality_step = quality_step
+        self.seq = 0
+        self.last_acked = 0
+        self.skipped = 0
+        self._last_ack_time = None
+        self._pending = OrderedDict()  # seq -> (t_envío, bytes)
+        self._window = {'sent': 0, 'acked': 0, 'acked_bytes': 0, 'started': time.perf_counter()}
+        self._last = {'send_fps': None, 'ack_fps': None, 'client_kbps': None, 'rtt_ms': None}
+        self._lock = threading.Lock()
+
+    @property
+    def scale(self):
+        return self.scales[self.scale_index]
+
+    @property
+    def in_flight(self):
+        return self.seq - self.last_acked
+
+    def _client_acking(self, now=None):
+        now = time.perf_counter() if now is None else now
+        return self._last_ack_time is not None and now - self._last_ack_time < 2.0
+
+    def encode(self, frame, cache=None):
+        """JPEG del frame con la calidad/escala actual, o None si el cliente va muy atrasado.
+        cache: dict (calidad, escala) -> JPEG compartido entre los clientes de un mismo frame."""
+        import cv2
+        if self._client_acking() and self.in_flight > 2 * self.max_in_flight:
+            self.skipped += 1
+            return None
+        key = (int(self.quality), self.scale)
+        if cache is not None and key in cache:
+            return cache[key]
+        if self.scale < 1.0:
+            frame = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, key[0]])
+        jpg = buffer.tobytes() if ok else None
+        if cache is not None:
+            cache[key] = jpg
+        return jpg
+
+    def sent(self, nbytes):
+        """Registra un envío y devuelve su número de secuencia (el cliente lo confirma con feed_ack)."""
+        with self._lock:
+            self.seq += 1
+            self._pending[self.seq] = (time.perf_counter(), nbytes)
+            while len(self._pending) > 64:
+                self._pending.popitem(last=False)
+            self._window['sent'] += 1
+            self._maybe_adjust()
+            return self.seq
+
+    def ack(self, seq):
+        """Confirmación del cliente: frame `seq` recibido y dibujado."""
+        with self._lock:
+            if seq <= self.last_acked:
+                return
+            # las confirmaciones son acumulativas: lo anterior a seq ya no está en vuelo
+            # (el cliente descartó esos frames sin dibujarlos, no cuentan como consumidos)
+            for old in [s for s in self._pending if s < seq]:
+                del self._pending[old]
+            if seq in self._pending:
+                t_sent, nbytes = self._pending.pop(seq)
+                self._window['acked'] += 1
+                self._window['acked_bytes'] += nbytes
+                rtt = (time.perf_counter() - t_sent) * 1000
+                prev = self._last['rtt_ms']
+                self._last['rtt_ms'] = rtt if prev is None else 0.8 * prev + 0.2 * rtt
+            self.last_acked = seq
+            self._last_ack_time = time.perf_counter()
+            self._maybe_adjust()
+
+    def _maybe_adjust(self):
+        now = time.perf_counter()
+        elapsed = now - self._window['started']
+        if elapsed < self.adjust_interval:
+            return
+        send_fps = self._window['sent'] / elapsed
+        ack_fps = self._window['acked'] / elapsed
+        self._last.update(send_fps=send_fps, ack_fps=ack_fps,
+                          client_kbps=self._window['acked_bytes'] * 8 / 1000 / elapsed)
+        self._window = {'sent': 0, 'acked': 0, 'acked_bytes': 0, 'started': now}
+        if not self._client_acking(now):
+            return
+
+        rtt = self._last['rtt_ms']
+        if self.in_flight > self.max_in_flight or (rtt is not None and rtt > self.max_rtt_ms):
+            # frames acumulándose hacia el cliente: bajar calidad y, si ya es mínima, resolución
+            if self.quality > self.min_quality:
+                self.quality = max(self.min_quality, self.quality - self.quality_step)
+            elif self.scale_index < len(self.scales) - 1:
+                self.scale_index += 1
+        elif self.in_flight <= 1 and (rtt is None or rtt < self.max_rtt_ms / 2):
+            # cliente holgado: recuperar resolución y después calidad
+            if self.scale_index > 0:
+                self.scale_index -= 1
+            elif self.quality < self.max_quality:
+                self.quality = min(self.max_quality, self.quality + self.quality_step // 2)
+
+    def stats(self):
+        with self._lock:
+            return {'mode': FEED_MODE, 'quality': self.quality, 'scale': self.scale, 'in_flight': self.in_flight,
+                    'sent': self.seq, 'acked': self.last_acked, 'skipped_images': self.skipped, **self._last}
+
+
+class FeedClients:
+    """Un AdaptiveFeed por cliente Socket.IO (sid)."""
+
+    def __init__(self, **feed_options):
+        self.feed_options = feed_options
+        self._feeds = {}
+        self._lock = threading.Lock()
+
+    def add(self, sid):
+        with self._lock:
+            return self._feeds.setdefault(sid, AdaptiveFeed(**self.feed_options))
+
+    def remove(self, sid):
+        with self._lock:
+            self._feeds.pop(sid, None)
+
+    def ack(self, sid, seq):
+        with self._lock:
+            feed = self._feeds.get(sid)
+        if feed is not None:
+            feed.ack(seq)
+
+    def items(self):
+        with self._lock:
+            return list(self._feeds.items())
+
+    def __len__(self):
+        return len(self._feeds)
+
+    def stats(self):
+        return {'mode': FEED_MODE, 'clients': {sid: feed.stats() for sid, feed in self.items()}}
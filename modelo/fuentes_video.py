@@ -0,0 +1,288 @@
+"""
+Fuentes de frames para el stream de video (video_stream en app.py).
+
+FRAME_SOURCE elige de dónde salen los frames:
+- 'camara' (default): cámara local. Un hilo lee la cámara sin parar y solo
+  conserva el último frame, así read() nunca devuelve frames viejos del buffer
+  del driver. Resolución, FPS, MJPEG y tamaño del buffer del driver se fijan
+  solo si se definen las variables CAMERA_* (si no, los de la cámara).
+- 'archivo': reproduce un video o todos los videos de una carpeta
+  (FRAME_SOURCE_PATH, por defecto dataset/) al ritmo del video
+  (FRAME_SOURCE_SPEED=1), más rápido o más lento (2, 0.5) o sin pausas ('max').
+  A ritmo real los frames atrasados se saltan, como haría una cámara.
+- 'sintetica': frames generados (un degradado con una franja que se mueve), sin
+  cámara ni archivos. No contiene una persona: sirve para medir el pipeline en
+  un servidor sin cámara.
+
+Todas tienen la misma interfaz: read() devuelve el siguiente frame BGR o None
+cuando la fuente terminó, close() la libera y stats() resume lo leído.
+OpenCV se importa al abrir la fuente (no al importar el módulo; ver LAZY_STARTUP en app.py).
+"""
+
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from referencias import VIDEO_EXTENSIONS
+
+FRAME_SOURCE = os.environ.get('FRAME_SOURCE', 'camara')
+FRAME_SOURCE_PATH = os.environ.get('FRAME_SOURCE_PATH', 'dataset')
+# Velocidad de reproducción de 'archivo' (1 = tiempo real; 'max' o 0 = sin pausas)
+FRAME_SOURCE_SPEED = os.environ.get('FRAME_SOURCE_SPEED', '1')
+FRAME_SOURCE_LOOP = os.environ.get('FRAME_SOURCE_LOOP', '1') == '1'
+
+CAMERA_INDEX = int(os.environ.get('CAMERA_INDEX', 0))
+# 0 = no se fija (lo que entregue la cámara)
+CAMERA_WIDTH = int(os.environ.get('CAMERA_WIDTH', 0))
+CAMERA_HEIGHT = int(os.environ.get('CAMERA_HEIGHT', 0))
+CAMERA_FPS = float(os.environ.get('CAMERA_FPS', 0))
+CAMERA_BUFFERSIZE = int(os.environ.get('CAMERA_BUFFERSIZE', 0))
+CAMERA_MJPEG = os.environ.get('CAMERA_MJPEG', '0') == '1'
+
+SYNTHETIC_FPS = float(os.environ.get('SYNTHETIC_FPS', 30))
+
+# Segundos sin frames de la cámara tras los que read() avisa (y sigue esperando)
+CAMERA_STALL_WARNING = 5.0
+
+
+def parse_speed(value):
+    """'max' -> 0 (sin pausas); un número -> factor de velocidad."""
+    if str(value).strip().lower() in ('max', 'maximo', 'máximo'):
+        return 0.0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        print(f"WARN: FRAME_SOURCE_SPEED inválido ({value!r}); se usa tiempo real")
+        return 1.0
+
+
+class _SourceStats:
+    """Contadores comunes de las fuentes."""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.frames = 0
+        self.dropped = 0
+        self.frame_size = None
+        self.started = time.perf_counter()
+
+    def delivered(self, frame):
+        self.frames += 1
+        self.frame_size = [frame.shape[1], frame.shape[0]]
+
+    def stats(self):
+        wall = max(1e-9, time.perf_counter() - self.started)
+        return {'kind': self.kind, 'frames': self.frames, 'dropped': self.dropped,
+                'fps': self.frames / wall, 'frame_size': self.frame_size}
+
+
+class CameraSource(_SourceStats):
+    """Cámara con un hilo lector: read() devuelve siempre el frame más reciente.
+
+    Los frames que la cámara entrega mientras el pipeline está ocupado se
+    reemplazan por el siguiente y se cuentan en 'dropped'."""
+
+    def __init__(self, index=CAMERA_INDEX, width=CAMERA_WIDTH, height=CAMERA_HEIGHT, fps=CAMERA_FPS,
+                 mjpeg=CAMERA_MJPEG, buffersize=CAMERA_BUFFERSIZE):
+        import cv2
+        super().__init__('camara')
+        self.index = index
+        self.cap = cv2.VideoCapture(index)
+        if mjpeg:
+            self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+        if width and height:
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        if fps:
+            self.cap.set(cv2.CAP_PROP_FPS, fps)
+        if buffersize:
+            # no todos los backends lo respetan; el hilo lector ya descarta los frames viejos
+            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, buffersize)
+        self.captured = 0
+        self._frame = None
+        self._seq = 0
+        self._returned_seq = 0
+        self._ended = not self.cap.isOpened()
+        self._cond = threading.Condition()
+        if self._ended:
+            print(f"WARN: No se pudo abrir la cámara {index}")
+            self._thread = None
+        else:
+            self._thread = threading.Thread(target=self._grab, name='camara', daemon=True)
+            self._thread.start()
+
+    def _grab(self):
+        while True:
+            ret, frame = self.cap.read()
+            with self._cond:
+                if not ret or self._ended:
+                    self._ended = True
+                    self._cond.notify_all()
+                    return
+                if self._seq > self._returned_seq:
+                    self.dropped += 1  # el anterior no llegó a leerse
+                self._frame = frame
+                self._seq += 1
+                self.captured += 1
+                self._cond.notify_all()
+
+    def read(self):
+        with self._cond:
+            # Una cámara lenta al arrancar no termina el stream: se avisa y se sigue esperando
+            while not self._cond.wait_for(lambda: self._ended or self._seq > self._returned_seq,
+                                          timeout=CAMERA_STALL_WARNING):
+                print(f"WARN: La cámara {self.index} no entregó frames en {CAMERA_STALL_WARNING:.0f} s; esperando")
+            if self._seq <= self._returned_seq:
+                return None  # terminó sin frames pendientes
+            frame = self._frame
+            self._returned_seq = self._seq
+        self.delivered(frame)
+        return frame
+
+    def close(self):
+        with self._cond:
+            self._ended = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+        self.cap.release()
+
+    def stats(self):
+        import cv2
+        data = super().stats()
+        data.update(captured=self.captured,
+                    camera={'index': self.index,
+                            'width': self.cap.get(cv2.CAP_PROP_FRAME_WIDTH),
+                            'height': self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT),
+                            'fps': self.cap.get(cv2.CAP_PROP_FPS)})
+        return data
+
+
+def video_files(path):
+    """Videos de un archivo o de una carpeta (recursivo, en orden)."""
+    path = Path(path)
+    if path.is_dir():
+        return sorted(p for p in path.rglob('*') if p.is_file() and p.suffix.lower() in VIDEO_EXTENSIONS)
+    return [path] if path.is_file() else []
+
+
+class FileSource(_SourceStats):
+    """Reproduce videos como si fueran una cámara, al ritmo de cada video por `speed`.
+
+    speed=0 lee sin pausas. A ritmo real, si read() llega tarde se saltan (grab)
+    los frames que ya "pasaron" y se cuentan en 'dropped'."""
+
+    def __init__(self, path=FRAME_SOURCE_PATH, speed=FRAME_SOURCE_SPEED, loop=FRAME_SOURCE_LOOP):
+        super().__init__('archivo')
+        self.paths = video_files(path)
+        self.speed = parse_speed(speed)
+        self.loop = loop
+        self.current = None
+        self._next = 0
+        self.cap = None
+        if not self.paths:
+            print(f"WARN: No hay videos en {path}")
+
+    def _open_next(self):
+        import cv2
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+        for _ in range(len(self.paths)):
+            if self._next >= len(self.paths):
+                if not self.loop:
+                    return False
+                self._next = 0
+            path = self.paths[self._next]
+            self._next += 1
+            cap = cv2.VideoCapture(str(path))
+            if not cap.isOpened():
+                print(f"WARN: No se pudo abrir {path}")
+                continue
+            self.cap = cap
+            self.current = path
+            self._fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+            self._index = 0
+            self._t0 = time.perf_counter()
+            return True
+        return False
+
+    def read(self):
+        empty = 0  # videos seguidos sin frames (evita girar en falso con loop)
+        while empty <= len(self.paths):
+            if self.cap is None and not self._open_next():
+                return None
+            if self.speed > 0:
+                # Frame que corresponde al tiempo transcurrido; se saltan los atrasados
+                due = (time.perf_counter() - self._t0) * self.speed * self._fps
+                while self._index + 1 < due and self.cap.grab():
+                    self._index += 1
+                    self.dropped += 1
+                wait = self._index / (self._fps * self.speed) - (time.perf_counter() - self._t0)
+                if wait > 0:
+                    time.sleep(wait)
+            ret, frame = self.cap.read()
+            if not ret:
+                empty = empty + 1 if self._index == 0 else 0
+                self.cap.release()
+                self.cap = None
+                continue
+            self._index += 1
+            self.delivered(frame)
+            return frame
+        return None
+
+    def close(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+    def stats(self):
+        data = super().stats()
+        data.update(videos=len(self.paths), current=str(self.current) if self.current else None,
+                    speed=self.speed or 'max')
+        return data
+
+
+class SyntheticSource(_SourceStats):
+    """Frames generados a `fps` (0 = sin pausas): degradado fijo con una franja móvil."""
+
+    def __init__(self, width=CAMERA_WIDTH or 640, height=CAMERA_HEIGHT or 480, fps=SYNTHETIC_FPS):
+        super().__init__('sintetica')
+        self.fps = fps
+        gradient = np.linspace(40, 200, width, dtype=np.uint8)
+        self._base = np.dstack([np.tile(gradient, (height, 1)),
+                                np.tile(gradient[::-1], (height, 1)),
+                                np.full((height, width), 90, np.uint8)])
+        self._t0 = time.perf_counter()
+
+    def read(self):
+        import cv2
+        if self.fps > 0:
+            wait = self.frames / self.fps - (time.perf_counter() - self._t0)
+            if wait > 0:
+                time.sleep(wait)
+        frame = self._base.copy()  # las etapas siguientes dibujan sobre el frame
+        width = frame.shape[1]
+        x = (self.frames * 8) % width
+        frame[:, x:x + 24] = 255
+        cv2.putText(frame, str(self.frames), (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 0), 2)
+        self.delivered(frame)
+        return frame
+
+    def close(self):
+        pass
+
+
+def open_frame_source(kind=FRAME_SOURCE):
+    """Fuente de frames según FRAME_SOURCE ('camara', 'archivo' o 'sintetica')."""
+    if kind == 'archivo':
+        return FileSource()
+    if kind == 'sintetica':
+        return SyntheticSource()
+    if kind != 'camara':
+        print(f"WARN: FRAME_SOURCE desconocido ({kind!r}); se usa la cámara")
+    return CameraSource()
@@ -0,0 +1,145 @@
+"""
+Grabador de solicitudes lentas ("flight recorder").
+
+Desactivado por defecto: se activa con SLOW_REQUEST_MS > 0 (p. ej. 750). Las
+grabaciones contienen las imágenes de la cámara del paciente y sus landmarks, así
+que solo debe activarse para diagnosticar y borrar FLIGHT_RECORDER_DIR después.
+
+Con el grabador activo, toda evaluación (/api/evaluate_frame, /api/evaluate_landmarks o un frame del
+stream de cámara) que tarda más de SLOW_REQUEST_MS se guarda completa en
+FLIGHT_RECORDER_DIR, como un .npz por solicitud:
+- body: los bytes tal cual llegaron (JPEG, multipart, JSON o landmarks binarios)
+- meta: JSON con endpoint, método, content type, query string, latencia,
+  respuesta (status, postura, feedback) y el estado de la sesión al empezar
+  (índice de referencia, tolerancia, fps, DTW_MODE, VERDICT_ENGINE)
+- reference_sequence / reference_landmarks / user_buffer: arrays float32 de
+  la sesión al empezar la solicitud
+
+El estado se copia al empezar (lo cambia la propia solicitud) y el archivo se
+escribe en un hilo aparte para no sumar latencia. Se conservan como máximo
+FLIGHT_RECORDER_MAX archivos (se borran los más viejos).
+
+reproducir_solicitudes.py vuelve a ejecutar las grabaciones contra el código actual.
+"""
+
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from landmarks import sequence_array, frame_array
+
+# Umbral de latencia para grabar (ms); 0 = grabador desactivado (default)
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 0))
+FLIGHT_RECORDER_DIR = Path(os.environ.get('FLIGHT_RECORDER_DIR', 'grabaciones_lentas'))
+FLIGHT_RECORDER_MAX = int(os.environ.get('FLIGHT_RECORDER_MAX', 50))
+
+# Endpoints HTTP cuyas solicitudes se graban
+RECORDED_ENDPOINTS = ('evaluate_frame', 'evaluate_landmarks')
+
+
+def session_snapshot(state, buffer_name='user_buffer'):
+    """Copia del estado de la sesión que afecta la evaluación (arrays inmutables o copiados).
+    buffer_name: buffer de landmarks recientes a guardar ('stream_buffer' para la cámara)."""
+    with state.lock:
+        user_buffer = list(getattr(state, buffer_name))
+    return {
+        'reference_sequence': state.reference_sequence,
+        'reference_landmarks': state.reference_landmarks,
+        'user_buffer': user_buffer,
+        'reference_index': int(state.reference_index),
+        'reference_fps': state.reference_fps,
+        'tolerance': float(state.tolerance),
+    }
+
+
+class FlightRecorder:
+    """Guarda en disco las solicitudes más lentas que threshold_ms."""
+
+    def __init__(self, directory=FLIGHT_RECORDER_DIR, threshold_ms=SLOW_REQUEST_MS, max_files=FLIGHT_RECORDER_MAX):
+        self.directory = Path(directory)
+        self.threshold_ms = threshold_ms
+        self.max_files = max_files
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='grabador')
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+        self.recorded = 0
+        self.last = None
+
+    @property
+    def enabled(self):
+        return self.threshold_ms > 0
+
+    def is_slow(self, elapsed_ms):
+        return self.enabled and elapsed_ms >= self.threshold_ms
+
+    def record(self, body, meta, snapshot):
+        """Agenda la escritura de una grabación (body: bytes; meta: dict JSON; snapshot: session_snapshot)."""
+        meta = dict(meta, recorded_at=time.time(), session={
+            k: snapshot[k] for k in ('reference_index', 'reference_fps', 'tolerance')})
+        self._executor.submit(self._write, bytes(body or b''), meta, snapshot)
+
+    def _write(self, body, meta, snapshot):
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{next(self._sequence):04d}-{meta.get('endpoint')}"
+            path = self.directory / f"{name}.npz"
+            reference_landmarks = snapshot['reference_landmarks']
+            with open(path, 'wb') as f:
+                np.savez(f,
+                         meta=np.array(json.dumps(meta, ensure_ascii=False, default=str)),
+                         body=np.frombuffer(body, np.uint8),
+                         reference_sequence=sequence_array(snapshot['reference_sequence']),
+                         reference_landmarks=(frame_array(reference_landmarks) if reference_landmarks is not None
+                                              else np.zeros((0, 3), np.float32)),
+                         user_buffer=sequence_array(snapshot['user_buffer']))
+            with self._lock:
+                self.recorded += 1
+                self.last = path.name
+            print(f"[GRABADOR] Solicitud lenta guardada: {path.name} ({meta.get('elapsed_ms', 0):.0f} ms)")
+            self._prune()
+        except Exception as e:
+            print(f"WARN: No se pudo guardar la solicitud lenta: {e}")
+
+    def _prune(self):
+        files = sorted(self.directory.glob('*.npz'))
+        for old in files[:max(0, len(files) - self.max_files)]:
+            try:
+                old.unlink()
+            except OSError:
+                pass
+
+    def list(self):
+        """Metadatos de las grabaciones guardadas (de la más nueva a la más vieja)."""
+        if not self.directory.exists():
+            return []
+        entries = []
+        for path in sorted(self.directory.glob('*.npz'), reverse=True):
+            try:
+                entries.append(dict(load_capture(path)['meta'], file=path.name))
+            except Exception:
+                continue
+        return entries
+
+    def stats(self):
+        with self._lock:
+            return {'enabled': self.enabled, 'threshold_ms': self.threshold_ms, 'directory': str(self.directory),
+                    'recorded': self.recorded, 'last': self.last}
+
+
+def load_capture(path):
+    """Grabación como dict: meta, body (bytes), reference_sequence, reference_landmarks (o None), user_buffer."""
+    with np.load(path, allow_pickle=False) as data:
+        reference_landmarks = data['reference_landmarks']
+        return {
+            'meta': json.loads(str(data['meta'])),
+            'body': data['body'].tobytes(),
+            'reference_sequence': sequence_array(data['reference_sequence']),
+            'reference_landmarks': reference_landmarks if len(reference_landmarks) else None,
+            'user_buffer': list(sequence_array(data['user_buffer'])),
+        }
@@ -0,0 +1,95 @@
+"""
+Servidor local que imita el endpoint de chat completions de Groq, para probar
+el veredicto asíncrono (evaluador_groq.py) sin red ni API key real.
+
+Responde {"is_good": bool, "reason": str} según avg_distance de las métricas
+recibidas, con latencia y tasa de error configurables.
+
+Uso:
+    python groq_stub.py [--port 8009] [--latency-ms 300] [--jitter-ms 100] [--fail-rate 0.0]
+    GROQ_API_KEY=stub GROQ_API_URL=http://127.0.0.1:8009/openai/v1/chat/completions python app.py
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Umbral de avg_distance para 'Bien' (mismo orden de magnitud que evaluate_posture)
+GOOD_DISTANCE = 0.08
+
+
+def verdict_for(metrics):
+    avg = metrics.get('avg_distance')
+    if avg is None:
+        return {'is_good': bool(metrics.get('visible_lower_body')), 'reason': 'Sin referencia: se evalúa el encuadre'}
+    if avg <= GOOD_DISTANCE:
+        return {'is_good': True, 'reason': f'Movimiento cercano a la referencia (distancia {avg:.3f})'}
+    return {'is_good': False, 'reason': f'Movimiento alejado de la referencia (distancia {avg:.3f})'}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency_ms = 300.0
+    jitter_ms = 100.0
+    fail_rate = 0.0
+    requests_served = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+            metrics = json.loads(body['messages'][-1]['content']).get('metrics', {})
+        except (ValueError, KeyError, IndexError):
+            self._reply(400, {'error': {'message': 'invalid request'}})
+            return
+        time.sleep(max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000)
+        with StubHandler.lock:
+            StubHandler.requests_served += 1
+        if random.random() < self.fail_rate:
+            self._reply(503, {'error': {'message': 'stub: fallo simulado'}})
+            return
+        content = json.dumps(verdict_for(metrics), ensure_ascii=False)
+        self._reply(200, {'choices': [{'message': {'role': 'assistant', 'content': content}}]})
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=8009, latency_ms=300.0, jitter_ms=100.0, fail_rate=0.0, background=False):
+    """Inicia el stub; con background=True corre en un hilo y devuelve el servidor."""
+    StubHandler.latency_ms = latency_ms
+    StubHandler.jitter_ms = jitter_ms
+    StubHandler.fail_rate = fail_rate
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubHandler)
+    server.daemon_threads = True
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+    print(f"Stub de Groq en http://127.0.0.1:{port}/openai/v1/chat/completions "
+          f"(latencia {latency_ms:.0f}±{jitter_ms:.0f} ms, fallos {fail_rate:.0%})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stub local del endpoint de Groq')
+    parser.add_argument('--port', type=int, default=8009)
+    parser.add_argument('--latency-ms', type=float, default=300.0, help='Latencia media por respuesta')
+    parser.add_argument('--jitter-ms', type=float, default=100.0, help='Desviación de la latencia')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Fracción de respuestas 503')
+    args = parser.parse_args()
+    serve(args.port, args.latency_ms, args.jitter_ms, args.fail_rate)
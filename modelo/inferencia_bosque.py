@@ -0,0 +1,121 @@
+"""
+Inferencia compilada del RandomForest de posturas (modelo_posturas.pkl).
+
+CompiledForest copia los nodos de todos los árboles a arrays NumPy contiguos
+(feature, threshold, hijos y probabilidades de las hojas) y recorre los 400
+árboles a la vez: cada nivel de profundidad es una sola operación vectorizada,
+para una fila o para un lote. Evita la validación de sklearn y el bucle en
+Python por árbol de `predict`.
+
+El resultado es idéntico (bit a bit) a `predict_proba` / `predict` de sklearn:
+la entrada se convierte a float32 igual que sklearn, las probabilidades de cada
+hoja son las mismas que devuelve DecisionTreeClassifier.predict_proba y se suman
+árbol por árbol en el mismo orden antes de dividir por el número de árboles.
+
+FOREST_ENGINE=sklearn desactiva el motor compilado en el servidor.
+"""
+
+import os
+
+import numpy as np
+
+# Motor de inferencia del clasificador de posturas: 'compilado' o 'sklearn'
+FOREST_ENGINE = os.environ.get('FOREST_ENGINE', 'compilado')
+
+
+def _normalize_leaves():
+    """Desde sklearn 1.4 tree_.value guarda fracciones y predict_proba las devuelve tal cual;
+    antes guardaba conteos y predict_proba los normalizaba por fila."""
+    import sklearn  # import diferido: sklearn tarda en importarse y el modelo ya lo cargó
+    return tuple(int(p) for p in sklearn.__version__.split('.')[:2]) < (1, 4)
+
+
+class CompiledForest:
+    """Bosque de clasificación (RandomForest/ExtraTrees de una salida) compilado a arrays."""
+
+    def __init__(self, model):
+        trees = [est.tree_ for est in model.estimators_]
+        if getattr(model, 'n_outputs_', 1) != 1:
+            raise ValueError('Solo se soportan bosques de una salida')
+        self.classes_ = model.classes_
+        self.n_features_in_ = model.n_features_in_
+        self.n_estimators = len(trees)
+        n_classes = len(self.classes_)
+        normalize_leaves = _normalize_leaves()
+
+        offsets = np.cumsum([0] + [t.node_count for t in trees])
+        n_nodes = int(offsets[-1])
+        self.roots = offsets[:-1].astype(np.intp)
+        self.feature = np.zeros(n_nodes, dtype=np.intp)
+        self.threshold = np.zeros(n_nodes, dtype=np.float64)
+        self.left = np.zeros(n_nodes, dtype=np.intp)
+        self.right = np.zeros(n_nodes, dtype=np.intp)
+        self.missing_left = np.zeros(n_nodes, dtype=bool)
+        self.value = np.zeros((n_nodes, n_classes), dtype=np.float64)
+
+        for tree, start in zip(trees, self.roots):
+            end = start + tree.node_count
+            nodes = np.arange(start, end)
+            leaf = tree.children_left == -1
+            # las hojas apuntan a sí mismas: recorrer max_depth niveles deja cada fila en su hoja
+            self.feature[start:end] = np.where(leaf, 0, tree.feature)
+            self.threshold[start:end] = tree.threshold
+            self.left[start:end] = np.where(leaf, nodes, tree.children_left + start)
+            self.right[start:end] = np.where(leaf, nodes, tree.children_right + start)
+            state_nodes = tree.__getstate__()['nodes']
+            if 'missing_go_to_left' in state_nodes.dtype.names:
+                self.missing_left[start:end] = state_nodes['missing_go_to_left'].astype(bool)
+            # mismas operaciones que DecisionTreeClassifier.predict_proba
+            proba = tree.value[:, 0, :n_classes]
+            if normalize_leaves:
+                normalizer = proba.sum(axis=1)[:, np.newaxis]
+                normalizer[normalizer == 0.0] = 1.0
+                proba = proba / normalizer
+            self.value[start:end] = proba
+
+        self.max_depth = max(t.max_depth for t in trees)
+        self.has_missing = bool(self.missing_left.any())
+
+    def _rows(self, X):
+        # sklearn evalúa los árboles sobre X en float32
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f'Se esperaban {self.n_features_in_} features, llegaron {X.shape[1]}')
+        return X
+
+    def apply(self, X):
+        """Índice global de la hoja alcanzada en cada árbol: array (n_filas, n_árboles)."""
+        X = self._rows(X)
+        node = np.broadcast_to(self.roots, (X.shape[0], self.n_estimators)).copy()
+        rows = np.arange(X.shape[0])[:, np.newaxis]
+        for _ in range(self.max_depth):
+            x = X[rows, self.feature[node]]
+            go_left = x <= self.threshold[node]
+            if self.has_missing:
+                go_left |= np.isnan(x) & self.missing_left[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+        return node
+
+    def predict_proba(self, X):
+        """Probabilidad media por clase, igual que RandomForestClassifier.predict_proba."""
+        leaf_proba = self.value[self.apply(X)]
+        # cumsum suma árbol por árbol en orden, igual que la acumulación de sklearn
+        proba = np.cumsum(leaf_proba, axis=1)[:, -1]
+        proba /= self.n_estimators
+        return proba
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+
+def compile_forest(model):
+    """Devuelve el modelo compilado si es un bosque soportado; si no, el modelo original."""
+    if not hasattr(model, 'estimators_'):
+        return model  # no es un bosque (p. ej. los pipelines de seleccion_modelo): se usa tal cual
+    try:
+        return CompiledForest(model)
+    except (AttributeError, TypeError, ValueError) as e:
+        print(f"WARN: No se pudo compilar el modelo ({type(model).__name__}), se usa sklearn: {e}")
+        return model
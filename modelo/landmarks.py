@@ -0,0 +1,63 @@
+"""
+Representación compacta de landmarks de MediaPipe Pose.
+
+Un frame es un array (33, 3) [x, y, z] y una secuencia es un array (N, 33, 3),
+ambos en float32 (o float16 con LANDMARK_DTYPE=float16). Se usan en todo el
+servidor (extracción de referencias, buffers, evaluate_posture) y solo se
+convierten a listas planas [x, y, z, ...] al responder JSON.
+"""
+
+import os
+
+import numpy as np
+
+NUM_LANDMARKS = 33
+LANDMARK_DTYPE = np.float16 if os.environ.get('LANDMARK_DTYPE') == 'float16' else np.float32
+
+
+def frame_array(landmarks, dtype=LANDMARK_DTYPE):
+    """Convierte un frame (lista plana de 99 valores, lista de puntos o array) a (33, 3)."""
+    return np.asarray(landmarks, dtype=dtype).reshape((-1, 3))
+
+
+def sequence_array(frames, dtype=LANDMARK_DTYPE):
+    """Convierte una secuencia de frames (listas planas o arrays) a (N, 33, 3)."""
+    arr = np.asarray(frames, dtype=dtype)
+    if arr.size == 0:
+        return np.empty((0, NUM_LANDMARKS, 3), dtype=dtype)
+    return arr.reshape((arr.shape[0], -1, 3))
+
+
+def from_pose_landmarks(pose_landmarks, dtype=LANDMARK_DTYPE):
+    """Landmarks de un resultado de MediaPipe (results.pose_landmarks) como array (33, 3)."""
+    return np.array([(lm.x, lm.y, lm.z) for lm in pose_landmarks.landmark], dtype=dtype)
+
+
+def unpack_landmarks(data, dtype=None):
+    """Frame (33, 3) desde bytes little-endian empaquetados: float32 (396 bytes) o float16 (198 bytes).
+    Sin `dtype` ('float32'/'float16') se deduce del largo."""
+    n_values = NUM_LANDMARKS * 3
+    if dtype is None:
+        dtype = {n_values * 4: 'float32', n_values * 2: 'float16'}.get(len(data))
+    if dtype not in ('float32', 'float16'):
+        raise ValueError(f'se esperaban {n_values} valores float32 o float16 ({len(data)} bytes recibidos)')
+    arr = np.frombuffer(data, dtype=np.dtype(dtype).newbyteorder('<'))
+    if arr.size != n_values:
+        raise ValueError(f'se esperaban {n_values} valores, llegaron {arr.size}')
+    return arr.astype(LANDMARK_DTYPE).reshape((NUM_LANDMARKS, 3))
+
+
+def is_sequence(landmarks):
+    """True si `landmarks` es una secuencia de frames y no un único frame."""
+    if isinstance(landmarks, np.ndarray):
+        return landmarks.ndim == 3 or (landmarks.ndim == 2 and landmarks.shape[1] != 3)
+    return (isinstance(landmarks, list) and len(landmarks) > 0
+            and isinstance(landmarks[0], (list, np.ndarray)) and len(landmarks[0]) != 3)
+
+
+def to_json_list(landmarks):
+    """Frame (33, 3) -> lista plana [x, y, z, ...]; secuencia (N, 33, 3) -> lista de listas planas."""
+    arr = np.asarray(landmarks, dtype=np.float64)
+    if arr.ndim == 3:
+        return arr.reshape((arr.shape[0], -1)).tolist()
+    return arr.reshape(-1).tolist()
@@ -0,0 +1,190 @@
+"""
+Métricas de latencia por etapa del servidor (/metrics).
+
+Cada etapa (decodificación base64, cv2.imdecode, pose.process, clasificador,
+evaluate_posture y dentro de ella alineación y DTW, consulta a Groq y
+serialización JSON) tiene un histograma de latencia con cubetas fijas, un
+contador de errores y un gauge de ejecuciones en curso. Los endpoints HTTP
+tienen lo mismo por ruta, más un contador por código de respuesta.
+
+Los histogramas se crean al importar (las cubetas son listas preasignadas) y
+registrar una medición es un bisect y unos incrementos bajo un lock por etapa,
+sin crear estructuras por petición. Uso:
+
+    with stage('pose'):
+        results = pose.process(image)
+
+/metrics responde en formato de texto de Prometheus; /metrics?format=json
+devuelve además p50/p95/p99 estimados a partir de las cubetas.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+
+# Límites superiores de las cubetas en ms (la última cubeta, +Inf, es implícita)
+BUCKETS_MS = (0.25, 0.5, 1, 2, 5, 10, 20, 35, 50, 75, 100, 150, 250, 500, 1000, 2500, 5000)
+
+STAGE_NAMES = ('base64_decode', 'imdecode', 'pose', 'predict', 'evaluate_posture', 'alignment', 'dtw',
+               'groq', 'json')
+
+METRIC_PREFIX = 'postura'
+
+
+class Histogram:
+    """Histograma de latencias (ms) con cubetas fijas, contador de errores y gauge en curso."""
+
+    def __init__(self, bounds=BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.errors = 0
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+    def observe(self, ms, error=False):
+        i = bisect_left(self.bounds, ms)
+        with self.lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.total_ms += ms
+            if ms > self.max_ms:
+                self.max_ms = ms
+            if error:
+                self.errors += 1
+
+    def percentile(self, q):
+        """Percentil q (0-1) estimado interpolando dentro de la cubeta, o None sin datos."""
+        with self.lock:
+            counts = list(self.counts)
+            count = self.count
+            max_ms = self.max_ms
+        if not count:
+            return None
+        rank = q * count
+        seen = 0
+        for i, n in enumerate(counts):
+            if n and seen + n >= rank:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else max_ms
+                return min(max_ms, lower + (upper - lower) * (rank - seen) / n)
+            seen += n
+        return max_ms
+
+    def snapshot(self):
+        with self.lock:
+            data = {'count': self.count, 'errors': self.errors, 'in_flight': self.in_flight,
+                    'avg_ms': self.total_ms / self.count if self.count else None,
+                    'max_ms': self.max_ms if self.count else None}
+        data.update(p50_ms=self.percentile(0.50), p95_ms=self.percentile(0.95), p99_ms=self.percentile(0.99))
+        return data
+
+
+class Stage:
+    """Context manager que mide una etapa en su histograma. Reentrante y seguro entre hilos:
+    el instante de inicio va en una pila por hilo."""
+
+    def __init__(self, name, bounds=BUCKETS_MS):
+        self.name = name
+        self.histogram = Histogram(bounds)
+        self._local = threading.local()
+
+    def __enter__(self):
+        starts = getattr(self._local, 'starts', None)
+        if starts is None:
+            starts = self._local.starts = []
+        starts.append(time.perf_counter())
+        with self.histogram.lock:
+            self.histogram.in_flight += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed_ms = (time.perf_counter() - self._local.starts.pop()) * 1000
+        with self.histogram.lock:
+            self.histogram.in_flight -= 1
+        self.histogram.observe(elapsed_ms, error=exc_type is not None)
+        return False
+
+
+STAGES = {name: Stage(name) for name in STAGE_NAMES}
+
+# Endpoints: una etapa por ruta (se crea la primera vez que se ve la ruta) y contador por código
+_endpoints = {}
+_responses = {}
+_endpoints_lock = threading.Lock()
+
+
+def stage(name):
+    """Etapa registrada `name` (ver STAGE_NAMES)."""
+    return STAGES[name]
+
+
+def endpoint_stage(endpoint):
+    """Etapa de un endpoint HTTP (request.endpoint; None para rutas inexistentes)."""
+    endpoint = endpoint or 'desconocido'
+    found = _endpoints.get(endpoint)
+    if found is None:
+        with _endpoints_lock:
+            found = _endpoints.setdefault(endpoint, Stage(endpoint))
+    return found
+
+
+def count_response(endpoint, status):
+    key = (endpoint or 'desconocido', int(status))
+    with _endpoints_lock:
+        _responses[key] = _responses.get(key, 0) + 1
+
+
+def _histogram_lines(name, label, stages):
+    """Líneas de las tres familias (histograma, errores, en curso); cada familia va agrupada."""
+    rows = []
+    for item in stages:
+        h = item.histogram
+        with h.lock:
+            rows.append((f'{label}="{item.name}"', h.bounds, list(h.counts), h.count, h.total_ms, h.errors,
+                         h.in_flight))
+    lines = [f'# TYPE {name}_duration_ms histogram']
+    for tag, bounds, counts, count, total, _, _ in rows:
+        cumulative = 0
+        for bound, n in zip(bounds, counts):
+            cumulative += n
+            lines.append(f'{name}_duration_ms_bucket{{{tag},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_duration_ms_bucket{{{tag},le="+Inf"}} {count}')
+        lines.append(f'{name}_duration_ms_sum{{{tag}}} {total:.3f}')
+        lines.append(f'{name}_duration_ms_count{{{tag}}} {count}')
+    lines.append(f'# TYPE {name}_errors_total counter')
+    lines += [f'{name}_errors_total{{{row[0]}}} {row[5]}' for row in rows]
+    lines.append(f'# TYPE {name}_in_flight gauge')
+    lines += [f'{name}_in_flight{{{row[0]}}} {row[6]}' for row in rows]
+    return lines
+
+
+def render_prometheus(extra_gauges=None):
+    """Texto en formato de exposición de Prometheus. extra_gauges: {nombre: valor} adicionales."""
+    with _endpoints_lock:
+        endpoints = list(_endpoints.values())
+        responses = dict(_responses)
+    lines = _histogram_lines(f'{METRIC_PREFIX}_stage', 'stage', STAGES.values())
+    lines += _histogram_lines(f'{METRIC_PREFIX}_http', 'endpoint', endpoints)
+    lines.append(f'# TYPE {METRIC_PREFIX}_http_responses_total counter')
+    for (endpoint, status), n in sorted(responses.items()):
+        lines.append(f'{METRIC_PREFIX}_http_responses_total{{endpoint="{endpoint}",status="{status}"}} {n}')
+    for gauge, value in (extra_gauges or {}).items():
+        if value is not None:
+            lines.append(f'# TYPE {METRIC_PREFIX}_{gauge} gauge')
+            lines.append(f'{METRIC_PREFIX}_{gauge} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def snapshot():
+    """Resumen JSON: etapas y endpoints con conteos, errores, en curso y percentiles."""
+    with _endpoints_lock:
+        endpoints = dict(_endpoints)
+        responses = dict(_responses)
+    return {
+        'stages': {name: s.histogram.snapshot() for name, s in STAGES.items()},
+        'endpoints': {name: s.histogram.snapshot() for name, s in endpoints.items()},
+        'responses': {f'{endpoint} {status}': n for (endpoint, status), n in sorted(responses.items())},
+    }
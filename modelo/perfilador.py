@@ -0,0 +1,139 @@
+"""
+Perfilador por muestreo para diagnosticar lentitud en producción.
+
+Un hilo toma cada PROFILE_INTERVAL_MS la pila de todos los hilos del proceso
+(sys._current_frames) y cuenta cada pila distinta. El resultado está en
+formato "folded" (una línea 'hilo;archivo:función;... N' por pila), el que
+leen flamegraph.pl, speedscope e inferno. Corre durante N segundos o hasta
+que terminan N peticiones HTTP (note_request), lo que ocurra primero.
+
+Por defecto se omiten las pilas de hilos inactivos (esperando en un lock, un
+socket o una cola) para que el flame graph muestre solo trabajo.
+
+Uso desde app.py: POST /api/admin/profile (ver ADMIN_TOKEN).
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+# Límite de duración de una sesión de perfilado (s)
+PROFILE_MAX_SECONDS = float(os.environ.get('PROFILE_MAX_SECONDS', 300))
+
+# Funciones hoja de la biblioteca estándar (archivo relativo a la stdlib, función) en las que
+# un hilo está bloqueado esperando (no trabajando). Se comparan con el archivo para no
+# descartar funciones propias con el mismo nombre (p. ej. SessionStore.get).
+IDLE_FUNCTIONS = {
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('queue.py', 'get'),
+    ('selectors.py', 'select'),
+    ('socket.py', 'accept'),
+    ('socket.py', 'readinto'),
+    ('ssl.py', 'read'),
+    ('ssl.py', 'recv_into'),
+    ('socketserver.py', 'serve_forever'),
+    ('concurrent/futures/thread.py', '_worker'),
+    ('multiprocessing/connection.py', '_recv'),
+    ('multiprocessing/connection.py', '_poll'),
+}
+_STDLIB_DIR = os.path.dirname(threading.__file__)
+_idle_codes = {}  # code -> bool (caché de is_idle_frame)
+
+
+def is_idle_frame(frame):
+    """True si la hoja de la pila es una espera bloqueante de la stdlib (IDLE_FUNCTIONS)."""
+    code = frame.f_code
+    idle = _idle_codes.get(code)
+    if idle is None:
+        path = code.co_filename
+        idle = False
+        if path.startswith(_STDLIB_DIR):
+            relative = os.path.relpath(path, _STDLIB_DIR).replace(os.sep, '/')
+            idle = (relative, code.co_name) in IDLE_FUNCTIONS
+        _idle_codes[code] = idle
+    return idle
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def folded_stack(frame, thread_name):
+    """Pila de un frame como 'hilo;raíz;...;hoja' (de la raíz a la hoja)."""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.append(thread_name)
+    return ';'.join(reversed(labels))
+
+
+class SamplingProfiler:
+    """Una sesión de perfilado: start(), note_request() por petición, folded() al terminar."""
+
+    def __init__(self, seconds=None, requests=None, interval_ms=PROFILE_INTERVAL_MS, include_idle=False):
+        self.seconds = min(float(seconds), PROFILE_MAX_SECONDS) if seconds else None
+        self.max_requests = int(requests) if requests else None
+        if self.seconds is None and self.max_requests is None:
+            self.seconds = 10.0
+        self.interval_s = max(0.5, float(interval_ms)) / 1000
+        self.include_idle = include_idle
+        self.stacks = Counter()
+        self.samples = 0
+        self.requests = 0
+        self.started_at = None
+        self.finished_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name='perfilador', daemon=True)
+        self._thread.start()
+        return self
+
+    def note_request(self):
+        self.requests += 1
+        if self.max_requests and self.requests >= self.max_requests:
+            self._stop.set()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        own = threading.get_ident()
+        deadline = time.monotonic() + (self.seconds or PROFILE_MAX_SECONDS)
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if not self.include_idle and is_idle_frame(frame):
+                    continue
+                self.stacks[folded_stack(frame, names.get(ident, f'hilo-{ident}'))] += 1
+            self.samples += 1
+            self._stop.wait(self.interval_s)
+        self.finished_at = time.time()
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def folded(self):
+        """Pilas en formato folded, de la más a la menos muestreada."""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+    def status(self):
+        return {'running': self.running, 'seconds': self.seconds, 'max_requests': self.max_requests,
+                'requests': self.requests, 'samples': self.samples, 'stacks': len(self.stacks),
+                'interval_ms': self.interval_s * 1000, 'started_at': self.started_at,
+                'finished_at': self.finished_at}
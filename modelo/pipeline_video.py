@@ -0,0 +1,190 @@
+"""
+Pipeline por etapas para el stream de cámara (video_stream en app.py).
+
+Cada etapa (captura, inferencia, evaluación, codificación/envío) corre en su
+propio hilo y se comunica con la siguiente por una LatestQueue: una cola
+acotada que, si está llena, descarta el elemento más viejo. Así una etapa lenta
+no acumula frames atrasados; siempre procesa el más reciente y los demás se
+cuentan como descartados. Cada etapa lleva estadísticas de throughput y
+latencia (ver Pipeline.snapshot).
+"""
+
+import threading
+import time
+from collections import deque
+
+# Capacidad de las colas entre etapas (1 = solo el último frame)
+DEFAULT_QUEUE_SIZE = 1
+
+
+class LatestQueue:
+    """Cola acotada que descarta el elemento más viejo al llenarse."""
+
+    def __init__(self, maxsize=DEFAULT_QUEUE_SIZE):
+        self._items = deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self._closed = False
+        self.put_count = 0
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1  # deque(maxlen) descarta el más viejo
+            self._items.append(item)
+            self.put_count += 1
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Devuelve el siguiente elemento, o None si la cola se cerró (o venció el timeout)."""
+        with self._cond:
+            while not self._items and not self._closed:
+                if not self._cond.wait(timeout):
+                    return None
+            if self._items:
+                return self._items.popleft()
+            return None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+
+class StageStats:
+    """Throughput y latencia de una etapa."""
+
+    def __init__(self, name):
+        self.name = name
+        self.processed = 0
+        self.errors = 0
+        self.busy_s = 0.0
+        self.last_ms = None
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def record(self, elapsed_s, error=False):
+        with self._lock:
+            self.processed += 1
+            self.busy_s += elapsed_s
+            self.last_ms = elapsed_s * 1000
+            if error:
+                self.errors += 1
+
+    def snapshot(self):
+        with self._lock:
+            wall = max(1e-9, time.perf_counter() - self.started)
+            return {
+                'processed': self.processed,
+                'errors': self.errors,
+                'fps': self.processed / wall,
+                'avg_ms': (self.busy_s / self.processed * 1000) if self.processed else None,
+                'last_ms': self.last_ms,
+                'utilization': self.busy_s / wall,
+            }
+
+
+class Pipeline:
+    """Cadena de etapas en hilos: source() produce elementos y cada etapa los transforma.
+
+    source: función sin argumentos que devuelve el siguiente elemento o None para terminar.
+    stages: lista de (nombre, fn); fn(item) devuelve el elemento para la etapa siguiente
+    (o None para descartarlo). La salida de la última etapa se ignora.
+    """
+
+    def __init__(self, source_name, source, stages, queue_size=DEFAULT_QUEUE_SIZE):
+        self.source_name = source_name
+        self.source = source
+        self.stages = stages
+        self.queues = [LatestQueue(queue_size) for _ in stages]
+        self.stats = {name: StageStats(name) for name in [source_name] + [name for name, _ in stages]}
+        self.latency = StageStats('extremo_a_extremo')
+        self._threads = []
+        self._stop = threading.Event()
+
+    def _run_source(self):
+        stats = self.stats[self.source_name]
+        try:
+            while not self._stop.is_set():
+                t0 = time.perf_counter()
+                item = self.source()
+                if item is None:
+                    break
+                t_captured = time.perf_counter()
+                stats.record(t_captured - t0)
+                # cada elemento viaja con el instante de captura para medir latencia total
+                self.queues[0].put((t_captured, item))
+        finally:
+            self.queues[0].close()
+
+    def _run_stage(self, index):
+        name, fn = self.stages[index]
+        stats = self.stats[name]
+        in_q = self.queues[index]
+        out_q = self.queues[index + 1] if index + 1 < len(self.queues) else None
+        try:
+            while True:
+                entry = in_q.get()
+                if entry is None:
+                    break
+                t_source, item = entry
+                t0 = time.perf_counter()
+                try:
+                    result = fn(item)
+                    stats.record(time.perf_counter() - t0)
+                except Exception as e:
+                    stats.record(time.perf_counter() - t0, error=True)
+                    print(f"[PIPELINE] Error en etapa '{name}': {e}")
+                    continue
+                if result is None:
+                    continue
+                if out_q is not None:
+                    out_q.put((t_source, result))
+                else:
+                    self.latency.record(time.perf_counter() - t_source)
+        finally:
+            if out_q is not None:
+                out_q.close()
+
+    def start(self):
+        self._threads = [threading.Thread(target=self._run_source, name=f'pipeline-{self.source_name}', daemon=True)]
+        self._threads += [threading.Thread(target=self._run_stage, args=(i,), name=f'pipeline-{name}', daemon=True)
+                          for i, (name, _) in enumerate(self.stages)]
+        for t in self._threads:
+            t.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def is_alive(self):
+        return any(t.is_alive() for t in self._threads)
+
+    def join(self, timeout=None):
+        """Espera a que terminen todas las etapas (como máximo `timeout` segundos en total)."""
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        for t in self._threads:
+            t.join(None if deadline is None else max(0.0, deadline - time.perf_counter()))
+
+    def snapshot(self):
+        """Estadísticas por etapa, frames descartados por cola y latencia captura -> salida."""
+        stages = {name: stats.snapshot() for name, stats in self.stats.items()}
+        for (name, _), q in zip(self.stages, self.queues):
+            stages[name]['dropped_before'] = q.dropped
+        return {'stages': stages, 'end_to_end': self.latency.snapshot()}
+
+    def format_stats(self):
+        snap = self.snapshot()
+        parts = []
+        for name, s in snap['stages'].items():
+            avg = f"{s['avg_ms']:.1f} ms" if s['avg_ms'] is not None else '-'
+            dropped = f", {s['dropped_before']} desc." if 'dropped_before' in s else ''
+            parts.append(f"{name} {s['fps']:.1f} fps ({avg}{dropped})")
+        e2e = snap['end_to_end']
+        if e2e['avg_ms'] is not None:
+            parts.append(f"latencia {e2e['avg_ms']:.0f} ms")
+        return ' | '.join(parts)
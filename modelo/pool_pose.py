@@ -0,0 +1,287 @@
+"""
+Pool acotado de instancias de MediaPipe Pose para peticiones concurrentes.
+
+Una instancia de Pose no se puede usar desde dos hilos a la vez (el grafo
+guarda estado de seguimiento entre frames) y Flask atiende /api/evaluate_frame,
+/api/process_video_frames y la referencia al vuelo en varios hilos. En vez de
+compartir un único objeto, cada petición toma una instancia con `checkout()` y
+la devuelve al terminar. Las instancias se crean a demanda hasta `size`; si
+están todas ocupadas la petición espera (como máximo `timeout` segundos) y el
+tiempo de espera queda en las estadísticas.
+
+Con POSE_TRACKING=sesion, /api/evaluate_frame usa además una instancia propia
+por sesión (SessionTrackers): los frames consecutivos de un paciente pasan por
+el mismo grafo, que sigue a la persona desde el frame anterior en vez de volver
+a detectarla en cada frame. Las instancias de sesiones inactivas se cierran.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Instancias de Pose del pool (por defecto una por núcleo, hasta 4) y espera máxima por una libre
+POSE_POOL_SIZE = int(os.environ.get('POSE_POOL_SIZE', min(4, os.cpu_count() or 1)))
+POSE_POOL_TIMEOUT = float(os.environ.get('POSE_POOL_TIMEOUT', 10))
+# 'pool' (cada frame toma cualquier instancia del pool) o 'sesion' (instancia de seguimiento por sesión)
+POSE_TRACKING = os.environ.get('POSE_TRACKING', 'pool')
+# Instancias de seguimiento como máximo y segundos sin frames tras los que se cierran
+POSE_TRACKERS_MAX = int(os.environ.get('POSE_TRACKERS_MAX', 16))
+POSE_TRACKER_IDLE_SECONDS = float(os.environ.get('POSE_TRACKER_IDLE_SECONDS', 60))
+
+
+class PosePool:
+    """Instancias creadas con `factory()` y prestadas de a una por hilo."""
+
+    def __init__(self, factory, size=POSE_POOL_SIZE, timeout=POSE_POOL_TIMEOUT):
+        self.factory = factory
+        self.size = max(1, int(size))
+        self.timeout = timeout
+        self._idle = []
+        self._created = 0
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.wait_total_s = 0.0
+        self.wait_max_s = 0.0
+
+    def acquire(self, timeout=None):
+        """Toma una instancia libre (o crea una nueva si no se llegó a `size`).
+        Lanza TimeoutError si no se libera ninguna en `timeout` segundos."""
+        timeout = self.timeout if timeout is None else timeout
+        t0 = time.perf_counter()
+        with self._cond:
+            waited = False
+            while not self._idle and self._created >= self.size:
+                waited = True
+                remaining = timeout - (time.perf_counter() - t0)
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    if not self._idle and self._created >= self.size:
+                        self.timeouts += 1
+                        raise TimeoutError(f'No hay instancias de pose libres tras {timeout:.1f} s')
+            instance = self._idle.pop() if self._idle else None
+            if instance is None:
+                self._created += 1
+            self._in_use += 1
+            self.checkouts += 1
+            if waited:
+                wait_s = time.perf_counter() - t0
+                self.waits += 1
+                self.wait_total_s += wait_s
+                self.wait_max_s = max(self.wait_max_s, wait_s)
+
+        if instance is None:
+            # la creación del grafo va fuera del lock para no frenar a los demás hilos
+            try:
+                instance = self.factory()
+            except Exception:
+                with self._cond:
+                    self._created -= 1
+                    self._in_use -= 1
+                    self._cond.notify()
+                raise
+        return instance
+
+    def release(self, instance):
+        with self._cond:
+            self._idle.append(instance)
+            self._in_use -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def checkout(self, timeout=None):
+        """with pool.checkout() as pose: pose.process(...)"""
+        instance = self.acquire(timeout)
+        try:
+            yield instance
+        finally:
+            self.release(instance)
+
+    def fill(self, fn=None):
+        """Crea todas las instancias del pool y aplica `fn` a cada una (p. ej. para calentarlas)."""
+        instances = [self.acquire() for _ in range(self.size)]
+        try:
+            if fn is not None:
+                for instance in instances:
+                    fn(instance)
+        finally:
+            for instance in instances:
+                self.release(instance)
+
+    def close(self):
+        """Cierra las instancias libres."""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+        for instance in idle:
+            try:
+                instance.close()
+            except Exception:
+                pass
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self.size,
+                'created': self._created,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+                'wait_avg_ms': (self.wait_total_s / self.waits * 1000) if self.waits else 0.0,
+                'wait_max_ms': self.wait_max_s * 1000,
+            }
+
+
+class _Tracker:
+    def __init__(self):
+        self.instance = None
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+        self.dropped = False
+
+
+def _close(instance):
+    try:
+        instance.close()
+    except Exception:
+        pass
+
+
+class SessionTrackers:
+    """Una instancia creada con `factory()` por sesión, que conserva el seguimiento entre sus frames.
+
+    Si la sesión ya está usando la suya (peticiones en paralelo) o se llegó a `max_trackers`
+    sin ninguna inactiva que liberar, checkout() presta una del pool como hasta ahora."""
+
+    def __init__(self, factory, max_trackers=POSE_TRACKERS_MAX, idle_seconds=POSE_TRACKER_IDLE_SECONDS):
+        self.factory = factory
+        self.max_trackers = max(1, int(max_trackers))
+        self.idle_seconds = idle_seconds
+        self._trackers = OrderedDict()  # session_id -> _Tracker, del usado hace más tiempo al más reciente
+        self._lock = threading.Lock()
+        self.created = 0
+        self.hits = 0
+        self.fallbacks = 0
+        self.evicted_idle = 0
+        self.evicted = 0
+
+    def _remove(self, session_id):
+        """Saca el tracker del diccionario (con self._lock tomado); devuelve la instancia a cerrar,
+        o None si está procesando un frame: la cierra checkout() al devolverlo.
+        El lock del tracker solo se toma y se suelta con self._lock tomado, así que exactamente
+        uno de los dos la cierra."""
+        tracker = self._trackers.pop(session_id)
+        tracker.dropped = True
+        return None if tracker.lock.locked() else tracker.instance
+
+    def _remove_idle(self, now):
+        """Saca los trackers sin frames hace más de idle_seconds (con self._lock tomado)."""
+        to_close = []
+        for sid, tracker in list(self._trackers.items()):
+            if now - tracker.last_used <= self.idle_seconds:
+                break
+            if not tracker.lock.locked():
+                to_close.append(self._remove(sid))
+                self.evicted_idle += 1
+        return to_close
+
+    def sweep_idle(self):
+        """Cierra los trackers inactivos (también lo hace cada checkout)."""
+        with self._lock:
+            to_close = self._remove_idle(time.monotonic())
+        for instance in to_close:
+            if instance is not None:
+                _close(instance)
+
+    def _acquire(self, session_id):
+        """Tracker de la sesión tomado (lock adquirido), o None si hay que usar el pool."""
+        with self._lock:
+            to_close = self._remove_idle(time.monotonic())
+            tracker = self._trackers.get(session_id)
+            if tracker is not None:
+                if not tracker.lock.acquire(blocking=False):
+                    tracker = None
+                else:
+                    self._trackers.move_to_end(session_id)
+                    self.hits += 1
+            else:
+                if len(self._trackers) >= self.max_trackers:
+                    # liberar el usado hace más tiempo que no esté procesando un frame
+                    victim = next((sid for sid, t in self._trackers.items() if not t.lock.locked()), None)
+                    if victim is not None:
+                        to_close.append(self._remove(victim))
+                        self.evicted += 1
+                if len(self._trackers) < self.max_trackers:
+                    tracker = _Tracker()
+                    tracker.lock.acquire()
+                    self._trackers[session_id] = tracker
+            if tracker is None:
+                self.fallbacks += 1
+        for instance in to_close:
+            if instance is not None:
+                _close(instance)
+        if tracker is not None and tracker.instance is None:
+            # el grafo se crea fuera del lock (el primer frame de la sesión paga su inicialización)
+            try:
+                tracker.instance = self.factory()
+            except Exception:
+                with self._lock:
+                    if self._trackers.get(session_id) is tracker:
+                        del self._trackers[session_id]
+                    tracker.lock.release()
+                raise
+            with self._lock:
+                self.created += 1
+        return tracker
+
+    @contextmanager
+    def checkout(self, session_id, fallback):
+        """with trackers.checkout(session_id, pool.checkout) as pose: pose.process(...)"""
+        tracker = self._acquire(session_id)
+        if tracker is None:
+            with fallback() as instance:
+                yield instance
+            return
+        try:
+            yield tracker.instance
+        finally:
+            with self._lock:
+                tracker.last_used = time.monotonic()
+                tracker.lock.release()
+                # si la sesión se eliminó mientras procesaba, _remove() la dejó para cerrar aquí
+                close_after = tracker.dropped
+            if close_after:
+                _close(tracker.instance)
+
+    def drop(self, session_id):
+        """Cierra el tracker de una sesión (on_evict de SessionStore)."""
+        with self._lock:
+            instance = self._remove(session_id) if session_id in self._trackers else None
+        if instance is not None:
+            _close(instance)
+
+    def close(self):
+        with self._lock:
+            instances = [self._remove(sid) for sid in list(self._trackers)]
+        for instance in instances:
+            if instance is not None:
+                _close(instance)
+
+    def stats(self):
+        self.sweep_idle()
+        with self._lock:
+            return {
+                'active': len(self._trackers),
+                'max': self.max_trackers,
+                'idle_seconds': self.idle_seconds,
+                'created': self.created,
+                'hits': self.hits,
+                'fallbacks': self.fallbacks,
+                'evicted_idle': self.evicted_idle,
+                'evicted': self.evicted,
+            }
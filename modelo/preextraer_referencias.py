@@ -0,0 +1,33 @@
+"""
+Pre-extrae los landmarks de todos los videos de referencia de dataset/ y los
+guarda en la caché de referencias, para que ninguna petición pague la extracción.
+
+Con --indice se construyen en cambio los índices por tiempo que usa
+evaluate_frame cuando la sesión no cargó una secuencia (REFERENCE_INDEX_FPS).
+
+Uso:
+    python preextraer_referencias.py --fps 3 --workers 4
+    python preextraer_referencias.py --indice
+"""
+
+import argparse
+
+from referencias import preextract_references, REFERENCE_INDEX_FPS, REFERENCE_INDEX_MAX_SAMPLES
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pre-extraer landmarks de los videos de referencia')
+    parser.add_argument('--dataset-dir', type=str, default='dataset', help='Carpeta raíz con subcarpetas por condición')
+    parser.add_argument('--fps', type=float, default=3, help='Frames por segundo a muestrear (default: 3, igual que el servidor)')
+    parser.add_argument('--workers', type=int, default=None, help='Procesos en paralelo (default: todos los núcleos)')
+    parser.add_argument('--indice', action='store_true',
+                        help=f'Construir los índices por tiempo ({REFERENCE_INDEX_FPS:g} fps) en lugar de las secuencias')
+    args = parser.parse_args()
+
+    if args.indice:
+        summaries = preextract_references(args.dataset_dir, target_fps=REFERENCE_INDEX_FPS, workers=args.workers,
+                                          max_samples=REFERENCE_INDEX_MAX_SAMPLES)
+    else:
+        summaries = preextract_references(args.dataset_dir, target_fps=args.fps, workers=args.workers)
+    if any(s['error'] for s in summaries):
+        exit(1)
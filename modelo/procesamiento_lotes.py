@@ -0,0 +1,183 @@
+"""
+Procesamiento en paralelo de lotes de frames (/api/process_video_frames).
+
+Cada lote se parte en tramos contiguos que se reparten entre procesos de
+trabajo. Cada proceso tiene su propia instancia de MediaPipe Pose (creada una
+vez al iniciar el proceso), decodifica sus frames y devuelve los landmarks.
+Los tramos son contiguos para que el seguimiento de MediaPipe siga sirviendo
+dentro de cada uno, y los resultados se juntan en el orden original del lote.
+Antes de cada tramo que no continúa al anterior del mismo proceso (otro lote u
+otra parte del video) se reinicia la instancia, para que el seguimiento de un
+video no pase a los primeros frames de otro.
+Los procesos se crean con 'spawn' para no heredar por fork los hilos de Flask
+ni el estado de MediaPipe del proceso principal.
+
+Con VIDEO_WORKERS <= 1 el lote se procesa en el hilo de la petición con una
+instancia del pool de pose (comportamiento anterior).
+"""
+
+import base64
+import itertools
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from landmarks import from_pose_landmarks
+
+# Procesos de trabajo para los lotes (por defecto uno por núcleo, hasta 4; 0 o 1 = sin procesos)
+VIDEO_WORKERS = int(os.environ.get('VIDEO_WORKERS', min(4, os.cpu_count() or 1)))
+# Frames mínimos por tramo: lotes chicos no se reparten entre más procesos de los necesarios
+MIN_FRAMES_PER_CHUNK = 4
+
+_worker_pose = None
+_worker_position = None  # (lote, índice siguiente) del último tramo procesado por este proceso
+
+
+def _init_worker():
+    """Inicializador de cada proceso: su propia instancia de Pose."""
+    global _worker_pose
+    os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+    import mediapipe as mp
+    _worker_pose = mp.solutions.pose.Pose(min_detection_confidence=0.4, min_tracking_confidence=0.4)
+
+
+def _ping():
+    return os.getpid()
+
+
+def decode_frame(frame_b64):
+    """Frame BGR a partir de un data URI o base64 puro, o None si no es una imagen válida."""
+    import cv2
+    # Soporta data URI o solo base64
+    comma = frame_b64.find(',', 0, 100)
+    img_bytes = base64.b64decode(frame_b64[comma + 1:] if comma >= 0 else frame_b64)
+    return cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR)
+
+
+def process_frames(frames_b64, pose, start=0):
+    """Landmarks de un tramo de frames: lista de (índice en el lote, landmarks (33, 3) o None, error o None)."""
+    import cv2
+    results = []
+    for offset, frame_b64 in enumerate(frames_b64):
+        index = start + offset
+        try:
+            frame = decode_frame(frame_b64)
+            if frame is None:
+                results.append((index, None, 'Invalid image data'))
+                continue
+            detected = pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            landmarks = from_pose_landmarks(detected.pose_landmarks) if detected.pose_landmarks else None
+            results.append((index, landmarks, None))
+        except Exception as e:
+            results.append((index, None, str(e)))
+    return results
+
+
+def _process_chunk(batch_id, start, frames_b64):
+    global _worker_position
+    if _worker_position is not None and _worker_position != (batch_id, start):
+        _worker_pose.reset()
+    _worker_position = (batch_id, start + len(frames_b64))
+    return process_frames(frames_b64, _worker_pose, start)
+
+
+def split_chunks(n_frames, workers, min_chunk=MIN_FRAMES_PER_CHUNK):
+    """(inicio, fin) de tramos contiguos de tamaño parecido para repartir n_frames entre workers."""
+    n_chunks = max(1, min(workers, math.ceil(n_frames / min_chunk)))
+    size = math.ceil(n_frames / n_chunks)
+    return [(start, min(start + size, n_frames)) for start in range(0, n_frames, size)]
+
+
+class FrameBatchProcessor:
+    """Reparte lotes de frames entre procesos de trabajo y junta los landmarks en orden.
+
+    local_checkout: función que devuelve un context manager con una instancia de Pose
+    (p. ej. pose_pool.checkout), usada sin procesos o si el pool de procesos se rompe.
+    """
+
+    def __init__(self, local_checkout, workers=VIDEO_WORKERS):
+        self.local_checkout = local_checkout
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.frames = 0
+        self.busy_s = 0.0
+        self.last = None
+        self._batch_ids = itertools.count()
+
+    @property
+    def parallel(self):
+        return self.workers > 1
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'),
+                                                     initializer=_init_worker)
+            return self._executor
+
+    def start(self):
+        """Lanza los procesos en segundo plano (cada uno carga MediaPipe) sin esperar a que terminen."""
+        if self.parallel:
+            pool = self._pool()
+            for _ in range(self.workers):
+                pool.submit(_ping)
+
+    def _reset_pool(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _process_parallel(self, frames_b64):
+        pool = self._pool()
+        batch_id = next(self._batch_ids)
+        futures = [pool.submit(_process_chunk, batch_id, start, frames_b64[start:end])
+                   for start, end in split_chunks(len(frames_b64), self.workers)]
+        results = []
+        for future in futures:  # en orden de tramo = orden del lote
+            results.extend(future.result())
+        return results
+
+    def process(self, frames_b64):
+        """Devuelve (resultados por frame en orden, estadísticas del lote)."""
+        t0 = time.perf_counter()
+        workers = 1
+        results = None
+        if self.parallel and len(frames_b64) > 1:
+            try:
+                results = self._process_parallel(frames_b64)
+                workers = len(split_chunks(len(frames_b64), self.workers))
+            except BrokenProcessPool as e:
+                print(f"WARN: pool de procesos caído ({e}); procesando el lote en el servidor")
+                self._reset_pool()
+        if results is None:
+            with self.local_checkout() as pose:
+                results = process_frames(frames_b64, pose)
+
+        elapsed = time.perf_counter() - t0
+        stats = {'frames': len(frames_b64), 'workers': workers, 'elapsed_ms': elapsed * 1000,
+                 'fps': len(frames_b64) / elapsed if elapsed > 0 else None}
+        with self._stats_lock:
+            self.batches += 1
+            self.frames += len(frames_b64)
+            self.busy_s += elapsed
+            self.last = stats
+        return results, stats
+
+    def stats(self):
+        with self._stats_lock:
+            return {'workers': self.workers, 'batches': self.batches, 'frames': self.frames,
+                    'fps': self.frames / self.busy_s if self.busy_s else None, 'last_batch': self.last}
+
+    def shutdown(self):
+        self._reset_pool()
@@ -0,0 +1,307 @@
+"""
+Prueba de carga HTTP de extremo a extremo: pacientes simulados en paralelo.
+
+Cada paciente es un hilo con su propia sesión (X-Session-Id) que:
+1. fija su video de referencia con /api/set_reference_video,
+2. envía frames JPEG a /api/evaluate_frame (cuerpo binario) al ritmo de una
+   cámara (--fps); si el servidor no alcanza, los frames atrasados se
+   descartan como haría el cliente,
+3. sincroniza el tiempo de la referencia con /api/sync_reference_time cada
+   --sync-every frames.
+
+Los frames se pre-extraen de los videos de dataset/ (cada paciente usa uno,
+en rotación) y se recodifican a JPEG con el ancho y la calidad de un celular.
+Groq se reemplaza por groq_stub.py (latencia configurable) para que la prueba
+no dependa de la red. Salvo que se indique --url, el servidor se lanza como
+subproceso (python app.py --port) apuntando al stub.
+
+Para cada nivel de --patients reporta throughput, percentiles de latencia por
+endpoint, tasa de errores, frames descartados y el CPU del servidor (de
+/api/ready, process_cpu_s): núcleos ocupados, CPU por paciente y pacientes por
+núcleo, marcando los niveles que cumplen --slo-ms en p95.
+
+Uso:
+    python prueba_carga.py --patients 1,2,4,8 --duration 30 [--fps 5] [--json carga.json]
+    python prueba_carga.py --url http://servidor:5000 --patients 4   # servidor ya levantado
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import requests
+
+from groq_stub import serve as serve_groq_stub
+from referencias import list_reference_videos
+
+ENDPOINTS = ('evaluate_frame', 'sync_reference_time', 'set_reference_video')
+
+
+def extract_frames(video_path, fps=5.0, max_frames=150, width=480, quality=70):
+    """Frames del video como [(segundo, bytes JPEG)], muestreados a `fps` y reescalados a `width`."""
+    import cv2
+    cap = cv2.VideoCapture(str(video_path))
+    if not cap.isOpened():
+        return []
+    video_fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    step = max(1, int(round(video_fps / fps)))
+    frames = []
+    index = 0
+    try:
+        while len(frames) < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if index % step == 0:
+                if width and frame.shape[1] > width:
+                    frame = cv2.resize(frame, (width, int(frame.shape[0] * width / frame.shape[1])),
+                                       interpolation=cv2.INTER_AREA)
+                ok, jpg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+                if ok:
+                    frames.append((index / video_fps, jpg.tobytes()))
+            index += 1
+    finally:
+        cap.release()
+    return frames
+
+
+class PatientStats:
+    """Latencias (ms) y errores por endpoint de un paciente."""
+
+    def __init__(self):
+        self.latencies = {name: [] for name in ENDPOINTS}
+        self.errors = {name: 0 for name in ENDPOINTS}
+        self.dropped = 0
+        self.error_samples = []
+
+    def record(self, endpoint, t0, response=None, error=None):
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        if error is None and response is not None and response.status_code == 200:
+            self.latencies[endpoint].append(elapsed_ms)
+            return True
+        self.errors[endpoint] += 1
+        if len(self.error_samples) < 5:
+            self.error_samples.append(f"{endpoint}: {error or response.status_code}")
+        return False
+
+
+def post(session, stats, url, endpoint, timeout, **kwargs):
+    t0 = time.perf_counter()
+    try:
+        response = session.post(url, timeout=timeout, **kwargs)
+    except requests.RequestException as e:
+        return stats.record(endpoint, t0, error=type(e).__name__)
+    return stats.record(endpoint, t0, response)
+
+
+def run_patient(base_url, patient_id, video, frames, args, start_at, stop_at, stats):
+    """Un paciente: referencia, luego frames a ritmo de cámara hasta stop_at."""
+    session = requests.Session()
+    session.headers['X-Session-Id'] = f'carga-{patient_id}'
+    condition, video_name = video.parent.name, video.name
+    post(session, stats, f'{base_url}/api/set_reference_video', 'set_reference_video', args.timeout,
+         json={'condition': condition, 'video_name': video_name, 'target_fps': 3})
+
+    period = 1.0 / args.fps
+    # Pacientes desfasados dentro del primer periodo para no llegar todos juntos
+    start = start_at + (patient_id % 10) * period / 10
+    i = 0
+    while True:
+        due = start + i * period
+        now = time.perf_counter()
+        if due >= stop_at:
+            break
+        if due > now:
+            time.sleep(due - now)
+        elif now - due > period:
+            # La cámara ya tomó el siguiente frame: este se descarta
+            stats.dropped += 1
+            i += 1
+            continue
+        t_video, jpg = frames[i % len(frames)]
+        if i % args.sync_every == 0:
+            post(session, stats, f'{base_url}/api/sync_reference_time', 'sync_reference_time', args.timeout,
+                 json={'current_time': t_video})
+        post(session, stats, f'{base_url}/api/evaluate_frame', 'evaluate_frame', args.timeout,
+             data=jpg, headers={'Content-Type': 'image/jpeg'})
+        i += 1
+
+
+def server_cpu(base_url):
+    """Segundos de CPU del proceso servidor (process_cpu_s de /api/ready), o None."""
+    try:
+        return requests.get(f'{base_url}/api/ready', timeout=5).json().get('process_cpu_s')
+    except Exception:
+        return None
+
+
+def percentiles(values):
+    if not values:
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'max_ms': None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99), 'max_ms': float(max(values))}
+
+
+def run_level(base_url, n_patients, videos, frames_by_video, args):
+    """Corre un nivel de carga y devuelve su resumen."""
+    all_stats = [PatientStats() for _ in range(n_patients)]
+    cpu_before = server_cpu(base_url)
+    client_cpu_before = time.process_time()
+    start_at = time.perf_counter() + 0.5
+    stop_at = start_at + args.duration
+    threads = []
+    for p in range(n_patients):
+        video = videos[p % len(videos)]
+        t = threading.Thread(target=run_patient, daemon=True,
+                             args=(base_url, p, video, frames_by_video[video], args, start_at, stop_at, all_stats[p]))
+        t.start()
+        threads.append(t)
+    for t in threads:
+        t.join(args.duration + args.timeout + 30)
+    elapsed = time.perf_counter() - start_at
+    cpu_after = server_cpu(base_url)
+
+    summary = {'patients': n_patients, 'duration_s': elapsed, 'endpoints': {}}
+    for endpoint in ENDPOINTS:
+        latencies = [v for s in all_stats for v in s.latencies[endpoint]]
+        errors = sum(s.errors[endpoint] for s in all_stats)
+        total = len(latencies) + errors
+        summary['endpoints'][endpoint] = {'ok': len(latencies), 'errors': errors,
+                                          'error_rate': errors / total if total else 0.0, **percentiles(latencies)}
+    frames_ok = summary['endpoints']['evaluate_frame']['ok']
+    frames_target = n_patients * args.duration * args.fps
+    summary['throughput_fps'] = frames_ok / elapsed
+    summary['fps_per_patient'] = frames_ok / elapsed / n_patients
+    summary['dropped_frames'] = sum(s.dropped for s in all_stats)
+    summary['delivered_ratio'] = frames_ok / frames_target if frames_target else None
+    summary['client_cpu_s'] = time.process_time() - client_cpu_before
+    if cpu_before is not None and cpu_after is not None:
+        cores = (cpu_after - cpu_before) / elapsed
+        summary['server_cores'] = cores
+        summary['cpu_ms_per_frame'] = (cpu_after - cpu_before) * 1000 / frames_ok if frames_ok else None
+        summary['cores_per_patient'] = cores / n_patients
+        summary['patients_per_core'] = n_patients / cores if cores > 0 else None
+    p95 = summary['endpoints']['evaluate_frame']['p95_ms']
+    summary['meets_slo'] = (p95 is not None and p95 <= args.slo_ms
+                            and summary['endpoints']['evaluate_frame']['error_rate'] < 0.01
+                            and (summary['delivered_ratio'] or 0) >= 0.95)
+    summary['error_samples'] = [e for s in all_stats for e in s.error_samples][:10]
+    return summary
+
+
+def print_level(summary):
+    ev = summary['endpoints']['evaluate_frame']
+    sync = summary['endpoints']['sync_reference_time']
+    fmt = lambda v: f'{v:.0f}' if v is not None else '-'
+    print(f"[CARGA] {summary['patients']:>3} pacientes | {summary['throughput_fps']:6.1f} frames/s "
+          f"({summary['fps_per_patient']:.1f} por paciente, {summary['dropped_frames']} descartados) | "
+          f"evaluate_frame p50 {fmt(ev['p50_ms'])} / p95 {fmt(ev['p95_ms'])} / p99 {fmt(ev['p99_ms'])} ms, "
+          f"errores {ev['error_rate']:.1%} | sync p95 {fmt(sync['p95_ms'])} ms")
+    if summary.get('server_cores') is not None:
+        per_core = summary['patients_per_core']
+        print(f"        CPU servidor {summary['server_cores']:.2f} núcleos, {summary['cpu_ms_per_frame'] or 0:.1f} ms "
+              f"por frame, {summary['cores_per_patient']:.2f} núcleos por paciente"
+              + (f" -> {per_core:.1f} pacientes por núcleo" if per_core else ""))
+    print(f"        {'cumple' if summary['meets_slo'] else 'NO cumple'} el objetivo "
+          f"(p95 <= SLO, errores < 1%, >= 95% de los frames entregados)")
+    for sample in summary['error_samples']:
+        print(f"        error: {sample}")
+
+
+def start_server(port, groq_url, log_path):
+    """Lanza app.py en un subproceso apuntando al stub de Groq; devuelve el Popen."""
+    env = dict(os.environ, GROQ_API_KEY='stub', GROQ_API_URL=groq_url, PYTHONUNBUFFERED='1')
+    log = open(log_path, 'w', encoding='utf-8')
+    return subprocess.Popen([sys.executable, 'app.py', '--port', str(port)], cwd=Path(__file__).parent,
+                            env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_ready(base_url, server=None, timeout=300):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server is not None and server.poll() is not None:
+            return False
+        try:
+            if requests.get(f'{base_url}/api/ready', timeout=2).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(1)
+    return False
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Prueba de carga de /api/evaluate_frame con pacientes simulados')
+    parser.add_argument('--url', type=str, default=None, help='Servidor ya levantado (si no, se lanza app.py)')
+    parser.add_argument('--port', type=int, default=5057, help='Puerto del servidor lanzado (default: 5057)')
+    parser.add_argument('--patients', type=str, default='1,2,4', help='Niveles de pacientes simultáneos (default: 1,2,4)')
+    parser.add_argument('--duration', type=float, default=20, help='Segundos por nivel (default: 20)')
+    parser.add_argument('--fps', type=float, default=5, help='Frames por segundo por paciente (default: 5)')
+    parser.add_argument('--sync-every', type=int, default=5, help='Sincronizar la referencia cada N frames')
+    parser.add_argument('--width', type=int, default=480, help='Ancho de los frames enviados (default: 480)')
+    parser.add_argument('--quality', type=int, default=70, help='Calidad JPEG de los frames (default: 70)')
+    parser.add_argument('--max-frames', type=int, default=150, help='Frames pre-extraídos por video')
+    parser.add_argument('--videos', type=int, default=4, help='Videos distintos de dataset/ a usar (default: 4)')
+    parser.add_argument('--timeout', type=float, default=10, help='Timeout por petición (s)')
+    parser.add_argument('--slo-ms', type=float, default=250, help='Objetivo de p95 de evaluate_frame (default: 250)')
+    parser.add_argument('--groq-port', type=int, default=8009, help='Puerto del stub de Groq (default: 8009)')
+    parser.add_argument('--groq-latency-ms', type=float, default=300, help='Latencia del stub de Groq')
+    parser.add_argument('--groq-fail-rate', type=float, default=0.0, help='Fracción de fallos del stub de Groq')
+    parser.add_argument('--json', type=str, default=None, help='Guardar los resultados en JSON')
+    args = parser.parse_args()
+
+    levels = [int(n) for n in args.patients.split(',') if n.strip()]
+    videos = list_reference_videos(Path(__file__).parent / 'dataset')[:args.videos]
+    if not videos:
+        print("Error: no hay videos en dataset/")
+        exit(1)
+    print(f"[CARGA] Pre-extrayendo frames de {len(videos)} videos ({args.fps:g} fps, {args.width}px, calidad {args.quality})")
+    frames_by_video = {v: extract_frames(v, args.fps, args.max_frames, args.width, args.quality) for v in videos}
+    videos = [v for v in videos if frames_by_video[v]]
+    sizes = [len(jpg) for v in videos for _, jpg in frames_by_video[v]]
+    print(f"[CARGA] {len(sizes)} frames, {np.mean(sizes) / 1024:.1f} KB promedio")
+
+    serve_groq_stub(args.groq_port, args.groq_latency_ms, args.groq_latency_ms / 3, args.groq_fail_rate, background=True)
+    groq_url = f'http://127.0.0.1:{args.groq_port}/openai/v1/chat/completions'
+    server = None
+    base_url = args.url.rstrip('/') if args.url else f'http://127.0.0.1:{args.port}'
+    if args.url is None:
+        log_path = Path(__file__).parent / 'prueba_carga_servidor.log'
+        print(f"[CARGA] Lanzando app.py en el puerto {args.port} (Groq: stub en {groq_url}; log: {log_path.name})")
+        server = start_server(args.port, groq_url, log_path)
+    try:
+        if not wait_ready(base_url, server):
+            print(f"Error: el servidor {base_url} no quedó listo")
+            exit(1)
+        # Extraer (o leer de caché) las referencias antes de medir
+        for v in videos:
+            requests.post(f'{base_url}/api/set_reference_video', timeout=600, headers={'X-Session-Id': 'carga-prep'},
+                          json={'condition': v.parent.name, 'video_name': v.name, 'target_fps': 3})
+
+        results = []
+        for n in levels:
+            summary = run_level(base_url, n, videos, frames_by_video, args)
+            print_level(summary)
+            results.append(summary)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(30)
+
+    holding = [r for r in results if r['meets_slo']]
+    if holding:
+        best = max(holding, key=lambda r: r['patients'])
+        print(f"\n[CARGA] Máximo nivel que cumple el objetivo: {best['patients']} pacientes"
+              + (f" ({best['patients_per_core']:.1f} por núcleo)" if best.get('patients_per_core') else ''))
+    else:
+        print("\n[CARGA] Ningún nivel cumple el objetivo")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'config': vars(args), 'levels': results}, f, ensure_ascii=False, indent=1)
+        print(f"[CARGA] Resultados guardados en {args.json}")
@@ -0,0 +1,424 @@
+"""
+Extracción de secuencias de landmarks de videos de referencia con caché en disco.
+
+La caché es direccionable por contenido: la clave combina la ruta del video,
+su tamaño y fecha de modificación, el muestreo (target_fps) y la configuración
+de MediaPipe. Si el video en dataset/ cambia, la clave cambia y la entrada
+anterior se descarta automáticamente.
+
+ReferenceTimeline resuelve "landmarks de la referencia en el segundo t" para
+evaluate_frame cuando la sesión no cargó una secuencia: usa un índice por video
+(landmarks muestreados a REFERENCE_INDEX_FPS con su tiempo, en la misma caché)
+y búsqueda binaria, sin abrir ni decodificar el video por petición.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from pathlib import Path
+
+import numpy as np
+
+from landmarks import from_pose_landmarks, sequence_array
+
+# Directorio de la caché (relativo a la carpeta 'modelo', igual que 'dataset/')
+CACHE_DIR = Path(os.environ.get('REFERENCE_CACHE_DIR', 'cache_referencias'))
+# Versión del formato: incrementarla invalida todas las entradas existentes
+CACHE_FORMAT_VERSION = 1
+
+# Configuración de MediaPipe usada para las referencias (forma parte de la clave)
+POSE_SETTINGS = {
+    'static_image_mode': True,
+    'model_complexity': 1,
+    'min_detection_confidence': 0.4,  # Reducido de 0.6 a 0.4
+}
+MAX_SAMPLES = 600  # Duplicado de 300 a 600
+
+# Índice por tiempo para el respaldo de evaluate_frame: muestreo, muestras máximas por video
+# y frames decodificados (landmarks) que se recuerdan mientras el índice no está listo
+REFERENCE_INDEX_FPS = float(os.environ.get('REFERENCE_INDEX_FPS', 10))
+REFERENCE_INDEX_MAX_SAMPLES = int(os.environ.get('REFERENCE_INDEX_MAX_SAMPLES', 6000))
+REFERENCE_FRAME_CACHE_SIZE = int(os.environ.get('REFERENCE_FRAME_CACHE_SIZE', 64))
+
+# Extensiones de video soportadas en dataset/<condición>/
+VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mov', '.mkv', '.webm'}
+
+# Caché en memoria de secuencias ya leídas (clave -> resultado)
+_memory_cache = {}
+_MEMORY_CACHE_MAX = 64
+
+
+def _digest(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+
+def cache_key(video_path, target_fps, max_samples=MAX_SAMPLES):
+    """Clave de caché '<ruta>_<config>_<contenido>': cambia si cambia el archivo o la configuración."""
+    path = Path(video_path)
+    stat = path.stat()
+    path_part = _digest(str(path.resolve()))
+    settings_part = _digest({
+        'target_fps': float(target_fps),
+        'max_samples': int(max_samples),
+        'pose': POSE_SETTINGS,
+        'version': CACHE_FORMAT_VERSION,
+    })
+    content_part = _digest({'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns})
+    return f"{path_part}_{settings_part}_{content_part}"
+
+
+def _cache_file(key):
+    return CACHE_DIR / f"{key}.npz"
+
+
+def _discard_stale(key):
+    """Elimina entradas del mismo video generadas con una versión anterior del archivo."""
+    path_part, _, content_part = key.split('_')
+    for old in CACHE_DIR.glob(f"{path_part}_*.npz"):
+        if not old.stem.endswith(f"_{content_part}"):
+            try:
+                old.unlink()
+                print(f"Caché de referencia obsoleta eliminada: {old.name}")
+            except OSError:
+                pass
+
+
+def _remember(key, result):
+    if len(_memory_cache) >= _MEMORY_CACHE_MAX:
+        _memory_cache.pop(next(iter(_memory_cache)))
+    _memory_cache[key] = result
+
+
+def load_cached_sequence(video_path, target_fps, max_samples=MAX_SAMPLES):
+    """Devuelve el resultado cacheado o None si no existe (o está obsoleto)."""
+    key = cache_key(video_path, target_fps, max_samples)
+    if key in _memory_cache:
+        return _memory_cache[key]
+
+    path = _cache_file(key)
+    if not path.exists():
+        if CACHE_DIR.exists():
+            _discard_stale(key)
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            result = {
+                'landmarks': sequence_array(data['landmarks']),
+                'video_fps': float(data['video_fps']),
+                'frames_read': int(data['frames_read']),
+                'skipped': int(data['skipped']),
+                # Entradas anteriores a los tiempos por muestra no los tienen
+                'timestamps': np.asarray(data['timestamps'], dtype=np.float64) if 'timestamps' in data.files else None,
+            }
+    except Exception as e:
+        print(f"WARN: Entrada de caché ilegible {path.name}: {e}")
+        return None
+    _remember(key, result)
+    return result
+
+
+def store_cached_sequence(video_path, target_fps, result, max_samples=MAX_SAMPLES):
+    """Guarda el resultado en disco con escritura atómica (formato .npz, float32)."""
+    key = cache_key(video_path, target_fps, max_samples)
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    path = _cache_file(key)
+    tmp_path = CACHE_DIR / f"{key}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f,
+                 landmarks=np.asarray(result['landmarks'], dtype=np.float32),
+                 video_fps=np.float64(result['video_fps']),
+                 frames_read=np.int64(result['frames_read']),
+                 skipped=np.int64(result['skipped']),
+                 timestamps=np.asarray(result['timestamps'], dtype=np.float64))
+    os.replace(tmp_path, path)
+    _discard_stale(key)
+    _remember(key, result)
+
+
+def extract_reference_sequence(video_path, target_fps=3, max_samples=MAX_SAMPLES):
+    """Extrae landmarks de un video muestreado a target_fps con MediaPipe (sin caché).
+    Devuelve dict con 'landmarks' (array (N, 33, 3)), 'timestamps' (segundos de cada muestra),
+    'video_fps', 'frames_read' y 'skipped', o None si el video no se pudo abrir.
+    """
+    import cv2
+    import mediapipe as mp
+
+    cap = cv2.VideoCapture(str(video_path))
+    if not cap.isOpened():
+        return None
+
+    # Configurar muestreo - extraer más frames para mejor detección
+    video_fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    step = max(1, int(round(video_fps / float(target_fps))))
+
+    seq = []
+    timestamps = []
+    frame_idx = 0
+    samples = 0
+    skipped = 0  # Contador de frames sin detección
+
+    print(f"Procesando video de referencia: {video_path}")
+    print(f"Video FPS: {video_fps}, Target FPS: {target_fps}, Step: {step}")
+
+    # Usar confianza más baja para detectar más poses
+    local_pose = mp.solutions.pose.Pose(**POSE_SETTINGS)
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+
+            if frame_idx % step == 0:
+                # Procesar con MediaPipe
+                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                results = local_pose.process(frame_rgb)
+                if results.pose_landmarks:
+                    seq.append(from_pose_landmarks(results.pose_landmarks))
+                    timestamps.append(frame_idx / video_fps)
+                    samples += 1
+                    if samples >= max_samples:
+                        print(f"Límite de {max_samples} muestras alcanzado")
+                        break
+                else:
+                    skipped += 1
+
+            frame_idx += 1
+    finally:
+        cap.release()
+        try:
+            local_pose.close()
+        except Exception:
+            pass
+
+    print(f"Extracción completa - Frames procesados: {frame_idx}, Detecciones: {samples}, Sin detección: {skipped}")
+
+    return {
+        'landmarks': sequence_array(seq),
+        'timestamps': np.asarray(timestamps, dtype=np.float64),
+        'video_fps': float(video_fps),
+        'frames_read': frame_idx,
+        'skipped': skipped,
+    }
+
+
+def get_reference_sequence(video_path, target_fps=3, max_samples=MAX_SAMPLES):
+    """Devuelve (resultado, desde_cache). Usa la caché si está vigente; si no, extrae y guarda.
+    resultado es None si el video no se pudo abrir.
+    """
+    t0 = time.perf_counter()
+    cached = load_cached_sequence(video_path, target_fps, max_samples)
+    if cached is not None:
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        print(f"Referencia desde caché: {video_path} ({len(cached['landmarks'])} frames, {elapsed_ms:.1f} ms)")
+        return cached, True
+
+    result = extract_reference_sequence(video_path, target_fps, max_samples)
+    if result is None:
+        return None, False
+    if len(result['landmarks']) > 0:
+        try:
+            store_cached_sequence(video_path, target_fps, result, max_samples)
+        except Exception as e:
+            print(f"WARN: No se pudo guardar la referencia en caché: {e}")
+    return result, False
+
+
+def list_reference_videos(dataset_dir='dataset'):
+    """Lista los videos del catálogo (mismo recorrido que /api/datasets y /api/images)."""
+    dataset_dir = Path(dataset_dir)
+    if not dataset_dir.exists():
+        return []
+    videos = []
+    for condition in sorted(d for d in dataset_dir.iterdir() if d.is_dir()):
+        videos.extend(sorted(f for f in condition.iterdir()
+                             if f.is_file() and f.suffix.lower() in VIDEO_EXTENSIONS))
+    return videos
+
+
+def _preextract_worker(video_path, target_fps, max_samples=MAX_SAMPLES):
+    """Tarea del pool: extrae (o valida en caché) una referencia y devuelve un resumen."""
+    t0 = time.perf_counter()
+    try:
+        result, from_cache = get_reference_sequence(video_path, target_fps, max_samples)
+        frames = len(result['landmarks']) if result is not None else 0
+        error = None if result is not None else 'No se pudo abrir el video'
+    except Exception as e:
+        frames, from_cache, error = 0, False, str(e)
+    return {
+        'video': str(video_path),
+        'frames': frames,
+        'from_cache': from_cache,
+        'seconds': time.perf_counter() - t0,
+        'error': error,
+    }
+
+
+def preextract_references(dataset_dir='dataset', target_fps=3, workers=None, max_samples=MAX_SAMPLES):
+    """Extrae todas las referencias del catálogo en un pool de procesos y las publica en la caché.
+    Reporta progreso y tiempos por video. Devuelve la lista de resúmenes.
+    """
+    videos = list_reference_videos(dataset_dir)
+    if not videos:
+        print(f"[PREEXTRACCION] No se encontraron videos en {dataset_dir}/")
+        return []
+
+    workers = workers or os.cpu_count() or 1
+    print(f"[PREEXTRACCION] {len(videos)} videos, {workers} procesos, target_fps={target_fps}")
+    t0 = time.perf_counter()
+    summaries = []
+    # 'spawn' evita heredar hilos/estado de MediaPipe del proceso servidor
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn')) as pool:
+        futures = [pool.submit(_preextract_worker, str(v), target_fps, max_samples) for v in videos]
+        for done, future in enumerate(as_completed(futures), start=1):
+            summary = future.result()
+            summaries.append(summary)
+            if summary['error']:
+                status = f"ERROR: {summary['error']}"
+            else:
+                origin = 'caché' if summary['from_cache'] else 'extraído'
+                status = f"{summary['frames']} frames ({origin})"
+            print(f"[PREEXTRACCION] [{done}/{len(videos)}] {summary['video']} - {status} en {summary['seconds']:.2f} s")
+
+    # Cargar en la caché en memoria de este proceso para que la primera petición no toque disco
+    for v in videos:
+        try:
+            load_cached_sequence(v, target_fps, max_samples)
+        except Exception:
+            pass
+
+    failed = sum(1 for s in summaries if s['error'])
+    print(f"[PREEXTRACCION] Completado en {time.perf_counter() - t0:.2f} s ({failed} con error)")
+    return summaries
+
+
+class ReferenceIndex:
+    """Landmarks de un video de referencia indexados por tiempo (búsqueda binaria)."""
+
+    def __init__(self, timestamps, landmarks, fps):
+        self.timestamps = np.asarray(timestamps, dtype=np.float64)
+        self.landmarks = sequence_array(landmarks)
+        self.fps = fps
+
+    def lookup(self, t, max_gap=None):
+        """Landmarks de la muestra más cercana a t segundos, o None si está a más de max_gap
+        (por defecto dos periodos de muestreo: fuera del video o tramo sin detección)."""
+        if not len(self.timestamps):
+            return None
+        i = int(np.searchsorted(self.timestamps, t))
+        if i == len(self.timestamps) or (i > 0 and t - self.timestamps[i - 1] <= self.timestamps[i] - t):
+            i -= 1
+        max_gap = 2.0 / self.fps if max_gap is None else max_gap
+        if abs(self.timestamps[i] - t) > max_gap:
+            return None
+        return self.landmarks[i]
+
+
+class ReferenceTimeline:
+    """Landmarks de la referencia en un tiempo dado, para evaluate_frame sin secuencia cargada.
+
+    El primer pedido de un video lanza la construcción de su índice en segundo plano
+    (o lo lee de la caché en disco). Mientras no está listo, o si el tiempo cae fuera del
+    índice, se decodifica el frame con OpenCV y se procesa con una instancia de
+    `pose_checkout()`; esos resultados se guardan en una LRU por (video, frame).
+    """
+
+    def __init__(self, pose_checkout, index_fps=REFERENCE_INDEX_FPS, max_samples=REFERENCE_INDEX_MAX_SAMPLES,
+                 frame_cache_size=REFERENCE_FRAME_CACHE_SIZE):
+        self.pose_checkout = pose_checkout
+        self.index_fps = index_fps
+        self.max_samples = max_samples
+        self.frame_cache_size = frame_cache_size
+        self._indexes = {}
+        self._building = set()
+        self._frames = OrderedDict()
+        self._video_fps = {}
+        self._lock = threading.Lock()
+        self.counters = {'index_hits': 0, 'decoded': 0, 'frame_cache_hits': 0, 'indexes_built': 0}
+
+    def _build(self, video_path, key):
+        try:
+            result = load_cached_sequence(video_path, self.index_fps, self.max_samples)
+            if result is None or result.get('timestamps') is None:
+                result = extract_reference_sequence(video_path, self.index_fps, self.max_samples)
+                if result is not None and len(result['landmarks']):
+                    store_cached_sequence(video_path, self.index_fps, result, self.max_samples)
+            index = ReferenceIndex(result['timestamps'], result['landmarks'], self.index_fps) if result else None
+        except Exception as e:
+            print(f"WARN: No se pudo indexar la referencia {video_path}: {e}")
+            index = None
+        with self._lock:
+            self._indexes[key] = index
+            self._building.discard(key)
+            self.counters['indexes_built'] += 1
+        if index is not None:
+            print(f"Índice de referencia listo: {video_path} ({len(index.timestamps)} muestras a {self.index_fps:g} fps)")
+
+    def index(self, video_path, wait=False):
+        """Índice del video, o None si aún se está construyendo (con wait=True se construye aquí)."""
+        key = cache_key(video_path, self.index_fps, self.max_samples)
+        with self._lock:
+            if key in self._indexes:
+                return self._indexes[key]
+            start = key not in self._building
+            self._building.add(key)
+        if wait and start:
+            self._build(video_path, key)
+            return self._indexes.get(key)
+        if start:
+            threading.Thread(target=self._build, args=(video_path, key), daemon=True).start()
+        return None
+
+    def _decoded(self, video_path, t):
+        import cv2
+        path = str(video_path)
+        fps = self._video_fps.get(path)
+        if fps is not None:
+            key = (path, int(t * fps))
+            with self._lock:
+                if key in self._frames:
+                    self._frames.move_to_end(key)
+                    self.counters['frame_cache_hits'] += 1
+                    return self._frames[key]
+        cap = cv2.VideoCapture(path)
+        try:
+            if not cap.isOpened():
+                return None
+            fps = self._video_fps.setdefault(path, cap.get(cv2.CAP_PROP_FPS) or 30.0)
+            key = (path, int(t * fps))
+            cap.set(cv2.CAP_PROP_POS_FRAMES, key[1])
+            ret, frame = cap.read()
+        finally:
+            cap.release()
+        landmarks = None
+        if ret:
+            with self.pose_checkout() as pose:
+                results = pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            if results.pose_landmarks:
+                landmarks = from_pose_landmarks(results.pose_landmarks)
+        with self._lock:
+            self.counters['decoded'] += 1
+            self._frames[key] = landmarks
+            while len(self._frames) > self.frame_cache_size:
+                self._frames.popitem(last=False)
+        return landmarks
+
+    def landmarks_at(self, video_path, t):
+        """Landmarks (33, 3) de la referencia en el segundo t, o None."""
+        index = self.index(video_path)
+        if index is not None:
+            landmarks = index.lookup(t)
+            if landmarks is not None:
+                with self._lock:
+                    self.counters['index_hits'] += 1
+                return landmarks
+        return self._decoded(video_path, t)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, indexes=sum(1 for i in self._indexes.values() if i is not None),
+                        building=len(self._building), frame_cache=len(self._frames))
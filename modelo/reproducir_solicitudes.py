@@ -0,0 +1,124 @@
+"""
+Reproduce offline las solicitudes lentas guardadas por el grabador
+(grabador_solicitudes.py) contra el código actual.
+
+Cada grabación se envía a su endpoint con el cliente de pruebas de Flask, en una
+sesión propia con el mismo estado que tenía al llegar (secuencia o frame de
+referencia, índice, tolerancia y buffer de landmarks recientes). Muestra la
+latencia grabada contra la reproducida (mínimo y mediana de --repeat), el
+desglose por etapa de metricas.py y si el veredicto coincide con el grabado.
+Con --profile guarda además un perfil por muestreo de la reproducción en
+formato folded (flamegraph.pl / speedscope).
+
+En DTW_MODE=streaming el estado del DTW incremental no se graba: la
+reproducción empieza con uno nuevo desde el índice grabado.
+
+Uso:
+    python reproducir_solicitudes.py [grabaciones_lentas/ | archivo.npz ...] [--repeat 5] [--profile perfil.folded]
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+
+from grabador_solicitudes import FLIGHT_RECORDER_DIR, load_capture
+
+
+def capture_paths(targets):
+    """Archivos .npz de una lista de archivos y/o carpetas."""
+    paths = []
+    for target in targets:
+        target = Path(target)
+        paths.extend(sorted(target.glob('*.npz')) if target.is_dir() else [target])
+    return paths
+
+
+def restore_session(app_module, session_id, capture):
+    """Deja la sesión `session_id` con el estado grabado."""
+    meta = capture['meta'].get('session', {})
+    state = app_module.sessions.get(session_id)
+    if len(capture['reference_sequence']):
+        state.set_reference(capture['reference_sequence'], meta.get('reference_fps'))
+    else:
+        state.set_reference([])
+        state.reference_landmarks = capture['reference_landmarks']
+    state.reference_index = int(meta.get('reference_index', 0))
+    state.tolerance = float(meta.get('tolerance', 1.0))
+    state.user_buffer = list(capture['user_buffer'])
+    state.llm_verdict = None
+
+
+def replay(app_module, client, capture, session_id):
+    """Ejecuta la grabación una vez; devuelve (ms, status, respuesta JSON o None)."""
+    meta = capture['meta']
+    restore_session(app_module, session_id, capture)
+    t0 = time.perf_counter()
+    response = client.open(meta['path'], method=meta.get('method', 'POST'), data=capture['body'],
+                           content_type=meta.get('content_type'), query_string=meta.get('query_string') or None,
+                           headers={'X-Session-Id': session_id})
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+    return elapsed_ms, response.status_code, response.get_json(silent=True)
+
+
+def stage_totals(metricas):
+    return {name: (s.histogram.count, s.histogram.total_ms) for name, s in metricas.STAGES.items()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Reproducir solicitudes lentas grabadas')
+    parser.add_argument('targets', nargs='*', default=[str(FLIGHT_RECORDER_DIR)],
+                        help=f'Archivos .npz o carpetas (default: {FLIGHT_RECORDER_DIR}/)')
+    parser.add_argument('--repeat', type=int, default=3, help='Ejecuciones por grabación (default: 3)')
+    parser.add_argument('--profile', type=str, default=None, help='Guardar perfil folded de la reproducción')
+    args = parser.parse_args()
+
+    paths = capture_paths(args.targets)
+    if not paths:
+        print(f"No hay grabaciones en {', '.join(args.targets)}")
+        exit(1)
+
+    import app as app_module
+    import metricas
+    from perfilador import SamplingProfiler
+
+    app_module.flight_recorder.threshold_ms = 0  # no volver a grabar lo que se reproduce
+    app_module.ensure_runtime()
+    client = app_module.app.test_client()
+    profiler = SamplingProfiler(seconds=3600).start() if args.profile else None
+
+    print(f"{len(paths)} grabaciones, {args.repeat} ejecuciones cada una\n")
+    for i, path in enumerate(paths):
+        try:
+            capture = load_capture(path)
+        except Exception as e:
+            print(f"{path.name}: ilegible ({e})")
+            continue
+        meta = capture['meta']
+        before = stage_totals(metricas)
+        runs = [replay(app_module, client, capture, f'replay-{i}') for _ in range(max(1, args.repeat))]
+        after = stage_totals(metricas)
+        times = [r[0] for r in runs]
+        status, result = runs[-1][1], runs[-1][2] or {}
+        recorded = meta.get('response') or {}
+        same = recorded.get('feedback') == result.get('feedback')
+
+        print(f"{path.name} [{meta.get('source')}, {meta.get('content_type')}]")
+        print(f"  grabada: {meta.get('elapsed_ms', 0):.1f} ms | reproducida: mín {min(times):.1f} ms, "
+              f"mediana {np.median(times):.1f} ms | status {status}")
+        print(f"  veredicto grabado: {recorded.get('feedback')} / reproducido: {result.get('feedback')} "
+              f"({'igual' if same else 'distinto'})")
+        stages = []
+        for name, (count, total) in after.items():
+            calls = count - before[name][0]
+            if calls:
+                stages.append(f"{name} {(total - before[name][1]) / len(runs):.1f} ms")
+        print(f"  etapas (promedio por ejecución): {', '.join(stages) or '-'}")
+        app_module.sessions.drop(f'replay-{i}')
+
+    if profiler is not None:
+        profiler.stop()
+        profiler.wait()
+        Path(args.profile).write_text(profiler.folded(), encoding='utf-8')
+        print(f"\nPerfil guardado en {args.profile} ({profiler.samples} muestras)")
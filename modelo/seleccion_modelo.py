@@ -0,0 +1,198 @@
+"""
+Selección de modelo según precisión y latencia de inferencia (usado por entrenar_modelo.py --select-model).
+
+Evalúa varios candidatos con validación cruzada en paralelo (bosques más
+pequeños, gradient boosting, regresión logística y kNN sobre landmarks
+normalizados por pelvis y un bosque pequeño destilado del bosque de 400
+árboles). Para cada uno mide la latencia por frame (una fila, como
+classify_posture) y por lote con el motor que usa el servidor (los bosques se
+compilan con inferencia_bosque.compile_forest) y el tamaño serializado.
+Se elige, dentro del frente de Pareto (precisión, latencia, tamaño), el modelo
+más rápido cuya precisión no baje más de `max_accuracy_drop` respecto al mejor.
+"""
+
+import pickle
+import time
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import BaseEstimator, ClassifierMixin, clone
+from sklearn.ensemble import ExtraTreesClassifier, HistGradientBoostingClassifier, RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import StratifiedKFold, cross_val_score
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import FunctionTransformer, StandardScaler
+
+from alineacion import normalize_frames_by_pelvis
+from inferencia_bosque import compile_forest
+
+
+def normalize_rows(X):
+    """Filas planas de landmarks (n, 99) normalizadas por pelvis (centro de caderas y largo del torso)."""
+    X = np.asarray(X, dtype=float)
+    return normalize_frames_by_pelvis(X.reshape((X.shape[0], -1, 3))).reshape((X.shape[0], -1))
+
+
+class DistilledForestClassifier(ClassifierMixin, BaseEstimator):
+    """Bosque pequeño entrenado para imitar a un bosque grande (maestro).
+
+    El maestro se entrena con los datos reales y etiqueta los mismos datos más
+    copias con ruido gaussiano; el alumno aprende esas etiquetas, así hereda la
+    frontera de decisión del maestro con muchos menos árboles. Para servir se
+    exporta `student_` (un RandomForestClassifier normal, compilable).
+    """
+
+    def __init__(self, n_estimators=40, max_depth=10, teacher_estimators=400, n_augment=4,
+                 noise=0.02, random_state=42):
+        self.n_estimators = n_estimators
+        self.max_depth = max_depth
+        self.teacher_estimators = teacher_estimators
+        self.n_augment = n_augment
+        self.noise = noise
+        self.random_state = random_state
+
+    def fit(self, X, y):
+        X = np.asarray(X, dtype=float)
+        teacher = RandomForestClassifier(n_estimators=self.teacher_estimators, max_depth=12,
+                                         min_samples_leaf=2, random_state=self.random_state)
+        teacher.fit(X, y)
+        rng = np.random.default_rng(self.random_state)
+        scale = self.noise * X.std(axis=0)
+        X_aug = np.concatenate([X] + [X + rng.normal(0, 1, X.shape) * scale for _ in range(self.n_augment)])
+        self.student_ = RandomForestClassifier(n_estimators=self.n_estimators, max_depth=self.max_depth,
+                                               random_state=self.random_state)
+        self.student_.fit(X_aug, teacher.predict(X_aug))
+        self.classes_ = self.student_.classes_
+        return self
+
+    def predict(self, X):
+        return self.student_.predict(X)
+
+    def predict_proba(self, X):
+        return self.student_.predict_proba(X)
+
+
+def candidate_models(random_state=42):
+    """Modelos candidatos: nombre -> estimador sin entrenar."""
+    return {
+        'rf_400_d12': RandomForestClassifier(n_estimators=400, max_depth=12, min_samples_leaf=2,
+                                             random_state=random_state),
+        'rf_100_d10': RandomForestClassifier(n_estimators=100, max_depth=10, min_samples_leaf=2,
+                                             random_state=random_state),
+        'rf_40_d8': RandomForestClassifier(n_estimators=40, max_depth=8, min_samples_leaf=2,
+                                           random_state=random_state),
+        'extra_trees_100': ExtraTreesClassifier(n_estimators=100, max_depth=12, min_samples_leaf=2,
+                                                random_state=random_state),
+        'gradient_boosting': HistGradientBoostingClassifier(max_iter=100, max_depth=6, random_state=random_state),
+        'logistic_norm': make_pipeline(FunctionTransformer(normalize_rows), StandardScaler(),
+                                       LogisticRegression(max_iter=2000)),
+        'knn_norm': make_pipeline(FunctionTransformer(normalize_rows), StandardScaler(),
+                                  KNeighborsClassifier(n_neighbors=5)),
+        'rf_40_destilado': DistilledForestClassifier(random_state=random_state),
+    }
+
+
+def serving_model(model):
+    """Modelo tal como se exporta y se usa en el servidor."""
+    if isinstance(model, DistilledForestClassifier):
+        model = model.student_
+    return model
+
+
+def measure_latency(model, X, n_frames=200, batch_size=256, repeat=5):
+    """Latencia por frame y por fila en lote (ms, mediana) del modelo ya entrenado."""
+    served = compile_forest(model) if hasattr(model, 'estimators_') else model
+    X = np.asarray(X, dtype=float)
+    rows = X[np.random.default_rng(0).integers(0, len(X), n_frames)]
+    batch = X[np.random.default_rng(1).integers(0, len(X), batch_size)]
+    served.predict(rows[:1])  # calentar
+
+    frame_times = []
+    for row in rows:
+        t0 = time.perf_counter()
+        served.predict(row.reshape(1, -1))
+        frame_times.append((time.perf_counter() - t0) * 1000)
+    batch_times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        served.predict(batch)
+        batch_times.append((time.perf_counter() - t0) * 1000 / batch_size)
+    return float(np.median(frame_times)), float(np.median(batch_times)), type(served).__name__
+
+
+def pareto_front(results):
+    """Nombres de los candidatos no dominados en (precisión ↑, latencia por frame ↓, tamaño ↓)."""
+    front = []
+    for name, r in results.items():
+        dominated = any(
+            o['cv_accuracy'] >= r['cv_accuracy'] and o['frame_ms'] <= r['frame_ms'] and o['size_kb'] <= r['size_kb']
+            and (o['cv_accuracy'] > r['cv_accuracy'] or o['frame_ms'] < r['frame_ms'] or o['size_kb'] < r['size_kb'])
+            for other, o in results.items() if other != name)
+        if not dominated:
+            front.append(name)
+    return front
+
+
+def _cross_validate(name, model, X, y, cv):
+    scores = cross_val_score(model, X, y, cv=cv, scoring='accuracy', n_jobs=1)
+    return name, scores
+
+
+def select_model(X_train, y_train, X_test, y_test, n_jobs=-1, folds=5, max_accuracy_drop=0.01,
+                 random_state=42):
+    """Evalúa los candidatos y devuelve (nombre, modelo entrenado para servir, resultados por candidato)."""
+    X_train = np.asarray(X_train, dtype=float)
+    X_test = np.asarray(X_test, dtype=float)
+    y_train = np.asarray(y_train)
+    y_test = np.asarray(y_test)
+    candidates = candidate_models(random_state)
+    min_class = int(np.bincount(y_train).min())
+    cv = StratifiedKFold(n_splits=max(2, min(folds, min_class)), shuffle=True, random_state=random_state)
+
+    # Validación cruzada de todos los candidatos en paralelo (un trabajo por candidato)
+    print(f"\nValidación cruzada ({cv.n_splits} folds) de {len(candidates)} candidatos...")
+    cv_scores = dict(Parallel(n_jobs=n_jobs)(
+        delayed(_cross_validate)(name, clone(model), X_train, y_train, cv) for name, model in candidates.items()))
+
+    # Entrenar y medir latencia en secuencia para no medir con la CPU compartida
+    results = {}
+    fitted = {}
+    for name, model in candidates.items():
+        t0 = time.perf_counter()
+        model.fit(X_train, y_train)
+        fit_s = time.perf_counter() - t0
+        served = serving_model(model)
+        frame_ms, batch_ms, engine = measure_latency(served, X_test if len(X_test) else X_train)
+        fitted[name] = served
+        results[name] = {
+            'cv_accuracy': float(cv_scores[name].mean()),
+            'cv_std': float(cv_scores[name].std()),
+            'test_accuracy': float(np.mean(served.predict(X_test) == y_test)) if len(X_test) else None,
+            'frame_ms': frame_ms,
+            'batch_ms_per_row': batch_ms,
+            'size_kb': len(pickle.dumps(served)) / 1024,
+            'fit_s': fit_s,
+            'engine': engine,
+        }
+
+    front = pareto_front(results)
+    best_accuracy = max(results[name]['cv_accuracy'] for name in front)
+    eligible = [name for name in front if results[name]['cv_accuracy'] >= best_accuracy - max_accuracy_drop]
+    chosen = min(eligible, key=lambda name: (results[name]['frame_ms'], results[name]['size_kb']))
+    for name in results:
+        results[name]['pareto'] = name in front
+
+    print_report(results, chosen)
+    return chosen, fitted[chosen], results
+
+
+def print_report(results, chosen):
+    print(f"\n{'modelo':>18} | {'acc CV':>13} | {'acc test':>8} | {'ms/frame':>8} | {'ms/fila lote':>12} | "
+          f"{'KB':>8} | {'motor':>16} | pareto")
+    for name, r in sorted(results.items(), key=lambda item: -item[1]['cv_accuracy']):
+        test = f"{r['test_accuracy']:.3f}" if r['test_accuracy'] is not None else '-'
+        mark = ' <- elegido' if name == chosen else ''
+        print(f"{name:>18} | {r['cv_accuracy']:.3f} ± {r['cv_std']:.3f} | {test:>8} | {r['frame_ms']:8.3f} | "
+              f"{r['batch_ms_per_row']:12.4f} | {r['size_kb']:8.0f} | {r['engine']:>16} | "
+              f"{'sí' if r['pareto'] else 'no':>6}{mark}")
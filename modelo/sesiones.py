@@ -0,0 +1,145 @@
+"""
+Estado por sesión (paciente) para el servidor de evaluación.
+
+Cada cliente se identifica con un id de sesión (cabecera HTTP 'X-Session-Id' o el
+sid de Socket.IO) y obtiene su propia referencia, índice sincronizado, tolerancia
+y buffers de landmarks. Las sesiones inactivas se eliminan por TTL y el número
+total de sesiones está acotado (se descarta la usada hace más tiempo).
+"""
+
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from dtw import StreamingSubsequenceDTW
+from landmarks import sequence_array
+
+SESSION_TTL_SECONDS = float(os.environ.get('SESSION_TTL_SECONDS', 900))
+MAX_SESSIONS = int(os.environ.get('MAX_SESSIONS', 256))
+# Sesión usada por clientes que no envían id (compatibilidad con un solo paciente)
+DEFAULT_SESSION_ID = 'default'
+# Cada cuántos segundos como mucho se llama on_sweep desde get()
+SESSION_SWEEP_SECONDS = float(os.environ.get('SESSION_SWEEP_SECONDS', 10))
+
+
+class SessionState:
+    """Estado de evaluación de un paciente."""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.reference_landmarks = None  # Landmarks (33, 3) de la imagen de referencia (single)
+        self.reference_sequence = sequence_array([])  # Landmarks (N, 33, 3) del video de referencia
+        self.reference_fps = 1           # FPS de la secuencia de referencia (frames por segundo)
+        self.reference_index = 0         # Índice de frame de referencia sincronizado desde cliente
+        self.tolerance = 1.0             # Factor de tolerancia: >1 más permisivo, <1 más estricto
+        self.user_buffer = []            # Buffer corto usado por el endpoint HTTP evaluate_frame
+        self.stream_buffer = []          # Buffer corto de landmarks del stream de cámara
+        self.matcher = None              # DTW incremental contra la referencia (modo 'streaming')
+        self.llm_verdict = None          # Veredicto de Groq llegado en segundo plano (va en la siguiente respuesta)
+        self.lock = Lock()
+        self.last_seen = time.monotonic()
+
+    def set_reference(self, sequence, ref_fps=None):
+        """Guarda una secuencia de referencia (N, 33, 3) y reinicia la sincronización."""
+        sequence = sequence_array(sequence)
+        self.reference_sequence = sequence
+        self.reference_landmarks = sequence[0] if len(sequence) else None
+        self.reference_index = 0
+        self.matcher = None
+        if ref_fps is not None:
+            self.reference_fps = ref_fps
+
+    def streaming_matcher(self):
+        """DTW incremental de la referencia actual (se crea al primer uso)."""
+        with self.lock:
+            if self.matcher is None and len(self.reference_sequence):
+                self.matcher = StreamingSubsequenceDTW(self.reference_sequence)
+            return self.matcher
+
+    def push_landmarks(self, buffer, landmarks, max_len=3):
+        """Agrega landmarks a un buffer corto (user_buffer o stream_buffer) y devuelve una copia."""
+        with self.lock:
+            buffer.append(landmarks)
+            if len(buffer) > max_len:
+                buffer.pop(0)
+            return list(buffer)
+
+
+class SessionStore:
+    """Almacén de sesiones con expiración por inactividad y tamaño máximo (LRU).
+
+    on_evict(state) se llama por cada sesión eliminada y on_sweep() como mucho cada
+    sweep_interval segundos (recursos con su propio TTL); ambos fuera del lock, así
+    liberar recursos lentos no frena a los demás hilos que piden su sesión."""
+
+    def __init__(self, ttl_seconds=SESSION_TTL_SECONDS, max_sessions=MAX_SESSIONS, on_evict=None, on_sweep=None,
+                 sweep_interval=SESSION_SWEEP_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.on_evict = on_evict
+        self.on_sweep = on_sweep
+        self.sweep_interval = sweep_interval
+        self._sessions = OrderedDict()
+        self._lock = Lock()
+        self._last_sweep = time.monotonic()
+        self.evicted = 0
+
+    def _evict(self, session_id):
+        """Saca la sesión (con el lock tomado); on_evict se llama después con _release()."""
+        self.evicted += 1
+        return self._sessions.pop(session_id)
+
+    def _release(self, evicted, sweep=False):
+        for state in evicted:
+            if self.on_evict:
+                try:
+                    self.on_evict(state)
+                except Exception as e:
+                    print(f"WARN: Error al liberar la sesión {state.session_id}: {e}")
+        if sweep and self.on_sweep:
+            try:
+                self.on_sweep()
+            except Exception as e:
+                print(f"WARN: Error en el barrido de sesiones: {e}")
+
+    def _evict_expired(self, now):
+        # El OrderedDict está ordenado por último acceso: las expiradas quedan al inicio
+        evicted = []
+        while self._sessions:
+            session_id, state = next(iter(self._sessions.items()))
+            if now - state.last_seen <= self.ttl_seconds:
+                break
+            evicted.append(self._evict(session_id))
+        return evicted
+
+    def get(self, session_id=None):
+        """Devuelve la sesión (creándola si no existe) y la marca como usada."""
+        session_id = session_id or DEFAULT_SESSION_ID
+        now = time.monotonic()
+        with self._lock:
+            evicted = self._evict_expired(now)
+            state = self._sessions.get(session_id)
+            if state is None:
+                state = SessionState(session_id)
+                self._sessions[session_id] = state
+                while len(self._sessions) > self.max_sessions:
+                    evicted.append(self._evict(next(iter(self._sessions))))
+            else:
+                self._sessions.move_to_end(session_id)
+            state.last_seen = now
+            sweep = now - self._last_sweep >= self.sweep_interval
+            if sweep:
+                self._last_sweep = now
+        if evicted or sweep:
+            self._release(evicted, sweep)
+        return state
+
+    def drop(self, session_id):
+        """Elimina una sesión (p. ej. al desconectarse el socket)."""
+        with self._lock:
+            evicted = [self._evict(session_id)] if session_id in self._sessions else []
+        self._release(evicted)
+
+    def __len__(self):
+        return len(self._sessions)
@@ -0,0 +1,86 @@
+"""
+Veredicto local (Bien/Mal + explicación) destilado de las respuestas de Groq.
+
+Groq solo traduce un diccionario chico de métricas (avg_distance, max_distance,
+distance_quality, visible_lower_body, pose_size) a Bien/Mal. Con
+GROQ_LOG_PATH el servidor registra cada consulta (métricas y respuesta) y
+entrenar_veredicto.py ajusta un árbol de decisión pequeño sobre ese registro y
+lo exporta como tabla de reglas JSON (veredicto_local.json). Aquí se recorre esa
+tabla en Python puro: microsegundos por frame y sin sklearn en el servidor.
+
+VERDICT_ENGINE elige quién decide en evaluate_frame:
+- 'groq' (por defecto): Groq en segundo plano (evaluador_groq.py).
+- 'local': este modelo; Groq solo audita una fracción GROQ_AUDIT_RATE de frames.
+- 'heuristico': solo el veredicto de evaluate_posture.
+"""
+
+import json
+import os
+
+VERDICT_ENGINE = os.environ.get('VERDICT_ENGINE', 'groq')
+VERDICT_MODEL_PATH = os.environ.get('VERDICT_MODEL_PATH', 'veredicto_local.json')
+
+FEATURES = ['avg_distance', 'max_distance', 'pose_size', 'visible_lower_body', 'has_reference',
+            'quality_near', 'quality_optimal', 'quality_far']
+
+
+def verdict_features(metrics):
+    """Vector de características (lista de floats, en el orden de FEATURES) de las métricas de Groq."""
+    avg = metrics.get('avg_distance')
+    max_distance = metrics.get('max_distance')
+    pose_size = metrics.get('pose_size')
+    quality = metrics.get('distance_quality')
+    return [
+        float(avg) if avg is not None else -1.0,
+        float(max_distance) if max_distance is not None else -1.0,
+        float(pose_size) if pose_size is not None else -1.0,
+        1.0 if metrics.get('visible_lower_body') else 0.0,
+        1.0 if avg is not None else 0.0,
+        1.0 if quality == 'near' else 0.0,
+        1.0 if quality == 'optimal' else 0.0,
+        1.0 if quality == 'far' else 0.0,
+    ]
+
+
+class LocalVerdictModel:
+    """Árbol de decisión exportado como lista de nodos.
+
+    Nodo interno: {'feature': i, 'threshold': t, 'left': j, 'right': k} (x[i] <= t va a la izquierda).
+    Hoja: {'feedback': 'Bien'|'Mal', 'reason': str, 'confidence': float, 'samples': n}.
+    """
+
+    def __init__(self, nodes, meta=None):
+        self.nodes = nodes
+        self.meta = meta or {}
+
+    @classmethod
+    def load(cls, path=VERDICT_MODEL_PATH):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('features') != FEATURES:
+            raise ValueError(f'{path}: características distintas a las del servidor, reentrena el modelo')
+        return cls(data['nodes'], data.get('meta'))
+
+    def predict(self, metrics, default_reason=None):
+        """(feedback, reason, confianza) para las métricas."""
+        x = verdict_features(metrics)
+        node = self.nodes[0]
+        while 'feedback' not in node:
+            node = self.nodes[node['left'] if x[node['feature']] <= node['threshold'] else node['right']]
+        return node['feedback'], node.get('reason') or default_reason, node.get('confidence')
+
+
+def load_verdict_model(path=VERDICT_MODEL_PATH):
+    """Modelo local si existe el archivo, o None (con aviso si el motor configurado es 'local')."""
+    try:
+        model = LocalVerdictModel.load(path)
+    except FileNotFoundError:
+        if VERDICT_ENGINE == 'local':
+            print(f"WARN: VERDICT_ENGINE=local pero no existe {path}; se usa el veredicto heurístico. "
+                  "Genera el archivo con entrenar_veredicto.py")
+        return None
+    except Exception as e:
+        print(f"WARN: No se pudo cargar el veredicto local {path}: {e}")
+        return None
+    print(f"[BOOT] ✓ Veredicto local: {len(model.nodes)} nodos ({path})")
+    return model